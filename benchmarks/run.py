@@ -0,0 +1,262 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Benchmarks for the stages of the generator over the hotel files that ship in
+misc/hotel_xml_files.
+
+Every case runs in a fresh interpreter so that its peak RSS is its own. Each
+stage is timed separately and repeated, and the best time is kept:
+
+    scan      HotelHTMLGenerator.scan() over a rates.input.xml tree
+    xml_load  streaming the XML into RateIndex objects, without the rate cache
+    parse     HotelHTMLGenerator.parse(), indexing the rates and counting the
+              days of the window each hotel has rates on
+    sweep     the day/rate matching alone: every hotel's sweep over the window
+    summary   the monthly low/high/mean summary of every hotel
+    render    rendering every page of every hotel into memory
+
+The window is 2018, plus every year a case adds ranges for, so multi_year
+sweeps, summarizes and renders all of its years.
+
+Usage:
+    python benchmarks/run.py [--output results.json] [--repeat 3] [--case NAME ...]
+                             [--compare previous.json] [--threshold 1.25]
+
+With --compare, stages that got slower than --threshold times their previous
+time are listed and the script exits with status 1.
+"""
+
+import argparse
+import contextlib
+import copy
+import datetime
+import glob
+import json
+import os
+import os.path
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import xml.etree.ElementTree as ElementTree
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+import htmlgenerator
+import ratefeed
+import ratesummary
+from instrumentation import peak_rss_kb
+from rateindex import Window
+
+HOTEL_FILES = os.path.join(ROOT, 'misc', 'hotel_xml_files')
+YEAR = 2018
+
+# Case name -> (description, source files, rooms multiplier, extra years of ranges
+# after YEAR, which are added to the window too)
+CASES = {
+    'AAAAAA': ("single small hotel", ['AAAAAA.xml'], 1, 0),
+    'HNLADR': ("single large hotel", ['HNLADR.xml'], 1, 0),
+    'full_set': ("every hotel in misc/hotel_xml_files", ['hotel_*.xml'], 1, 0),
+    'rooms_x10': ("HNLADR with ten times the rooms", ['HNLADR.xml'], 10, 0),
+    'multi_year': ("the full set with its ranges repeated over 3 more years", ['hotel_*.xml'], 1, 3),
+}
+
+
+def scale_hotel(source, destination, rooms_multiplier, extra_years):
+    """ Write a synthetic copy of a hotel file with every room repeated
+    rooms_multiplier times and every <date> range repeated extra_years times,
+    each copy shifted by one more year. """
+    tree = ElementTree.parse(source)
+    hotel = tree.getroot()
+
+    for rate in hotel.iter('rate'):
+        dates = rate.findall('date')
+        for shift in range(1, extra_years + 1):
+            for date in dates:
+                shifted = copy.deepcopy(date)
+                for attribute in ('start', 'end'):
+                    day = datetime.datetime.strptime(date.get(attribute), '%Y-%m-%d').date()
+                    shifted.set(attribute, (day + datetime.timedelta(days=365 * shift)).isoformat())
+                rate.append(shifted)
+
+    rooms = hotel.findall('room')
+    for copy_number in range(1, rooms_multiplier):
+        for room in rooms:
+            duplicate = copy.deepcopy(room)
+            duplicate.set('name', "{0}_{1}".format(room.get('name'), copy_number))
+            hotel.append(duplicate)
+
+    tree.write(destination)
+
+
+def build_search_tree(case, directory):
+    """ Lay the files of a case out as <directory>/<name>/rates.input.xml. """
+    _, patterns, rooms_multiplier, extra_years = CASES[case]
+    sources = []
+    for pattern in patterns:
+        sources.extend(sorted(glob.glob(os.path.join(HOTEL_FILES, pattern))))
+
+    for source in sources:
+        hotel_directory = os.path.join(directory, os.path.splitext(os.path.basename(source))[0])
+        os.makedirs(hotel_directory)
+        destination = os.path.join(hotel_directory, 'rates.input.xml')
+        if rooms_multiplier == 1 and extra_years == 0:
+            shutil.copy(source, destination)
+        else:
+            scale_hotel(source, destination, rooms_multiplier, extra_years)
+    return len(sources)
+
+
+def best_of(repeat, function):
+    """ Run function repeat times and return (best seconds, all seconds, last result). """
+    runs = []
+    result = None
+    for _ in range(repeat):
+        started = time.time()
+        result = function()
+        runs.append(time.time() - started)
+    return min(runs), runs, result
+
+
+def run_case(case, repeat):
+    """ Time every stage of one case in this process. """
+    work_directory = tempfile.mkdtemp(prefix='hotelhtmlgenerator-bench-')
+    search_directory = os.path.join(work_directory, 'search')
+    output_directory = os.path.join(work_directory, 'output')
+    try:
+        files = build_search_tree(case, search_directory)
+        stages = dict()
+        window = Window(datetime.date(YEAR, 1, 1), datetime.date(YEAR + CASES[case][3], 12, 31))
+        options = htmlgenerator.build_parser().parse_args(
+            ['--from', window.start.isoformat(), '--to', window.end.isoformat()])
+
+        def generator():
+            return htmlgenerator.HotelHTMLGenerator(
+                search_directory, output_directory, use_cache=False, options=options)
+
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            def scan():
+                return generator().scan()
+            stages['scan'], runs_scan, scanned = best_of(repeat, scan)
+            paths = scanned.paths
+
+            def xml_load():
+                return [rate_index for path in paths for rate_index in ratefeed.iter_hotels(path)]
+            stages['xml_load'], runs_load, rate_indexes = best_of(repeat, xml_load)
+
+            def parse():
+                parsing = generator()
+                parsing.paths = list(paths)
+                return parsing.parse()
+            stages['parse'], runs_parse, _ = best_of(repeat, parse)
+
+            start, end = window
+
+            def sweep():
+                for rate_index in rate_indexes:
+                    for _ in rate_index.sweep(start, end):
+                        pass
+            stages['sweep'], runs_sweep, _ = best_of(repeat, sweep)
+
+            def summary():
+                return ratesummary.summarize_hotels(rate_indexes, start, end)
+            stages['summary'], runs_summary, _ = best_of(repeat, summary)
+
+            environment = htmlgenerator.HotelHTMLGenerator.template_environment()
+
+            def render():
+                return sum(len(''.join(chunks))
+                           for rate_index in rate_indexes
+                           for _, chunks in htmlgenerator.HotelHTMLGenerator.render_hotel(
+                               rate_index, window, environment))
+            stages['render'], runs_render, rendered_characters = best_of(repeat, render)
+
+        all_runs = dict(scan=runs_scan, xml_load=runs_load, parse=runs_parse,
+                        sweep=runs_sweep, summary=runs_summary, render=runs_render)
+        return {
+            'description': CASES[case][0],
+            'window': str(window),
+            'files': files,
+            'hotels': len(rate_indexes),
+            'ranges': sum(len(rate_index) for rate_index in rate_indexes),
+            'rendered_characters': rendered_characters,
+            'stages': dict((stage, {'seconds': seconds, 'runs': all_runs[stage]})
+                           for stage, seconds in stages.items()),
+            'peak_rss_kb': peak_rss_kb(),
+        }
+    finally:
+        shutil.rmtree(work_directory, ignore_errors=True)
+
+
+def compare(results, previous, threshold):
+    """ List the stages slower than threshold times their previous time. """
+    regressions = []
+    for case, result in results['cases'].items():
+        before = previous.get('cases', dict()).get(case)
+        if not before:
+            continue
+        for stage, timing in result['stages'].items():
+            old = before['stages'].get(stage, dict()).get('seconds')
+            if old and timing['seconds'] > old * threshold:
+                regressions.append("{0}/{1}: {2:.4f}s -> {3:.4f}s".format(
+                    case, stage, old, timing['seconds']))
+    return regressions
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Benchmark the hotel HTML generator.")
+    parser.add_argument('--output', help="write the JSON results to this file instead of stdout")
+    parser.add_argument('--repeat', type=int, default=3, help="runs per stage, the best is kept")
+    parser.add_argument('--case', action='append', choices=sorted(CASES),
+                        help="only run this case, may be repeated (default: all)")
+    parser.add_argument('--compare', help="previous results to check for regressions")
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help="slowdown factor counted as a regression (default 1.25)")
+    parser.add_argument('--in-process', action='store_true',
+                        help=argparse.SUPPRESS)
+    arguments = parser.parse_args(argv)
+
+    cases = arguments.case or sorted(CASES)
+
+    if arguments.in_process:
+        # Child mode: run the single requested case and print its results
+        print(json.dumps(run_case(cases[0], arguments.repeat)))
+        return 0
+
+    results = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'year': YEAR,
+        'repeat': arguments.repeat,
+        'cases': dict(),
+    }
+    for case in cases:
+        print("Running {0}...".format(case), file=sys.stderr)
+        output = subprocess.check_output([
+            sys.executable, os.path.abspath(__file__), '--in-process',
+            '--case', case, '--repeat', str(arguments.repeat)])
+        results['cases'][case] = json.loads(output.decode('utf-8').strip().splitlines()[-1])
+
+    report = json.dumps(results, indent=2, sort_keys=True)
+    if arguments.output:
+        with open(arguments.output, 'w') as handle:
+            handle.write(report)
+    else:
+        print(report)
+
+    if arguments.compare:
+        with open(arguments.compare) as handle:
+            regressions = compare(results, json.load(handle), arguments.threshold)
+        for regression in regressions:
+            print("Regression: {0}".format(regression), file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,131 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Startup benchmark of the generator's command line.
+
+Every case runs htmlgenerator.py in a fresh interpreter, the way cron jobs
+and per-request invocations do, and the best wall-clock time is kept:
+
+    python    an interpreter doing nothing, for reference
+    import    importing the htmlgenerator module
+    help      htmlgenerator.py --help
+    version   htmlgenerator.py --version
+    noop      an incremental run over a copy of the full set of hotel files
+              in misc/hotel_xml_files in which nothing has changed
+
+Usage:
+    python benchmarks/startup.py [--output results.json] [--repeat 10]
+                                 [--compare previous.json] [--threshold 1.25]
+
+With --compare, cases that got slower than --threshold times their previous
+time are listed and the script exits with status 1.
+"""
+
+import argparse
+import glob
+import json
+import os
+import os.path
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+SCRIPT = os.path.join(ROOT, 'htmlgenerator.py')
+HOTEL_FILES = os.path.join(ROOT, 'misc', 'hotel_xml_files')
+
+# Case name -> (description, arguments of the interpreter)
+CASES = {
+    'python': ("an interpreter doing nothing", ['-c', 'pass']),
+    'import': ("import htmlgenerator", ['-c', 'import htmlgenerator']),
+    'help': ("htmlgenerator.py --help", [SCRIPT, '--help']),
+    'version': ("htmlgenerator.py --version", [SCRIPT, '--version']),
+    'noop': ("incremental run with nothing to rebuild",
+             [SCRIPT, '{search}', '{output}', '--pattern', '*.xml', '--quiet']),
+}
+
+
+def best_of(repeat, command):
+    """ Run command repeat times and return (best seconds, all seconds). """
+    runs = []
+    with open(os.devnull, 'w') as devnull:
+        for _ in range(repeat):
+            started = time.time()
+            subprocess.check_call(command, cwd=ROOT, stdout=devnull)
+            runs.append(time.time() - started)
+    return min(runs), runs
+
+
+def compare(results, previous, threshold):
+    """ List the cases slower than threshold times their previous time. """
+    regressions = []
+    for case, result in results['cases'].items():
+        old = previous.get('cases', dict()).get(case, dict()).get('seconds')
+        if old and result['seconds'] > old * threshold:
+            regressions.append("{0}: {1:.4f}s -> {2:.4f}s".format(case, old, result['seconds']))
+    return regressions
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Benchmark the startup of the hotel HTML generator.")
+    parser.add_argument('--output', help="write the JSON results to this file instead of stdout")
+    parser.add_argument('--repeat', type=int, default=10, help="runs per case, the best is kept")
+    parser.add_argument('--compare', help="previous results to check for regressions")
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help="slowdown factor counted as a regression (default 1.25)")
+    arguments = parser.parse_args(argv)
+
+    work_directory = tempfile.mkdtemp(prefix='hotelhtmlgenerator-startup-')
+    directories = {
+        'search': os.path.join(work_directory, 'search'),
+        'output': os.path.join(work_directory, 'output'),
+    }
+    try:
+        # The hotel files are copied so that their rate caches are written next
+        # to the copies rather than into the source tree
+        os.makedirs(directories['search'])
+        for source in glob.glob(os.path.join(HOTEL_FILES, '*.xml')):
+            shutil.copy(source, directories['search'])
+
+        # The first build, which the noop case then finds up to date
+        subprocess.check_call([sys.executable] + [
+            argument.format(**directories) for argument in CASES['noop'][1]], cwd=ROOT)
+
+        results = {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'repeat': arguments.repeat,
+            'cases': dict(),
+        }
+        for case, (description, case_arguments) in sorted(CASES.items()):
+            print("Running {0}...".format(case), file=sys.stderr)
+            command = [sys.executable] + [
+                argument.format(**directories) for argument in case_arguments]
+            seconds, runs = best_of(arguments.repeat, command)
+            results['cases'][case] = {'description': description, 'seconds': seconds, 'runs': runs}
+    finally:
+        shutil.rmtree(work_directory, ignore_errors=True)
+
+    report = json.dumps(results, indent=2, sort_keys=True)
+    if arguments.output:
+        with open(arguments.output, 'w') as handle:
+            handle.write(report)
+    else:
+        print(report)
+
+    if arguments.compare:
+        with open(arguments.compare) as handle:
+            regressions = compare(results, json.load(handle), arguments.threshold)
+        for regression in regressions:
+            print("Regression: {0}".format(regression), file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,146 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Build manifest kept in the output directory so that re-runs only regenerate
+hotels whose input XML, templates or dates changed since the last run.
+
+For each input file the manifest records its size, modification time and
+SHA-1 content hash, the hotel codes found in it and the output files written
+for them. A file whose size and mtime still match is trusted without being
+hashed again; one that was merely touched is re-hashed and still counts as
+unchanged if its content is the same.
+"""
+
+import hashlib
+import io
+import json
+import os
+import os.path
+
+MANIFEST_FILENAME = '.build_manifest.json'
+
+# Bump when the manifest layout changes so older manifests are ignored
+MANIFEST_VERSION = 2
+
+
+def file_hash(path, chunk_size=1 << 20):
+    """ SHA-1 hex digest of a file's content, read in chunks. """
+    digest = hashlib.sha1()
+    with open(path, 'rb') as handle:
+        for chunk in iter(lambda: handle.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def template_versions(template_directory):
+    """ Content hash of every template and static file included by them, keyed
+    by their path relative to the template directory. """
+    versions = dict()
+    for directory, subdirectories, names in os.walk(template_directory):
+        subdirectories.sort()
+        for name in sorted(names):
+            path = os.path.join(directory, name)
+            versions[os.path.relpath(path, template_directory).replace(os.sep, '/')] = file_hash(path)
+    return versions
+
+
+class BuildManifest(object):
+    """ The inputs, settings and outputs of the previous run of the generator. """
+
+    def __init__(self, output_directory, window, template_directory, options=None):
+        """ window is the Window or year rendered, recorded as its str(). """
+        self.path = os.path.join(output_directory, MANIFEST_FILENAME)
+        self.window = str(window)
+        self.templates = template_versions(template_directory)
+
+        # Settings which change the output, such as --self-contained
+        self.options = dict(options or ())
+
+        # Input path -> {'size', 'mtime', 'hash', 'hotels', 'outputs'}
+        self.inputs = dict()
+
+        # Entries from the previous run, only usable if the settings still match
+        self.previous = dict()
+        self.load()
+
+    def load(self):
+        """ Read the previous manifest, if there is a compatible one. """
+        try:
+            with io.open(self.path, 'r', encoding='utf-8') as handle:
+                manifest = json.load(handle)
+        except (IOError, OSError, ValueError):
+            return self
+
+        if (manifest.get('version') == MANIFEST_VERSION
+                and manifest.get('window') == self.window
+                and manifest.get('templates') == self.templates
+                and manifest.get('options', dict()) == self.options):
+            self.previous = manifest.get('inputs', dict())
+        return self
+
+    def hotels(self, path):
+        """ The hotel codes the previous run found in an input, or None if it
+        did not build it. """
+        previous = self.previous.get(path)
+        return None if previous is None else previous.get('hotels')
+
+    def state(self, path):
+        """ Size, mtime and hash of an input file, re-using the previous hash
+        when size and mtime have not changed. """
+        stat = os.stat(path)
+        previous = self.previous.get(path)
+        if previous and previous['size'] == stat.st_size and previous['mtime'] == stat.st_mtime:
+            content_hash = previous['hash']
+        else:
+            content_hash = file_hash(path)
+        return {'size': stat.st_size, 'mtime': stat.st_mtime, 'hash': content_hash}
+
+    def is_fresh(self, path):
+        """ True if an input is unchanged since the previous run and every output
+        written for it is still there. Fresh inputs are carried over as they are. """
+        previous = self.previous.get(path)
+        if not previous:
+            return False
+
+        state = self.state(path)
+        if state['hash'] != previous['hash']:
+            return False
+        if not all(os.path.isfile(output) for output in previous['outputs']):
+            return False
+
+        entry = dict(previous)
+        entry.update(state)
+        self.inputs[path] = entry
+        return True
+
+    def record(self, path, hotels, outputs):
+        """ Remember that an input was (re)built into the given outputs. """
+        entry = self.state(path)
+        entry['hotels'] = list(hotels)
+        entry['outputs'] = list(outputs)
+        self.inputs[path] = entry
+        return self
+
+    def forget(self, path):
+        """ Drop an input that no longer exists. """
+        self.inputs.pop(path, None)
+        return self
+
+    def save(self):
+        """ Write the manifest next to the outputs, replacing the old one atomically. """
+        directory = os.path.dirname(self.path)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        temporary_path = self.path + '.tmp'
+        with io.open(temporary_path, 'w', encoding='utf-8') as handle:
+            handle.write(json.dumps({
+                'version': MANIFEST_VERSION,
+                'window': self.window,
+                'templates': self.templates,
+                'options': self.options,
+                'inputs': self.inputs,
+            }, indent=2, sort_keys=True))
+        os.replace(temporary_path, self.path)
+        return self
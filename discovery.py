@@ -0,0 +1,119 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Fast discovery of hotel rate XML files.
+
+The tree is walked with os.scandir, whose DirEntry objects carry the file
+type from the directory listing itself, so telling files, directories and
+symlinks apart costs no extra stat calls on most platforms. Every top-level
+subdirectory is walked on its own thread, which hides the latency of slow
+(e.g. NFS mounted) directories, and matches are yielded as soon as they are
+found so that parsing can start before the walk is over.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import fnmatch
+import os
+import os.path
+import queue
+import threading
+
+DEFAULT_PATTERNS = ('rates.input.xml',)
+
+
+def matches(name, patterns):
+    """ Case insensitive match of a file name against glob patterns. """
+    name = name.lower()
+    return any(fnmatch.fnmatchcase(name, pattern.lower()) for pattern in patterns)
+
+
+def walk(directory, patterns=DEFAULT_PATTERNS):
+    """
+    Generator over the DirEntry of every file below directory whose name
+    matches one of the patterns. Symlinked directories are not followed, as
+    with os.walk; symlinked files are yielded and left to the caller. Unreadable
+    directories are skipped.
+    """
+    pending = [directory]
+    while pending:
+        current = pending.pop()
+        try:
+            entries = list(os.scandir(current))
+        except OSError:
+            continue
+        # Depth first, in name order, so results come out in a stable order
+        entries.sort(key=lambda entry: entry.name)
+        subdirectories = []
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirectories.append(entry.path)
+                elif matches(entry.name, patterns):
+                    yield entry
+            except OSError:
+                continue
+        pending.extend(reversed(subdirectories))
+
+
+def discover(directory, patterns=DEFAULT_PATTERNS, threads=8):
+    """
+    Generator over the DirEntry of every matching file below directory, walking
+    each top-level subdirectory on one of a pool of threads. Entries are yielded
+    as soon as any thread finds them; matches directly inside directory come
+    first. Closing the generator early stops the walk.
+    """
+    top_level = sorted(os.scandir(directory), key=lambda entry: entry.name)
+    subtrees = []
+    for entry in top_level:
+        if entry.is_dir(follow_symlinks=False):
+            subtrees.append(entry.path)
+        elif matches(entry.name, patterns):
+            yield entry
+
+    if not subtrees:
+        return
+
+    found = queue.Queue(maxsize=1024)
+    stopped = threading.Event()
+    finished = object()
+
+    def put(item):
+        """ Queue item, unless the consumer stops first. @returns whether it did """
+        while not stopped.is_set():
+            try:
+                found.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def walk_subtree(subtree):
+        try:
+            for entry in walk(subtree, patterns):
+                if not put(entry):
+                    return
+        finally:
+            put(finished)
+
+    executor = ThreadPoolExecutor(max_workers=max(1, threads))
+    futures = []
+    try:
+        futures.extend(executor.submit(walk_subtree, subtree) for subtree in subtrees)
+        remaining = len(subtrees)
+        while remaining:
+            entry = found.get()
+            if entry is finished:
+                remaining -= 1
+            else:
+                yield entry
+        for future in futures:
+            # Re-raise anything unexpected that went wrong on a walker thread
+            future.result()
+    finally:
+        # Subtrees not started yet are dropped, and walkers still running stop
+        # at their next match instead of blocking on a queue nobody reads
+        stopped.set()
+        for future in futures:
+            future.cancel()
+        executor.shutdown(wait=False)
@@ -9,27 +9,43 @@
 # This has to come first because that's the rule
 from __future__ import print_function  # Python 2/3 compatibility
 
-# Standard library imports
-from collections import OrderedDict, namedtuple
+__version__ = '1.1.0'
+
+# Standard library imports. Modules only some stages need, such as Jinja2 for
+# rendering, http.server for --serve or sqlite3 for rate stores, are imported
+# by those stages, so --help, --version and runs with nothing to rebuild
+# start quickly.
+import argparse
+from collections import OrderedDict
 import os
 import os.path
 import sys
-import textwrap
+import threading
+import time
 import datetime
-from inspect import currentframe
-import itertools
 import calendar
-import json
 
-# Third-party modules
-import untangle
+# Local modules
 import termcolor
-import dateutil.parser
-import pprint
-import jinja2
+from rateindex import RateIndex, Window
+import ratecache
+import ratesummary
+import ratejson
+import outputformat
+import readahead
+from buildmanifest import BuildManifest, file_hash
+from instrumentation import Metrics
+import instrumentation
+import discovery
 
 _print = print
 
+# Templates live next to this script, so workers find them whatever their cwd
+TEMPLATE_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')
+
+# What follows the first dot in the name of a rate shard or one of its precompressed siblings
+STALE_SHARD_SUFFIXES = ('json',) + tuple('json' + suffix for suffix in outputformat.SIBLING_SUFFIXES)
+
 class HotelHTMLGenerator(object):
     """
     Singleton class to traverse a directory searching for a rates.input.xml file
@@ -38,32 +54,43 @@ class HotelHTMLGenerator(object):
     the hotel rates across month intervals.
     """
 
+    # Files written to <output directory>/<hotel code>/ for every hotel
+    OUTPUT_FILES = ['rate_calendar.html', 'rates_yearly_summary.html']
+
+    # Jinja2 environment shared by every render in this process, see template_environment()
+    _environment = None
+
+    # Year -> the HTML tables of its 12 months, shared by every hotel, see month_grids()
+    _month_grids = dict()
+
     def __init__(self, search_directory="./test/search", output_directory="./test/output",
-                 debug=False, year=2018):
-        """ Constructor for the whole object. This is a singleton so there should only ever be one instance. """
+                 debug=False, year=2018, jobs=1, force=False, use_cache=True, write_threads=4,
+                 scan_threads=8, options=None):
+        """ Constructor for the whole object. This is a singleton so there should only ever be one instance.
+        options are the parsed command line, see build_parser(); without them every option
+        has its default value. """
 
-        # First check if we are just displaying help text
-        if ("-h" in sys.argv) or ("--help" in sys.argv):
-            self.help()
+        # Command line options
+        if options is None:
+            options = build_parser().parse_args([])
 
         # Debug mode attribute
         self.debug = debug
 
-        self.rate_calendar_template = None
-        self.days_in_year = None
+        # Nothing but errors is reported with --quiet, see report()
+        self.quiet = options.quiet
 
         if self.debug:
 
             global print
             def print(*args, **kwargs):
+                from inspect import currentframe
 
-                currentline = currentframe().f_back.f_lineno 
+                currentline = currentframe().f_back.f_lineno
 
                 _print("{0}".format(currentline), *args, **kwargs)
 
 
-
-
         # Define constants
         self.string_constants = {
             "NEWLINE": "\n",
@@ -80,20 +107,14 @@ class HotelHTMLGenerator(object):
         }
 
         # Fire things up.
-        termcolor.cprint(
-            self.string_constants["TITLE_ASCII"], color='cyan', on_color='on_grey')
-        print("Reticulating splines...")
+        if not (options.quiet or options.no_banner):
+            termcolor.cprint(
+                self.string_constants["TITLE_ASCII"], color='cyan', on_color='on_grey')
+        self.report("Reticulating splines...")
 
-        # Load dependencies
+        # Check for dependencies
         self.do_imports()
 
-
-
-        if len(sys.argv) is 1 and not self.debug:
-            print("Script was called with no arguments. If you need info, \
-            invoke the script with -h or --help")
-            raise SystemExit
-
         if self.debug:
             print("Debug mode ON.")
 
@@ -115,17 +136,73 @@ class HotelHTMLGenerator(object):
 
         self.SEARCH_FILENAME = 'rates.input.xml'  # Constant for our search file
 
-        # Set the year to 2018 AD unless otherwise
-        # specified in the arguments
-        if "--year" in sys.argv:
-            self.year = sys.argv[sys.argv.index("--year") + 1]
+        # File name patterns to search for, e.g. *.xml for the hotel_N.xml layout
+        self.search_patterns = options.patterns or [self.SEARCH_FILENAME]
+
+        # Number of threads walking top-level subdirectories of the search directory
+        self.scan_threads = scan_threads
+
+        # Render the days from --from to --to, or else the year 2018 AD unless
+        # otherwise specified in the arguments. self.year is None for --from and --to
+        if options.year is not None and (options.from_date or options.to_date):
+            raise SystemExit("--year cannot be combined with --from or --to.")
+        if options.from_date or options.to_date:
+            if options.from_date and options.to_date and options.from_date > options.to_date:
+                raise SystemExit("--from {0} is after --to {1}.".format(options.from_date, options.to_date))
+            self.year = None
+            self.window = Window(options.from_date, options.to_date)
         else:
-            self.year = year
+            self.year = year if options.year is None else options.year
+            self.window = Window.year(self.year)
+
+        # Show the dates in use
+        self.report("Using dates {0}".format(self.window))
+
+        # Number of worker processes, one hotel file per task
+        self.jobs = jobs if options.jobs is None else options.jobs
 
-        # Show the year in use
-        print("Using year value of {0}".format(self.year))
+        # Number of threads writing output files while the next page is rendered
+        self.write_threads = write_threads
 
-        if "--relative" not in sys.argv:
+        # Keep running and rebuild the hotels of every input file that changes,
+        # polling every watch_interval seconds and waiting for changes to settle
+        # for watch_debounce seconds
+        self.watch_mode = options.watch
+        self.watch_interval = options.interval
+        self.watch_debounce = options.debounce
+
+        # Serve pages rendered on demand on this port of localhost, caching up to
+        # serve_cache_bytes of them, and logging every request unless quiet
+        self.serve_mode = options.serve
+        self.serve_port = options.port
+        self.serve_cache_bytes = 64 << 20
+
+        # Inline the stylesheet and minify the pages instead of linking Bootstrap
+        # and jQuery from CDNs, and write .gz (and .br) copies next to every file
+        self.self_contained = options.self_contained
+        self.precompress = options.precompress
+
+        # Rebuild every hotel even if its input and the templates are unchanged
+        self.force = force or options.force
+
+        # Keep a compact binary copy of the parsed rates next to each input
+        self.use_cache = use_cache and not options.no_cache
+
+        # Number of input files memory-mapped ahead of the one being parsed, 0 to
+        # read every file only when it is parsed
+        self.read_ahead = options.read_ahead
+
+        # The build manifest of the output directory, loaded by skip_unchanged()
+        self.manifest = None
+
+        # Timings and counters of every stage of the run
+        self.metrics = Metrics()
+
+        # Where to write the metrics report and the profiler's stats, if anywhere
+        self.metrics_path = options.metrics
+        self.profile_path = options.profile
+
+        if not options.relative:
             absolute_dirs = [
                 os.path.realpath(val) for val in self.getDirs().values()
             ]
@@ -136,34 +213,54 @@ class HotelHTMLGenerator(object):
         # An attribute to hold the paths to discovered search results
         self.paths = list()
 
-        # An attribute to hold the XML parser objects
-        self.parser_objects = list()
+        # An attribute to hold a RateIndex for each parsed hotel, keyed by hotel code
+        self.rate_indexes = OrderedDict()
+
+        # An attribute to hold the hotel codes read from each path
+        self.path_hotels = OrderedDict()
+
+        # An attribute to hold the RateIndex objects read from each path, kept in
+        # memory between rebuilds in watch mode
+        self.path_indexes = OrderedDict()
+
+        # Attributes to hold the content hash of each path, and for each hotel
+        # its RateIndex and the hashes of the paths it was read from, in watch and
+        # serve mode. reload() replaces the latter whole, as the server looks
+        # hotels up in it from other threads
+        self.input_hashes = dict()
+        self.versioned_hotels = dict()
 
         # An attribute to hold prettified raw XML strings for inspection/introspection
         self.xml_strings = list()
 
-        # An attribute to hold generated html in string form for writing to files
-        self.html_strings = list()
+        # An attribute to hold a (path, chunks) tuple for each page to write, where
+        # chunks is a generator that renders the page as it is written out
+        self.pages = list()
+
+        # An attribute to hold the paths of the output files written so far
+        self.output_files = list()
 
     @staticmethod
     def help():
         """ Print the help text. """
-        help_text = \
-            """Usage: python[2.x|3.x] {0} [search directory] [output directory] [--arguments (optional)]
-Pass --relative to disable conversion of relative paths to absolute paths. Pass
---year (4 digit year) to use a year other than 2018. Pass -h or --help to
-print this message.""".format(sys.argv[0])
-        print(help_text)
+        build_parser().print_help()
         raise SystemExit
 
     # noinspection PyPep8Naming
+    def report(self, *args):
+        """ Print a progress message, unless --quiet was given. Errors are raised
+        as SystemExit instead, so they are reported either way. """
+        if not self.quiet:
+            print(*args)
+
     def do_imports(self):
-        # Third-party libraries
-        try:
-            import dateutil.parser as date_parser
-        except ImportError as error:
-            MISSING_DEPENDENCY = "".join(
-                char for char in str(error).split(" ")[-1] if char.isalnum() or char in [",", " ", "."])
+        # Third-party libraries. They are only looked up here, and imported by the
+        # stages using them
+        import importlib.util
+        missing = [name for name in ["jinja2"] if importlib.util.find_spec(name) is None]
+        if missing:
+            import textwrap
+            MISSING_DEPENDENCY = ", ".join(missing)
             # Create some space by printing newlines
             print(self.string_constants["DOUBLE_NEWLINE"])
             # This is fancy
@@ -198,6 +295,7 @@ print this message.""".format(sys.argv[0])
         return self.dirs
 
     def printDirs(self):
+        import pprint
         return "self.dirs updated to {0}".format(pprint.pprint(self.getDirs()))
 
     def setDirs(self, new_dirs):
@@ -224,9 +322,10 @@ print this message.""".format(sys.argv[0])
                 "Attempted to set directories with a dictionary of \
             invalid keys. Required keys: 'search_directory', 'output_directory'.")
 
-    def scan(self):
-        """ Scan for input xml files and populate the paths attribute with
-        results. Return self to support method chaining. """
+    def discover(self):
+        """ Generator which scans recursively for input XML files (rates.input.xml
+        unless other patterns were given), yielding their paths as soon as they are
+        found and appending them to the paths attribute. """
 
         # Get the directory to start from
         search_directory = self.getDirs().get('search_directory')
@@ -234,53 +333,53 @@ print this message.""".format(sys.argv[0])
         # Make sure it actually exists
         if not os.path.exists(search_directory):
             raise SystemExit("Specified search directory does not exist.")
-        else:
-            def search(search_directory):
-                """ Generator which scans recursively for a rates.input.xml
-                file and yields their paths """
-                for root, _, files in os.walk(search_directory):
-
-                    # Make the search case insensitive by converting everything to lower case
-                    files = [current_file.lower() for current_file in files]
-
-                    # Look for our XML file in among the files in the current directory
-                    if self.SEARCH_FILENAME in files:
-                        # Join path and filename
-                        fullpath = os.path.join(root, self.SEARCH_FILENAME)
-
-                        # Detect symlinks
-                        try:
-                            assert not os.path.islink(fullpath)
-                        except AssertionError:
-                            print("Search result is a symlink (shortcut). \
-                            Will use real path instead.")
-                            continue
-                        fullpath = os.path.realpath(fullpath)
-
-                        # Verify we are actually pointing toward a file
-                        try:
-                            assert os.path.isfile(fullpath)
-                        except AssertionError:
-                            print("OS reports search result at {0} not an actual file. Trying to continue...".format(
-                                fullpath))
-                            continue
-
-                        # Try to convert a relative path to an absolute path
-                        fullpath = os.path.realpath(fullpath)
-
-                        # Report result
-                        print("Found XML file {0} at {1}".format(
-                            self.SEARCH_FILENAME, fullpath))
-
-                        yield fullpath
-
-        search_results = search(search_directory)
-
-        for result in search_results:
-            self.paths.append(result)
-
-        if len(self.paths) is 0:
-            raise SystemExit("No rates.input.xml files found in recursive search of {0}".format(
+        elif os.path.isfile(search_directory):
+            # A single XML file such as the unsplit rates.xml was given instead of a directory
+            self.report("Using XML file {0}".format(search_directory))
+            self.paths.append(os.path.realpath(search_directory))
+            yield self.paths[-1]
+            return
+
+        # Resolve the search directory once. Symlinked directories are not followed
+        # below it, so every path found there is already a real path.
+        search_directory = os.path.realpath(search_directory)
+
+        for entry in discovery.discover(search_directory, self.search_patterns, self.scan_threads):
+            # Detect symlinks, using the file type cached by the directory listing
+            if entry.is_symlink():
+                self.report("Search result {0} is a symlink (shortcut). Skipping it.".format(entry.path))
+                continue
+
+            # Report result
+            self.report("Found XML file {0} at {1}".format(entry.name, entry.path))
+
+            self.paths.append(entry.path)
+            yield entry.path
+
+    def list_inputs(self):
+        """ The input XML files currently in the search directory, found the way
+        discover() finds them but without reporting anything. """
+        search_directory = self.getDirs().get('search_directory')
+        if os.path.isfile(search_directory):
+            return [os.path.realpath(search_directory)]
+        if not os.path.isdir(search_directory):
+            return []
+        return [entry.path for entry in discovery.discover(
+                    os.path.realpath(search_directory), self.search_patterns, self.scan_threads)
+                if not entry.is_symlink()]
+
+    def scan(self):
+        """ Scan for input xml files and populate the paths attribute with
+        results. Return self to support method chaining. """
+
+        with self.metrics.stage('scan') as stage:
+            for _ in self.discover():
+                pass
+            stage['counts']['files'] = len(self.paths)
+
+        if len(self.paths) == 0:
+            raise SystemExit("No {0} files found in recursive search of {1}".format(
+                " or ".join(self.search_patterns),
                 self.getDirs().get('search_directory', 'requested directory.'))
             )
 
@@ -290,6 +389,112 @@ print this message.""".format(sys.argv[0])
 
         return self
 
+    def load_manifest(self):
+        """ Load the build manifest of the output directory.
+            @returns self to support method chaining
+        """
+        self.manifest = BuildManifest(
+            self.getDirs().get('output_directory'), self.window, TEMPLATE_DIRECTORY,
+            {'self_contained': self.self_contained, 'precompress': self.precompress})
+        return self
+
+    def is_stale(self, path):
+        """ True unless the content of path, the templates and the dates are all
+        unchanged since the last run, or always when forced. """
+        return self.force or not self.manifest.is_fresh(path)
+
+    @staticmethod
+    def input_hotels(path):
+        """ The hotel codes in an input file, found without parsing it: from the
+        <hotel> tags of an XML file, or the hotels table of a rate store. """
+        import ratestore
+        if ratestore.is_database(path):
+            with ratestore.RateStore(path, read_only=True) as store:
+                return store.hotel_codes()
+        if os.path.getsize(path) == 0:
+            return []
+        import mmap
+        import ratesplit
+        with open(path, 'rb') as handle:
+            buffer = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                return [code for _, code in ratesplit.hotel_offsets(buffer) if code is not None]
+            finally:
+                buffer.close()
+
+    def input_groups(self, paths, selected=None):
+        """
+        @input the input paths found by scan(), and those of them to build, by
+            default all of them
+        @returns the selected paths, plus every other one holding a hotel one of
+            them holds, as a list of groups of paths in path order. All the files
+            of a hotel split over several are in the same group, so that it is
+            built from every one of them
+        """
+        selected = list(paths if selected is None else selected)
+        selected_set = set(selected)
+
+        # Path -> its hotel codes, as of the previous run for unselected files
+        hotels = dict()
+        by_code = dict()
+        for path in paths:
+            codes = None
+            if path not in selected_set and self.manifest is not None:
+                codes = self.manifest.hotels(path)
+            hotels[path] = codes if codes is not None else self.input_hotels(path)
+            for code in hotels[path]:
+                by_code.setdefault(code, []).append(path)
+
+        order = dict((path, position) for position, path in enumerate(paths))
+        groups = []
+        grouped = set()
+        for path in selected:
+            if path in grouped:
+                continue
+            group = []
+            pending = [path]
+            grouped.add(path)
+            while pending:
+                current = pending.pop()
+                group.append(current)
+                for code in hotels[current]:
+                    for other in by_code[code]:
+                        if other not in grouped:
+                            grouped.add(other)
+                            pending.append(other)
+            groups.append(sorted(group, key=order.get))
+        return groups
+
+    def skip_unchanged(self):
+        """ Drop the paths found by scan() that are not stale according to the
+        build manifest in the output directory, unless they hold a hotel that a
+        stale one holds too.
+            @returns self to support method chaining
+        """
+        self.load_manifest()
+
+        stale_paths = [path for group in self.input_groups(
+            self.paths, [path for path in self.paths if self.is_stale(path)]) for path in group]
+        if len(stale_paths) < len(self.paths):
+            self.report("Skipping {0} unchanged input file(s)".format(len(self.paths) - len(stale_paths)))
+        self.paths = stale_paths
+
+        return self
+
+    def update_manifest(self, path, hotel_codes, hotel_outputs=None):
+        """ Record a rebuilt input file and its outputs in the build manifest: the
+        paths written for each of its hotels, pages, rate shards and precompressed
+        siblings alike, when given in hotel_outputs, else its two pages. """
+        if self.manifest is not None:
+            output_directory = self.getDirs().get('output_directory')
+            outputs = []
+            for hotel_code in hotel_codes:
+                outputs.extend((hotel_outputs or {}).get(hotel_code) or [
+                    self.output_path(output_directory, hotel_code, output_file)
+                    for output_file in self.OUTPUT_FILES])
+            self.manifest.record(path, hotel_codes, outputs)
+        return self
+
     def parse(self):
         """ @input: XML file paths attribute populated by scan() earlier
         in the method chain.
@@ -297,7 +502,7 @@ print this message.""".format(sys.argv[0])
             the file will be written, and the HTML to be written as a string.
             ex: [(output/high_low_rates.html, '<html>...</html>'),
             (output/blah.html), <html>...</html>), ...] appended to the top
-            level object's html_strings attribute
+            level object's pages attribute
         @returns self to support method chaining
 
              Rate calendar:
@@ -312,7 +517,7 @@ print this message.""".format(sys.argv[0])
 
             Rate summary:
                 1. Needs the following local variables:
-                    current year or year in top level object attribute self.year
+                    the dates to cover, in top level object attribute self.window
                     List of rooms. For each room...
                     Room code
                     Room description (a longer string)
@@ -326,144 +531,763 @@ print this message.""".format(sys.argv[0])
         """
 
         # self.paths is the discovered xml file paths from .search
-        # self.parser_objects is a list of instantiated parsers from paths
+        # self.rate_indexes is the RateIndex of each hotel read from those paths
         # both are @props of top level object
 
-        if len(self.paths) is 0:
+        if len(self.paths) == 0:
             raise SystemExit(
                 "Unable to find detected XML file paths. Could be a typo.")
 
-        # Get a list of all <date> tags from the XML
-        date_tags = []
-
-        for path in self.paths:
-            with open(path, 'r') as xmlFileHandle:
-                doc = untangle.parse(xmlFileHandle.read())
-
-                self.parser_objects.append(doc)
-                if self.debug:
-                    print("Untangle parser #{0}".format(
-                        str(len(self.parser_objects))), "repr:",
-                        repr(self.parser_objects[(len(self.parser_objects) - 1)]))
-
-        for xml_parser in self.parser_objects:
-            print("Parsing hotel code {0}".format(xml_parser.hotel['code']))
-
-            for room in xml_parser.hotel.room:
-                room_description = room.description.cdata.strip()
-                room_rates = room.rate
-                print(room_description)
-                for rate in room_rates:
-                    for tag in rate.date:
-                        date_tags.append(tag)
-
-        if self.debug: print("{0} <date> tags processed".format(str(len(date_tags))))
-
-        # Iterate over every day of the year. The year to use is a property of the top level object.
-
-        start_date = datetime.date(self.year, 1, 1)
-        end_date = datetime.date(self.year, 12, 31)
-
-        # Use the generator self.daterange to get a list of days in a year
-        days_in_year = [day for day in self.daterange(start_date, end_date)]
-
-        # Sanity check: length of days_in_year should always be 365
-        assert len(days_in_year) == 365
-
-        # Make it a tuple with a list for each day
-        days_in_year = zip(days_in_year, [[] for x in range(365)])
-        for day in days_in_year:
-            for date_tag in date_tags:
-                tag_start_year, tag_start_month, tag_start_day = [int(item) for item in date_tag['start'].split('-')][0], [int(item) for item in date_tag['start'].split('-')][1], [int(item) for item in date_tag['start'].split('-')][2]
-                tag_start = datetime.date(tag_start_year, tag_start_month, tag_start_day)
-
-                tag_end_year, tag_end_month, tag_end_day = [int(item) for item in date_tag['end'].split('-')][0], [int(item) for item in date_tag['end'].split('-')][1], [int(item) for item in date_tag['end'].split('-')][2]
-                tag_end = datetime.date(tag_end_year, tag_end_month, tag_end_day)
-
-                # If the day of current iteration falls within the date range of the <date> XML tag, create a tuple to
-                # link them and append it to the days_tags_tuples list
-                #print("{0}, {1}, {2}".format(tag_start, day[0], tag_end))
-                if (tag_start <= day[0] <= tag_end):
-                    if (date_tag not in day[1]):
-                        try:
-
-                            rate = float(date_tag.room_price.cdata.strip())
-                            # This is a fix for bug where untangle.py element objects were ending up in
-                            # list of rates, which should all be floats, which broke the JSON serializer.
-                            # This is probably due to missing close tags or not-well-formed XML in general
-
-                            day[1].append(rate)
-                            # print("Appended.")
-                        except AttributeError:
-                            continue
-
-        # Self test to show date tags fall between proper start and end datetimes
-        # with open('rates.txt', 'w') as outfile:
-        #     for day in days_in_year:
-        #         outfile.write("{0}\n".format(day))
-        #     print("Length: {0}".format(str(len(days_in_year))))
-        self.days_in_year = days_in_year
-
-        if self.debug: global days_in_year
+        for path, buffer in self.input_buffers(self.paths):
+            # Each file is streamed, so the unsplit rates.xml can be passed in as well as
+            # rates.input.xml files, unless its rate cache is current
+            self.path_hotels[path] = []
+            for rate_index in self.read_hotels(path, self.use_cache, self.metrics, buffer):
+                self.report("Parsing hotel code {0}".format(rate_index.hotel_code))
+                self.path_hotels[path].append(rate_index.hotel_code)
+                for room_description in rate_index.rooms.values():
+                    self.report(room_description)
+
+                self.merge_hotel(self.rate_indexes, rate_index)
+
+        if self.debug: print("{0} <date> ranges indexed".format(
+            str(sum(len(rate_index) for rate_index in self.rate_indexes.values()))))
+
+        # Days are looked up from the ranges when asked for, see getRatesForDay(), so
+        # only the days each hotel has rates on in the window are counted here
+        for rate_index in self.rate_indexes.values():
+            with self.metrics.stage('parse', rate_index.hotel_code) as stage:
+                window = self.window.resolve(rate_index)
+                days_matched, rates_matched = rate_index.coverage(window.start, window.end)
+                stage['counts']['days'] = window.days
+                stage['counts']['days_matched'] = days_matched
+                stage['counts']['rates_matched'] = rates_matched
+
         return self
 
+    @staticmethod
+    def merge_hotel(rate_indexes, rate_index):
+        """ Add the RateIndex of a hotel to rate_indexes, keyed by hotel code,
+        merging it into the one already there when the hotel is split over
+        several files. """
+        if rate_index.hotel_code in rate_indexes:
+            existing = rate_indexes[rate_index.hotel_code]
+            for room, description in rate_index.rooms.items():
+                existing.rooms.setdefault(room, description)
+            for rate_range in rate_index.ranges:
+                existing.add_range(rate_range)
+        else:
+            rate_indexes[rate_index.hotel_code] = rate_index
+
+    def needs_parsing(self, path):
+        """ True if the XML of path has to be parsed, as it is neither a rate
+        store nor has a current rate cache. """
+        import ratestore
+        if ratestore.is_database(path):
+            return False
+        return not (self.use_cache and ratecache.is_current(path))
+
+    def input_buffers(self, paths):
+        """ Generator over a (path, buffer) tuple for each of paths, where buffer
+        is the memory-mapped file read ahead of time for the XML parser, or None
+        if the file needs no parsing or read-ahead is disabled. """
+        if self.read_ahead < 1:
+            for path in paths:
+                yield path, None
+            return
+        with readahead.ReadAhead(paths, self.read_ahead, self.needs_parsing) as files:
+            for path, buffer in files:
+                yield path, buffer
+
+    @staticmethod
+    def read_hotels(path, use_cache=True, metrics=None, buffer=None):
+        """ @input path to a hotel rates XML file, and optionally the Metrics to
+            record the load in and the content of the file, already mapped
+            @returns a list with the RateIndex of each hotel in it, loaded from the
+            rate cache next to it if that is current, otherwise parsed from the XML
+            and cached for the next run
+        """
+        with (metrics or Metrics()).stage('xml_load') as stage:
+            stage['path'] = path
+            rate_indexes = HotelHTMLGenerator._load_hotels(path, use_cache, buffer)
+            stage['hotel'] = ",".join(rate_index.hotel_code for rate_index in rate_indexes)
+            stage['counts']['hotels'] = len(rate_indexes)
+            stage['counts']['rooms'] = sum(len(rate_index.rooms) for rate_index in rate_indexes)
+            stage['counts']['date_tags'] = sum(len(rate_index) for rate_index in rate_indexes)
+        return rate_indexes
+
+    @staticmethod
+    def _load_hotels(path, use_cache, buffer=None):
+        """ See read_hotels(). """
+        import ratestore
+        if ratestore.is_database(path):
+            with ratestore.RateStore(path, read_only=True) as store:
+                return list(store.load_all())
+
+        if use_cache:
+            rate_indexes = ratecache.load(path)
+            if rate_indexes is not None:
+                return rate_indexes
+
+        import ratefeed
+        # An mmap is read by the parser like a file, without copying it whole
+        rate_indexes = list(ratefeed.iter_hotels(path if buffer is None else buffer))
+
+        if use_cache:
+            try:
+                ratecache.save(path, rate_indexes)
+            except EnvironmentError as error:
+                # Read-only input directories just go without a cache
+                print("Unable to write rate cache for {0}: {1}".format(path, error), file=sys.stderr)
+
+        return rate_indexes
+
     def getRatesForDay(self, day):
-        return self.days_in_year[day]
+        """ Return a (date, [rates]) tuple holding the rates of every hotel for a
+        day, given either as a date or as the number of days since the first one
+        of the window. """
+        if not isinstance(day, datetime.date):
+            day = self.window.resolve(*self.rate_indexes.values()).start + datetime.timedelta(days=day)
+        rates = []
+        for rate_index in self.rate_indexes.values():
+            rates.extend(rate_index.rates_for_day(day))
+        return (day, rates)
+
+    def getRatesForRoom(self, hotel_code, room, day):
+        """ Return the rates of a single room of a hotel on the given date. """
+        return self.rate_indexes[hotel_code].rates_for_room(room, day)
+
+    def getRatesForRange(self, hotel_code, start, end, room=None):
+        """ Return (date, [rates]) for each day between start and end inclusive. """
+        return self.rate_indexes[hotel_code].rates_for_range(start, end, room)
+
+    @classmethod
+    def template_environment(cls):
+        """ The Jinja2 environment used to render every output file. It is built
+        once per process and shared by every hotel, and compiled templates are
+        kept in a bytecode cache on disk so later runs skip compiling them. """
+        if cls._environment is None:
+            from jinja2 import Environment, FileSystemLoader, FileSystemBytecodeCache, select_autoescape
+            cls._environment = Environment(
+                loader=FileSystemLoader(TEMPLATE_DIRECTORY, followlinks=True),
+                autoescape=select_autoescape(['html', 'xml']),
+                # Defaults to a private directory under the system temp directory
+                bytecode_cache=FileSystemBytecodeCache(),
+                auto_reload=False
+            )
+        return cls._environment
+
+    @classmethod
+    def month_grids(cls, year):
+        """ The empty HTML table of each month of a year, weeks starting on Sunday.
+        They are the same for every hotel, so they are built once per process and
+        year; the rates are filled in by the page itself. """
+        grids = cls._month_grids.get(year)
+        if grids is None:
+            html_calendar = calendar.HTMLCalendar(calendar.SUNDAY)
+            grids = cls._month_grids[year] = tuple(
+                html_calendar.formatmonth(year, month) for month in range(1, 13))
+        return grids
 
-    def generate_html(self):
-        """ Create an HTML calendar interface containing the room data for each given day. """
+    @staticmethod
+    def render_rate_calendar(rate_index, window, environment, shards=None, self_contained=False):
+        """ @input a hotel's RateIndex, the Window or year to show, a Jinja2
+            environment, optionally the rate shards of the window from
+            ratejson.month_shards() and whether to make the page self-contained
+            @returns a generator over the rate calendar HTML of that hotel, which
+            only does any work once it is iterated over. The rates themselves are
+            in the per-month shards the page loads, see render_hotel(), or in the
+            page itself when self-contained, so it also works from file://
+        """
+        window = Window.of(window).resolve(rate_index)
+        if shards is None:
+            shards = ratejson.month_shards(rate_index, window.start, window.end)
+
+        table_months = window.months()
+        calendar_output = "".join(
+            HotelHTMLGenerator.month_grids(year)[month - 1] for year, month in table_months)
+
+        template = environment.get_template('rate_calendar.jinja2.html')
+        for chunk in template.generate(
+                hotel_code=rate_index.hotel_code,
+                period=str(window),
+                calendar_output=calendar_output,
+                rooms_json=ratejson.encode(list(rate_index.rooms)),
+                months_json=ratejson.encode(list(shards)),
+                # Inside a <script> block, where "</" would end it early
+                shards_json=ratejson.encode(shards).replace('<', '\\u003c') if self_contained else None,
+                tables_json=ratejson.encode(
+                    ["{0:04d}-{1:02d}".format(year, month) for year, month in table_months]),
+                self_contained=self_contained):
+            yield chunk
+
+    @staticmethod
+    def render_rates_summary(rate_index, window, environment, self_contained=False):
+        """ @input a hotel's RateIndex, the Window or year to summarize, a Jinja2
+            environment and whether to inline the stylesheet instead of linking
+            the CDN's
+            @returns a generator over the HTML summary of each room's low and high
+            rate per month
+        """
+        window = Window.of(window).resolve(rate_index)
+        summary = ratesummary.summarize(rate_index, window.start, window.end)
+
+        template = environment.get_template('rates_yearly_summary.jinja2.html')
+        for chunk in template.generate(
+                hotel_code=rate_index.hotel_code,
+                currency=rate_index.currency,
+                period=str(window),
+                rooms=rate_index.rooms,
+                summary=summary,
+                self_contained=self_contained):
+            yield chunk
 
-        rate
+    @staticmethod
+    def render_hotel(rate_index, window, environment, self_contained=False):
+        """ @input a hotel's RateIndex, the Window or year to render, a Jinja2
+            environment and whether to inline the stylesheet
+            @returns an (output file name, chunks) tuple for each of OUTPUT_FILES,
+            followed by one for each of the hotel's monthly rate shards. Open ends
+            of the window are closed at the first and last day the hotel has rates """
+        window = Window.of(window).resolve(rate_index)
+        shards = ratejson.month_shards(rate_index, window.start, window.end)
+        return [
+            ('rate_calendar.html', HotelHTMLGenerator.render_rate_calendar(
+                rate_index, window, environment, shards, self_contained)),
+            ('rates_yearly_summary.html', HotelHTMLGenerator.render_rates_summary(
+                rate_index, window, environment, self_contained)),
+        ] + [(ratejson.shard_name(month), [ratejson.encode(shard)]) for month, shard in shards.items()]
+
+    @staticmethod
+    def output_path(output_directory, hotel_code, output_file):
+        """ Where an output file of a hotel is written. """
+        return os.path.join(output_directory, hotel_code, *output_file.split('/'))
 
-        temp = []
+    @staticmethod
+    def remove_stale_shards(output_directory, hotel_code, written):
+        """ Remove the rate shards of a hotel, and their precompressed siblings,
+        which are not among the paths just written for it, such as those of
+        months that have left the window.
+            @returns the paths removed """
+        directory = HotelHTMLGenerator.output_path(output_directory, hotel_code, ratejson.SHARD_DIRECTORY)
+        if not os.path.isdir(directory):
+            return []
+        written = set(written)
+        removed = []
+        for name in sorted(os.listdir(directory)):
+            path = os.path.join(directory, name)
+            if path not in written and name.split('.', 1)[-1] in STALE_SHARD_SUFFIXES:
+                os.remove(path)
+                removed.append(path)
+        return removed
+
+    @staticmethod
+    def write_file(path, chunks):
+        """ Stream a page's chunks into a temporary file as they are rendered and
+        atomically move it into place, creating its directory if needed. """
+        from outputwriter import write_atomic
+        return write_atomic(path, chunks)
+
+    @staticmethod
+    def submit_page(writer, path, chunks, minify=False, precompress=False):
+        """ Queue a page on an OutputWriter, minified if it is HTML and minify is
+        set, followed by its .gz (and .br) siblings if precompress is set. Siblings
+        an earlier run left behind which are not rewritten are removed, so a web
+        server cannot send them in place of the new page.
+            @returns the paths queued
+        """
+        outputformat.remove_siblings(path, outputformat.PRECOMPRESSED_SUFFIXES if precompress else ())
+        if not minify and not precompress:
+            writer.submit(path, chunks)
+            return [path]
+
+        page = u''.join(chunks)
+        if minify and path.endswith('.html'):
+            page = outputformat.minify_html(page)
+        writer.submit(path, [page])
+        paths = [path]
+        if precompress:
+            for suffix, data in outputformat.precompress(page.encode('utf-8')):
+                writer.submit(path + suffix, [data])
+                paths.append(path + suffix)
+        return paths
 
-        # Iterator for each month of data
-        for month, days_list in itertools.groupby(self.days_in_year, lambda x: x[0].month):
+    def generate_html(self):
+        """ Create an HTML calendar interface containing the room data for each given day.
+            @output a (hotel code, path, chunks) tuple per output file appended to self.pages.
+            Nothing is rendered until write_output() streams the chunks to disk.
+            @returns self to support method chaining
+        """
+        environment = self.template_environment()
+        output_directory = self.getDirs().get('output_directory')
 
-            days_list = list(days_list)
-            temp.append((month, days_list))
+        for hotel_code, rate_index in self.rate_indexes.items():
+            for output_file, chunks in self.render_hotel(
+                    rate_index, self.window, environment, self.self_contained):
+                self.pages.append((
+                    hotel_code, self.output_path(output_directory, hotel_code, output_file), chunks))
 
-        # Replace earlier list with our month-separated copy
-        self.days_in_year = temp
+        return self
 
+    def write_output(self, input_paths=None):
+        """ @input (hotel code, path, chunks) tuples in self.pages from generate_html(),
+            and optionally the input files those pages were rebuilt from when that is
+            not every path in self.path_hotels
+            @output Written html files.
+            @returns self, or raises an exception for I/O errors like no write permissions
+        """
+        # Each page is rendered here while the pages before it are being written
+        from outputwriter import OutputWriter
+        output_directory = self.getDirs().get('output_directory')
+        writer = OutputWriter(max_workers=self.write_threads)
+        hotel_outputs = dict()
+        for hotel_code, path, chunks in self.pages:
+            with self.metrics.stage('generate_html', hotel_code) as stage:
+                hotel_outputs.setdefault(hotel_code, []).extend(
+                    self.submit_page(writer, path, chunks, self.self_contained, self.precompress))
+                stage['counts']['pages'] = 1
+        self.pages = list()
+
+        # Whatever is left to write once rendering is done
+        with self.metrics.stage('write') as stage:
+            written = writer.close()
+            stage['counts']['files'] = len(written)
+
+        for path in written:
+            self.output_files.append(path)
+            self.report("Wrote {0}".format(path))
+        for hotel_code, outputs in hotel_outputs.items():
+            for path in self.remove_stale_shards(output_directory, hotel_code, outputs):
+                self.report("Removed {0}".format(path))
+
+        for path in (self.path_hotels if input_paths is None else input_paths):
+            self.update_manifest(path, self.path_hotels[path], hotel_outputs)
+        if self.manifest is not None:
+            self.manifest.save()
 
+        return self
 
-        months = ['January', 'February', 'March', 'April', 'May', 'June', 'July', 'August', 'September', 'October',
-                  'November', 'December']
+    def run(self):
+        """ The chain of actions this script is designed to perform: scan, skip the
+        unchanged inputs, then parse, render and write the rest.
+            @returns self
+        """
+        if self.watch_mode:
+            return self.watch()
+
+        if self.serve_mode:
+            return self.serve()
+
+        if self.jobs > 1:
+            # The walk finishes before workers start, so that every file of a hotel
+            # split over several goes to the same worker
+            self.scan().load_manifest()
+            groups = self.input_groups(self.paths, [path for path in self.paths if self.is_stale(path)])
+            skipped = len(self.paths) - sum(len(group) for group in groups)
+            if skipped:
+                self.report("Skipping {0} unchanged input file(s)".format(skipped))
+            return self.render_parallel(groups)
+
+        self.scan().skip_unchanged()
+        if len(self.paths) == 0:
+            self.report("All output files are up to date.")
+        else:
+            self.parse().generate_html().write_output()
+        return self
 
-        from jinja2 import Environment, FileSystemLoader, select_autoescape
-        env = Environment(
-            loader=FileSystemLoader('./templates', followlinks=True),
-            autoescape=select_autoescape(['html', 'xml'])
-        )
+    def reload(self, changed, removed=()):
+        """ Re-read the changed input files and forget the removed ones, keeping
+        what was read from every file in memory. Hotels split over several files
+        are merged again from the rates kept for the other files.
+            @returns an OrderedDict of the RateIndex of every hotel found in the
+            changed files, keyed by hotel code
+        """
+        affected = set()
+        for path in removed:
+            affected.update(self.path_hotels.pop(path, []))
+            self.path_indexes.pop(path, None)
+            self.input_hashes.pop(path, None)
+            if self.manifest is not None:
+                self.manifest.forget(path)
+        for path, buffer in self.input_buffers(changed):
+            affected.update(self.path_hotels.get(path, []))
+            self.input_hashes[path] = (
+                file_hash(path) if self.manifest is None else self.manifest.state(path)['hash'])
+            self.path_indexes[path] = self.read_hotels(path, self.use_cache, self.metrics, buffer)
+            self.path_hotels[path] = [rate_index.hotel_code for rate_index in self.path_indexes[path]]
+            affected.update(self.path_hotels[path])
+
+        # Hotels split over several files are merged into a new RateIndex, as the
+        # ones read from each file are kept as they are for the next rebuild
+        merged = OrderedDict()
+        copies = set()
+        for rate_indexes in self.path_indexes.values():
+            for rate_index in rate_indexes:
+                if rate_index.hotel_code not in affected:
+                    continue
+                existing = merged.get(rate_index.hotel_code)
+                if existing is None:
+                    merged[rate_index.hotel_code] = rate_index
+                    continue
+                if rate_index.hotel_code not in copies:
+                    copies.add(rate_index.hotel_code)
+                    first, existing = existing, RateIndex(existing.hotel_code, existing.currency)
+                    merged[rate_index.hotel_code] = existing
+                    for room, description in first.rooms.items():
+                        existing.add_room(room, description)
+                    for rate_range in first.ranges:
+                        existing.add_range(rate_range)
+                for room, description in rate_index.rooms.items():
+                    existing.rooms.setdefault(room, description)
+                for rate_range in rate_index.ranges:
+                    existing.add_range(rate_range)
+
+        versioned_hotels = dict(self.versioned_hotels)
+        for hotel_code in affected:
+            if hotel_code in merged:
+                self.rate_indexes[hotel_code] = merged[hotel_code]
+                versioned_hotels[hotel_code] = (merged[hotel_code], ",".join(
+                    self.input_hashes[path] for path, hotel_codes in self.path_hotels.items()
+                    if hotel_code in hotel_codes))
+            else:
+                # Its pages are left in place, as for a hotel dropped from a feed
+                self.rate_indexes.pop(hotel_code, None)
+                versioned_hotels.pop(hotel_code, None)
+                self.report("Hotel code {0} is no longer in any input file".format(hotel_code))
+        self.versioned_hotels = versioned_hotels
+
+        return merged
+
+    def rebuild(self, changed, removed=()):
+        """ reload() the changed and removed input files, then render and write
+        every hotel found in the changed ones.
+            @returns self to support method chaining
+        """
+        merged = self.reload(changed, removed)
+
+        environment = self.template_environment()
+        output_directory = self.getDirs().get('output_directory')
+        for hotel_code, rate_index in merged.items():
+            for output_file, chunks in self.render_hotel(
+                    rate_index, self.window, environment, self.self_contained):
+                self.pages.append((
+                    hotel_code, self.output_path(output_directory, hotel_code, output_file), chunks))
+
+        return self.write_output(changed)
+
+    def watch(self):
+        """ Build every stale hotel, then keep the parsed rates and the compiled
+        templates in memory and rebuild the hotels of each input file that
+        changes, until interrupted.
+            @returns self once interrupted
+        """
+        self.scan().load_manifest()
+
+        stale_paths = [path for path in self.paths if self.is_stale(path)]
+        # Unchanged inputs are only read, for hotels split over files and for serving
+        stale = set(stale_paths)
+        self.reload([path for path in self.paths if path not in stale])
+        self.rebuild(stale_paths)
+
+        server = None
+        if self.serve_mode:
+            server = self.make_server()
+            thread = threading.Thread(target=server.serve_forever)
+            thread.daemon = True
+            thread.start()
+
+        import watcher
+        poller = watcher.Poller(self.list_inputs, self.watch_interval, self.watch_debounce)
+        self.report("Watching {0} for changes. Press Ctrl+C to stop.".format(
+            self.getDirs().get('search_directory')))
+        try:
+            for changed, removed in poller.changes():
+                started = time.time()
+                # One set of metrics per rebuild, so a long running watch does not grow
+                self.metrics = Metrics()
+                for path in changed:
+                    self.report("Changed: {0}".format(path))
+                for path in removed:
+                    self.report("Removed: {0}".format(path))
+                self.rebuild(changed, removed)
+                self.report("Rebuilt in {0:.3f}s".format(time.time() - started))
+                if self.metrics_path:
+                    self.metrics.save(self.metrics_path)
+        except KeyboardInterrupt:
+            self.report("Stopped watching.")
+        finally:
+            if server is not None:
+                server.shutdown()
+                server.server_close()
 
-        self.rate_calendar_template = env.get_template('rate_calendar.jinja2.html')
+        return self
 
-        html_calendar = calendar.HTMLCalendar(calendar.SUNDAY)
+    def render_page(self, rate_index, window, output_file):
+        """ @returns the chunks of one of the output files of a hotel for a Window
+            or year, minified with --self-contained """
+        chunks = dict(self.render_hotel(
+            rate_index, window, self.template_environment(), self.self_contained))[output_file]
+        if self.self_contained and output_file.endswith('.html'):
+            return [outputformat.minify_html(u''.join(chunks))]
+        return chunks
+
+    def make_server(self):
+        """ A RateServer on serve_port rendering pages from the rates in memory. """
+        import rateserver
+        server = rateserver.RateServer(
+            ('127.0.0.1', self.serve_port),
+            lambda hotel_code: self.versioned_hotels.get(hotel_code),
+            self.render_page, self.OUTPUT_FILES, self.window, self.serve_cache_bytes, self.quiet)
+        self.report("Serving rate pages on http://{0}:{1}/<hotel code>/[<year>/]<page>.html".format(
+            *server.server_address[:2]))
+        return server
+
+    def serve(self):
+        """ Read every input file and serve the pages of its hotels, rendered
+        on demand, until interrupted. Add --watch to pick up changed inputs.
+            @returns self once interrupted
+        """
+        self.scan().load_manifest().reload(self.paths)
 
-        cal = ""
+        server = self.make_server()
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            self.report("Stopped serving.")
+        finally:
+            server.server_close()
 
+        return self
 
+    def render_parallel(self, groups=None):
+        """ Fan the paths found by scan(), or the given groups of paths from
+        input_groups(), out to worker processes which parse, index, render and
+        write the hotels in a group on their own. A hotel split over several
+        files is rendered from all of them by a single worker. Reports progress
+        as workers finish.
+            @returns self to support method chaining
+        """
+        from concurrent.futures import ProcessPoolExecutor, as_completed
+
+        output_directory = self.getDirs().get('output_directory')
+
+        with ProcessPoolExecutor(max_workers=self.jobs) as executor:
+            futures = dict(
+                (executor.submit(_render_hotel_files, group, self.window, output_directory,
+                                 self.use_cache, self.self_contained, self.precompress), group)
+                for group in (self.input_groups(self.paths) if groups is None else groups))
+
+            if not futures:
+                if len(self.paths) == 0:
+                    raise SystemExit(
+                        "Unable to find detected XML file paths. Could be a typo.")
+                self.report("All output files are up to date.")
+
+            for done, future in enumerate(as_completed(futures), 1):
+                paths = ", ".join(futures[future])
+                try:
+                    path_hotels, results, records = future.result()
+                except Exception as error:
+                    raise SystemExit("Failed to process {0}: {1}".format(paths, error))
+                self.metrics.extend(records)
+                for hotel_code, written in results:
+                    self.output_files.extend(written)
+                    self.report("[{0}/{1}] Rendered hotel code {2} from {3}".format(
+                        done, len(futures), hotel_code, paths))
+                for path, hotel_codes in path_hotels:
+                    self.update_manifest(path, hotel_codes, dict(results))
+
+        if self.manifest is not None:
+            self.manifest.save()
 
         return self
 
-    # def write_output(self):
-    #     """ @input Rendered Jinja2 templates
-    #         @output Written html files.
-    #         @returns True on successful write or raises an exception for invalid input or I/O errors like no write permissions
-    #     """
-    #     output_files = ['rate_calendar', 'rates_yearly_summary']
-    #
-    #     print("Writing to output files has not yet been implemented.")
-    #     return self
-    #
 
-if __name__ == "__main__":
+def _render_hotel_files(paths, window, output_directory, use_cache=True, self_contained=False,
+                        precompress=False):
+    """ Worker for HotelHTMLGenerator.render_parallel(). Parses a group of XML
+    files, merging the hotels split over several of them, and renders and writes
+    every hotel in them.
+        @returns a list of (path, [hotel codes]) tuples, a list of (hotel code,
+        [written paths]) tuples, and the metrics records of the work done
+    """
+    from outputwriter import OutputWriter
+
+    environment = HotelHTMLGenerator.template_environment()
+    metrics = Metrics()
+    path_hotels = []
+    rate_indexes = OrderedDict()
+    for path in paths:
+        hotel_codes = []
+        for rate_index in HotelHTMLGenerator.read_hotels(path, use_cache, metrics):
+            hotel_codes.append(rate_index.hotel_code)
+            HotelHTMLGenerator.merge_hotel(rate_indexes, rate_index)
+        path_hotels.append((path, hotel_codes))
+
+    results = []
+    writer = OutputWriter(max_workers=2)
+    for rate_index in rate_indexes.values():
+        written = []
+        for output_file, chunks in HotelHTMLGenerator.render_hotel(
+                rate_index, window, environment, self_contained):
+            with metrics.stage('generate_html', rate_index.hotel_code) as stage:
+                written.extend(HotelHTMLGenerator.submit_page(
+                    writer,
+                    HotelHTMLGenerator.output_path(output_directory, rate_index.hotel_code, output_file),
+                    chunks, self_contained, precompress))
+                stage['counts']['pages'] = 1
+        results.append((rate_index.hotel_code, written))
+    with metrics.stage('write') as stage:
+        stage['counts']['files'] = len(writer.close())
+    for hotel_code, written in results:
+        HotelHTMLGenerator.remove_stale_shards(output_directory, hotel_code, written)
+    return path_hotels, results, metrics.records
+
+
+def iso_date(value):
+    """ argparse type of --from and --to. """
+    try:
+        return datetime.datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise argparse.ArgumentTypeError("invalid date {0!r}, expected YYYY-MM-DD".format(value))
+
+
+def build_parser():
+    """ The command line of the generator. The split, store, quote, diff and
+    export subcommands have their own, see the main() of ratesplit, ratestore,
+    ratequote, ratediff and rateexport. """
+    parser = argparse.ArgumentParser(
+        description="Render a rate calendar and a yearly rate summary page for every hotel "
+                    "in the rates XML files found under the search directory.",
+        epilog="""To split the unsplit rates.xml into a search directory holding a
+(hotel code)/rates.input.xml file per hotel, run
+  %(prog)s split (rates.xml) (output directory) [--jobs N]
+
+To ingest hotels into an SQLite rate store and query it, run
+  %(prog)s store ingest (database) (XML file or search directory)...
+  %(prog)s store lowest (database) (room) (from date) (to date) [--hotel CODE]
+or %(prog)s store --help for the other queries. The search directory may
+also be such a database, to render every hotel in it.
+
+To quote the total price of a stay, or of every stay in a CSV file, run
+  %(prog)s quote (input) (room) (check-in date) (nights) [--adults N] [--kids N]
+  %(prog)s quote (input) --batch (CSV file)
+
+To report which hotels, rooms and dates changed between two snapshots of the
+rates (XML files, search directories or rate stores), as JSON and HTML, run
+  %(prog)s diff (previous) (current) [--json FILE] [--html FILE]
+
+To export the rates as flat records, one per range or per day, as JSON lines
+or CSV, to one file or to a file per hotel, run
+  %(prog)s export (input)... [--per range|day] [--format jsonl|csv] [--gzip]
+                  [--output FILE | --shard DIRECTORY [--jobs N]]""",
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('search_directory', nargs='?',
+                        help="directory to search for input files, or a single XML file such as "
+                             "the unsplit rates.xml (default: ./test/search, in debug mode)")
+    parser.add_argument('output_directory', nargs='?',
+                        help="directory to write the pages of every hotel to (default: ./test/output)")
+    parser.add_argument('--version', action='version', version='%(prog)s {0}'.format(__version__))
+    parser.add_argument('-q', '--quiet', action='store_true',
+                        help="report nothing but errors, and do not print the banner")
+    parser.add_argument('--no-banner', action='store_true', help="do not print the banner")
+    parser.add_argument('--relative', action='store_true',
+                        help="do not convert relative paths to absolute paths")
+    parser.add_argument('--year', type=int, help="4 digit year to render (default: 2018)")
+    parser.add_argument('--from', dest='from_date', type=iso_date, metavar='YYYY-MM-DD',
+                        help="render the days from this date on, across years if need be "
+                             "(default with --to: each hotel's first day with rates)")
+    parser.add_argument('--to', dest='to_date', type=iso_date, metavar='YYYY-MM-DD',
+                        help="render the days up to this date "
+                             "(default with --from: each hotel's last day with rates)")
+    parser.add_argument('--jobs', type=int, metavar='N',
+                        help="parse and render hotels in N worker processes")
+    parser.add_argument('--force', action='store_true',
+                        help="rebuild every hotel, not only those whose input file changed "
+                             "since the last run")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="always read the XML instead of the .ratecache file next to each input")
+    parser.add_argument('--read-ahead', type=int, default=4, metavar='N',
+                        help="number of input files read ahead while one is parsed, 0 not to "
+                             "read ahead (default: 4)")
+    parser.add_argument('--pattern', action='append', dest='patterns', metavar='GLOB',
+                        help="search for other file names than rates.input.xml, e.g. '*.xml'; "
+                             "may be given more than once")
+    parser.add_argument('--metrics', metavar='FILE',
+                        help="write the time, CPU time, counts and memory high-water mark of "
+                             "every stage to FILE as JSON")
+    parser.add_argument('--profile', metavar='FILE',
+                        help="run under cProfile and tracemalloc and dump their stats to FILE")
+    parser.add_argument('--watch', action='store_true',
+                        help="keep running after the first build and rebuild the hotels of every "
+                             "input file that changes")
+    parser.add_argument('--interval', type=float, default=0.5, metavar='SECONDS',
+                        help="how often --watch polls the search directory (default: 0.5)")
+    parser.add_argument('--debounce', type=float, default=0.25, metavar='SECONDS',
+                        help="how long changes must settle before --watch rebuilds (default: 0.25)")
+    parser.add_argument('--serve', action='store_true',
+                        help="serve the pages of every hotel, for any year, from "
+                             "http://127.0.0.1:PORT/<hotel code>/[<year>/]rate_calendar.html and "
+                             "so on, rendered on demand; with --watch as well, pages follow "
+                             "changes to the inputs")
+    parser.add_argument('--port', type=int, default=8000, help="port of --serve (default: 8000)")
+    parser.add_argument('--self-contained', action='store_true',
+                        help="inline the stylesheet instead of loading Bootstrap and jQuery "
+                             "from CDNs, and minify the pages")
+    parser.add_argument('--precompress', action='store_true',
+                        help="write a .gz copy (and a .br copy, if the brotli module is "
+                             "installed) next to every output file")
+    return parser
+
+
+def main(argv):
+    """ Run the command line given in argv, without the script name.
+        @returns the exit status """
+    # The split subcommand turns the unsplit rates.xml into a search directory
+    if argv and argv[0] == "split":
+        import ratesplit
+        return ratesplit.main(argv[1:])
+
+    # The store subcommand ingests hotels into an SQLite rate store and queries it
+    if argv and argv[0] == "store":
+        import ratestore
+        return ratestore.main(argv[1:])
+
+    # The quote subcommand prices stays
+    if argv and argv[0] == "quote":
+        import ratequote
+        return ratequote.main(argv[1:])
+
+    # The diff subcommand reports what changed between two snapshots of the rates
+    if argv and argv[0] == "diff":
+        import ratediff
+        return ratediff.main(argv[1:], HotelHTMLGenerator.template_environment)
+
+    # The export subcommand streams flat records of the rates for analytics
+    if argv and argv[0] == "export":
+        import rateexport
+        return rateexport.main(argv[1:])
+
+    options = build_parser().parse_args(argv)
+
     # Create an instance of our worker class
-    if len(sys.argv) == 3:
-        hg = HotelHTMLGenerator(sys.argv[1], sys.argv[2])
+    if options.search_directory is not None and options.output_directory is not None:
+        hg = HotelHTMLGenerator(options.search_directory, options.output_directory, options=options)
     else:
-        hg = HotelHTMLGenerator("./test/search", "./test/output", debug=True)
+        hg = HotelHTMLGenerator("./test/search", "./test/output", debug=True, options=options)
 
-    # Chain of actions this script is designed to perform
-    hg.scan().parse().generate_html()
+    if hg.profile_path:
+        instrumentation.profile(hg.run, hg.profile_path)
+        hg.report("Profile written to {0}".format(hg.profile_path))
+    else:
+        hg.run()
+
+    if hg.metrics_path:
+        hg.metrics.save(hg.metrics_path)
+        hg.report("Metrics written to {0}".format(hg.metrics_path))
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,143 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Per-stage timing, counters and memory high-water marks for a run of the
+generator, written out as a machine readable JSON report.
+
+Each measured piece of work is a stage record holding the stage name, the
+hotel it was for (if any), wall and CPU time, counters filled in by the code
+being measured and the peak RSS of the process when it finished. When the
+run is profiled, tracemalloc's peak for the stage is recorded as well.
+"""
+
+from collections import OrderedDict
+from contextlib import contextmanager
+import io
+import json
+import os.path
+import sys
+import time
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows, where peak RSS is simply not reported
+    resource = None
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+
+def peak_rss_kb():
+    """ Peak resident set size of this process in KiB, or None if unknown. """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports bytes, Linux KiB
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+class Metrics(object):
+    """ Collects stage records over a run. """
+
+    def __init__(self):
+        self.records = []
+        self.started = time.time()
+
+    @contextmanager
+    def stage(self, name, hotel=None):
+        """
+        Measure the body of a with statement as one record of the given stage.
+        Yields the record so the body can fill in record['counts'] and set
+        record['hotel'] once it knows which hotel it worked on.
+        """
+        record = OrderedDict([('stage', name), ('hotel', hotel), ('counts', OrderedDict())])
+        tracing = tracemalloc is not None and tracemalloc.is_tracing()
+        if tracing and hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+
+        wall_started = time.time()
+        cpu_started = time.process_time()
+        try:
+            yield record
+        finally:
+            record['wall_seconds'] = time.time() - wall_started
+            record['cpu_seconds'] = time.process_time() - cpu_started
+            record['peak_rss_kb'] = peak_rss_kb()
+            if tracing:
+                record['traced_peak_bytes'] = tracemalloc.get_traced_memory()[1]
+            self.records.append(record)
+
+    def extend(self, records):
+        """ Add records measured elsewhere, such as in a worker process. """
+        self.records.extend(records)
+        return self
+
+    def totals(self):
+        """ Sum of the times and counters of every stage, by stage name. """
+        totals = OrderedDict()
+        for record in self.records:
+            total = totals.setdefault(record['stage'], OrderedDict([
+                ('records', 0), ('wall_seconds', 0.0), ('cpu_seconds', 0.0),
+                ('peak_rss_kb', None), ('counts', OrderedDict())]))
+            total['records'] += 1
+            total['wall_seconds'] += record['wall_seconds']
+            total['cpu_seconds'] += record['cpu_seconds']
+            if record['peak_rss_kb'] is not None:
+                total['peak_rss_kb'] = max(total['peak_rss_kb'] or 0, record['peak_rss_kb'])
+            for counter, value in record['counts'].items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    total['counts'][counter] = total['counts'].get(counter, 0) + value
+        return totals
+
+    def report(self):
+        """ The whole run as a JSON serializable dict. """
+        return OrderedDict([
+            ('wall_seconds', time.time() - self.started),
+            ('peak_rss_kb', peak_rss_kb()),
+            ('totals', self.totals()),
+            ('records', self.records),
+        ])
+
+    def save(self, path):
+        """ Write the report to a JSON file. """
+        with io.open(path, 'w', encoding='utf-8') as handle:
+            handle.write(json.dumps(self.report(), indent=2))
+        return path
+
+
+def profile(function, path, top=25):
+    """
+    Run function under cProfile and tracemalloc. The cProfile stats are dumped
+    to path, in pstats format, and the top allocation sites to path + '.memory.txt'.
+        @returns whatever function returned
+    """
+    import cProfile
+    import pstats
+
+    profiler = cProfile.Profile()
+    if tracemalloc is not None:
+        tracemalloc.start()
+    try:
+        return profiler.runcall(function)
+    finally:
+        directory = os.path.dirname(os.path.abspath(path))
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        profiler.dump_stats(path)
+
+        if tracemalloc is not None:
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            with io.open(path + '.memory.txt', 'w', encoding='utf-8') as handle:
+                handle.write(u"Traced memory: current {0} bytes, peak {1} bytes\n\n".format(current, peak))
+                for statistic in snapshot.statistics('lineno')[:top]:
+                    handle.write(u"{0}\n".format(statistic))
+
+        stream = io.StringIO() if sys.version_info[0] >= 3 else io.BytesIO()
+        pstats.Stats(profiler, stream=stream).sort_stats('cumulative').print_stats(top)
+        print(stream.getvalue())
@@ -0,0 +1,96 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Minification and precompression of written pages, for --self-contained and
+--precompress.
+
+The HTML minifier only does what cannot change how a page renders: it drops
+comments and collapses every run of whitespace in text to a single space,
+leaving tags, attribute values and the content of <pre>, <textarea> and
+<script> elements alone. Inline stylesheets get the same treatment plus the
+removal of the whitespace around CSS punctuation.
+
+Precompressed siblings (page.html.gz, and page.html.br when the optional
+brotli module is installed) let static web servers such as nginx with
+gzip_static send compressed pages without compressing them on every request.
+They are written deterministically, so unchanged pages give identical files.
+"""
+
+import gzip
+import io
+import os
+import re
+
+try:
+    import brotli
+except ImportError:
+    # Optional, only .gz siblings are written without it
+    brotli = None
+
+# Suffixes of every kind of precompressed sibling, and of those written here
+SIBLING_SUFFIXES = ('.gz', '.br')
+PRECOMPRESSED_SUFFIXES = SIBLING_SUFFIXES if brotli is not None else ('.gz',)
+
+_PRESERVED = re.compile(r'<(pre|textarea|script|style)\b[^>]*>.*?</\1\s*>', re.IGNORECASE | re.DOTALL)
+_COMMENT = re.compile(r'<!--(?!\[if).*?-->', re.DOTALL)
+_TAG = re.compile(r'(<[^>]*>)')
+_WHITESPACE = re.compile(r'\s+')
+_STYLE_CONTENT = re.compile(r'^(<style\b[^>]*>)(.*?)(</style\s*>)$', re.IGNORECASE | re.DOTALL)
+_CSS_COMMENT = re.compile(r'/\*.*?\*/', re.DOTALL)
+_CSS_PUNCTUATION = re.compile(r'\s*([{};,>])\s*')
+_CSS_COLON = re.compile(r':\s+')
+
+
+def _minify_text(html):
+    """ Minify HTML without any preserved elements in it. """
+    parts = _TAG.split(_COMMENT.sub('', html))
+    # Even parts are text between tags, odd parts are the tags themselves
+    for position in range(0, len(parts), 2):
+        parts[position] = _WHITESPACE.sub(' ', parts[position])
+    return ''.join(parts)
+
+
+def minify_css(css):
+    """ Drop comments and insignificant whitespace from a stylesheet. """
+    css = _WHITESPACE.sub(' ', _CSS_COMMENT.sub('', css))
+    css = _CSS_COLON.sub(':', _CSS_PUNCTUATION.sub(r'\1', css))
+    return css.replace(';}', '}').strip()
+
+
+def minify_html(html):
+    """ Minify a whole HTML document. """
+    output = []
+    position = 0
+    for match in _PRESERVED.finditer(html):
+        output.append(_minify_text(html[position:match.start()]))
+        element = match.group(0)
+        if match.group(1).lower() == 'style':
+            opening, content, closing = _STYLE_CONTENT.match(element).groups()
+            element = opening + minify_css(content) + closing
+        output.append(element)
+        position = match.end()
+    output.append(_minify_text(html[position:]))
+    return ''.join(output).strip()
+
+
+def precompress(data):
+    """ @returns a (suffix, compressed bytes) tuple for every sibling to write next to a file
+        holding data """
+    buffer = io.BytesIO()
+    # No file name or time stamp in the header, so identical data compresses identically
+    with gzip.GzipFile(filename='', mode='wb', compresslevel=9, fileobj=buffer, mtime=0) as compressed:
+        compressed.write(data)
+    siblings = [('.gz', buffer.getvalue())]
+    if brotli is not None:
+        siblings.append(('.br', brotli.compress(data, quality=11)))
+    return siblings
+
+
+def remove_siblings(path, keep=()):
+    """ Remove the precompressed siblings of path, except those with a suffix
+    in keep, so that ones left by an earlier run are not served in place of
+    a new version of the file. """
+    for suffix in SIBLING_SUFFIXES:
+        if suffix not in keep and os.path.exists(path + suffix):
+            os.remove(path + suffix)
@@ -0,0 +1,140 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Atomic, thread-pooled writer for rendered pages.
+
+Each page is written to a temporary file in its destination directory,
+fsync'ed and then renamed over the destination, so readers of the output
+directory only ever see complete files. Writes run on a small pool of
+threads so that disk I/O overlaps with rendering the next page, and the
+number of rendered pages waiting to be written is bounded.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import contextlib
+import os
+import os.path
+import sys
+import tempfile
+import threading
+
+# mkstemp() creates files readable by their owner only. Written pages get the
+# permissions a plain open() would have given them instead. The umask can only
+# be read by setting it, so that is done once here rather than from threads.
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def _fsync_directory(directory):
+    """ Make a rename in a directory durable. Not every platform supports
+    opening directories, in which case this does nothing. """
+    try:
+        descriptor = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(descriptor)
+    except OSError:
+        pass
+    finally:
+        os.close(descriptor)
+
+
+def write_atomic(path, chunks, encoding='utf-8'):
+    """ Stream chunks into a temporary file next to path, fsync it and
+    atomically rename it to path, creating the directory if needed. Text
+    chunks are encoded, bytes are written as they are. """
+    directory = os.path.dirname(path) or '.'
+    if not os.path.isdir(directory):
+        try:
+            os.makedirs(directory)
+        except OSError:
+            # Another writer thread may have just created it
+            if not os.path.isdir(directory):
+                raise
+
+    descriptor, temporary_path = tempfile.mkstemp(
+        dir=directory, prefix='.' + os.path.basename(path) + '.', suffix='.tmp')
+    try:
+        if hasattr(os, 'fchmod'):
+            os.fchmod(descriptor, 0o666 & ~_UMASK)
+        with os.fdopen(descriptor, 'wb') as output:
+            for chunk in chunks:
+                output.write(chunk if isinstance(chunk, bytes) else chunk.encode(encoding))
+            output.flush()
+            os.fsync(output.fileno())
+        os.replace(temporary_path, path)
+    except BaseException:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+        raise
+
+    _fsync_directory(directory)
+    return path
+
+
+@contextlib.contextmanager
+def exit_on_closed_pipe(stream=None):
+    """ Context manager around writes to stream, sys.stdout by default, which
+    exits quietly with status 1 if its reader, such as head, has gone away.
+    Python flushes stdout again on the way out, so the stream is pointed at
+    devnull first.
+        @yields the stream """
+    stream = sys.stdout if stream is None else stream
+    try:
+        yield stream
+        stream.flush()
+    except BrokenPipeError:
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, stream.fileno())
+        os.close(devnull)
+        raise SystemExit(1)
+
+
+class OutputWriter(object):
+    """
+    Writes pages on a bounded pool of threads.
+
+    submit() renders a page in the calling thread and hands the rendered
+    chunks to a writer thread, so the next page can be rendered while this
+    one is being written. At most max_pending rendered pages wait for a
+    writer at any time; submit() blocks until one is free.
+
+    Use it as a context manager, or call close() to wait for every write and
+    re-raise the first error one of them hit.
+    """
+
+    def __init__(self, max_workers=4, max_pending=None):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._pending = threading.BoundedSemaphore(max_pending or max_workers)
+        self._futures = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close(wait_only=exc_type is not None)
+
+    def submit(self, path, chunks):
+        """ Render chunks into memory and queue them to be written to path. """
+        page = list(chunks)
+        self._pending.acquire()
+        try:
+            future = self._executor.submit(write_atomic, path, page)
+        except BaseException:
+            self._pending.release()
+            raise
+        future.add_done_callback(lambda _: self._pending.release())
+        self._futures.append(future)
+        return future
+
+    def close(self, wait_only=False):
+        """ Wait for every queued write. Raises the first write error unless
+        wait_only is set. """
+        self._executor.shutdown(wait=True)
+        futures, self._futures = self._futures, []
+        if not wait_only:
+            for future in futures:
+                future.result()
+        return [future.result() for future in futures if future.exception() is None]
@@ -0,0 +1,229 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Compact, columnar on-disk cache of parsed hotel rates.
+
+Parsing the XML again on every run is by far the most expensive part of a
+run, so the RateRanges read from an input file are stored next to it in
+<input>.ratecache. Hotel, room and rate codes are interned into a string
+table, days are stored as ordinals and prices as doubles, one typed column
+per RateRange field. Loading memory-maps the file and exposes every column
+as a memoryview over the mapping without copying it.
+
+The cache is only used while the size and mtime of its input still match.
+"""
+
+from array import array
+import json
+import mmap
+import os
+import os.path
+import struct
+import sys
+
+from rateindex import RateIndex, RateRange
+
+CACHE_SUFFIX = '.ratecache'
+MAGIC = b'HHGRATES'
+CACHE_VERSION = 2
+
+# Column name, array typecode and the value stored for a missing detail
+COLUMNS = [
+    ('hotel', 'i', None),
+    ('room', 'i', None),
+    ('rate', 'i', None),
+    ('start', 'i', None),
+    ('end', 'i', None),
+    ('room_price', 'd', None),
+    ('extra_adult', 'd', float('nan')),
+    ('child_price', 'd', float('nan')),
+    ('minimum_nite_stay', 'h', -1),
+    ('adults', 'h', -1),
+    ('kids', 'h', -1),
+    ('occupancy', 'h', -1),
+    ('basis', 'h', -1),
+]
+
+# Columns are padded to this many bytes so every one of them starts aligned
+ALIGNMENT = 8
+
+
+def cache_path(source):
+    """ Where the cache of an input file lives. """
+    return source + CACHE_SUFFIX
+
+
+def _source_state(source):
+    stat = os.stat(source)
+    return {'size': stat.st_size, 'mtime': stat.st_mtime}
+
+
+def _detail(value, missing):
+    """ Turn the placeholder of a missing detail back into None. NaN marks a
+    missing price since it never compares equal to itself. """
+    if value != value or value == missing:
+        return None
+    return value
+
+
+def save(source, rate_indexes):
+    """ Write the rates of the hotels read from source to its cache file,
+    atomically replacing an older cache.
+        @returns the path of the cache file
+    """
+    strings = []
+    string_ids = dict()
+
+    def intern(value):
+        if value not in string_ids:
+            string_ids[value] = len(strings)
+            strings.append(value)
+        return string_ids[value]
+
+    columns = [array(typecode) for _, typecode, _ in COLUMNS]
+    hotels = []
+    for hotel_id, rate_index in enumerate(rate_indexes):
+        hotels.append({
+            'code': rate_index.hotel_code,
+            'currency': rate_index.currency,
+            'rooms': list(rate_index.rooms.items()),
+        })
+        for rate_range in rate_index.ranges:
+            row = (hotel_id, intern(rate_range.room), intern(rate_range.rate)) + tuple(rate_range[2:])
+            for column, value, (_, _, missing) in zip(columns, row, COLUMNS):
+                column.append(missing if value is None else value)
+
+    header = json.dumps({
+        'version': CACHE_VERSION,
+        'byteorder': sys.byteorder,
+        'source': _source_state(source),
+        'hotels': hotels,
+        'strings': strings,
+        'rows': len(columns[0]),
+        'columns': [[name, typecode, column.itemsize]
+                    for (name, typecode, _), column in zip(COLUMNS, columns)],
+    }).encode('utf-8')
+
+    path = cache_path(source)
+    temporary_path = path + '.tmp'
+    with open(temporary_path, 'wb') as handle:
+        handle.write(MAGIC)
+        handle.write(struct.pack('<I', len(header)))
+        handle.write(header)
+        for column in columns:
+            handle.write(b'\0' * (-handle.tell() % ALIGNMENT))
+            column.tofile(handle)
+    os.replace(temporary_path, path)
+    return path
+
+
+class RateCache(object):
+    """
+    A memory-mapped cache file.
+
+    self.columns maps each column name to a memoryview of the mapping cast to
+    the column's type, so report generators can read them without copying.
+    Call close() (or use it as a context manager) once done with them.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.columns = dict()
+        with open(path, 'rb') as handle:
+            self._mapping = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+
+        try:
+            if self._mapping[:len(MAGIC)] != MAGIC:
+                raise ValueError("{0} is not a rate cache".format(path))
+            offset = len(MAGIC)
+            header_length, = struct.unpack_from('<I', self._mapping, offset)
+            offset += 4
+            self.header = json.loads(self._mapping[offset:offset + header_length].decode('utf-8'))
+            offset += header_length
+
+            if (self.header['version'] != CACHE_VERSION
+                    or self.header['byteorder'] != sys.byteorder):
+                raise ValueError("{0} was written by an incompatible version".format(path))
+
+            self._view = memoryview(self._mapping)
+            rows = self.header['rows']
+            for name, typecode, itemsize in self.header['columns']:
+                if array(typecode).itemsize != itemsize:
+                    raise ValueError("{0} was written on an incompatible platform".format(path))
+                offset += -offset % ALIGNMENT
+                self.columns[name] = self._view[offset:offset + rows * itemsize].cast(typecode)
+                offset += rows * itemsize
+        except Exception:
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return self.header['rows']
+
+    def is_fresh(self, source):
+        """ True if the cache was written from the current content of source. """
+        return self.header['source'] == _source_state(source)
+
+    def hotels(self):
+        """ Rebuild a RateIndex for each hotel stored in the cache. """
+        strings = self.header['strings']
+        rate_indexes = []
+        for hotel in self.header['hotels']:
+            rate_index = RateIndex(hotel['code'], hotel['currency'])
+            for room, description in hotel['rooms']:
+                rate_index.add_room(room, description)
+            rate_indexes.append(rate_index)
+
+        columns = [self.columns[name] for name, _, _ in COLUMNS]
+        missing = [default for _, _, default in COLUMNS[6:]]
+        for row in zip(*columns):
+            details = [_detail(value, default) for value, default in zip(row[6:], missing)]
+            rate_indexes[row[0]].add_range(RateRange(
+                strings[row[1]], strings[row[2]], row[3], row[4], row[5], *details))
+        return rate_indexes
+
+    def close(self):
+        """ Release the column views and unmap the file. """
+        for column in self.columns.values():
+            column.release()
+        self.columns = dict()
+        if getattr(self, '_view', None) is not None:
+            self._view.release()
+            self._view = None
+        if self._mapping is not None:
+            self._mapping.close()
+            self._mapping = None
+
+
+def is_current(source):
+    """ True if source has a cache written from its current content. """
+    path = cache_path(source)
+    if not os.path.isfile(path):
+        return False
+    try:
+        with RateCache(path) as cache:
+            return cache.is_fresh(source)
+    except (ValueError, KeyError, struct.error, EnvironmentError):
+        return False
+
+
+def load(source):
+    """ Return the RateIndex of every hotel in source from its cache, or None
+    if there is no usable cache for the current content of source. """
+    path = cache_path(source)
+    if not os.path.isfile(path):
+        return None
+    try:
+        with RateCache(path) as cache:
+            if not cache.is_fresh(source):
+                return None
+            return cache.hotels()
+    except (ValueError, KeyError, struct.error, EnvironmentError):
+        return None
@@ -0,0 +1,234 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Differences between two snapshots of the rates, such as yesterday's and
+today's feed, so that downstream systems only have to push what moved.
+
+Every hotel, room and rate code schedule is hashed, and the hashes of the
+two snapshots are compared from the top down: a hotel whose hash did not
+change is skipped whole, and within a changed hotel so is every room, and
+every rate of a room, whose hash did not change. Only the schedules that
+differ are swept day by day, and runs of consecutive days with the same old
+and new terms become one entry of the report:
+
+    {"start": "2018-08-22", "end": "2018-08-24", "old": [146.0], "new": [150.0]}
+
+old and new are the room prices on those days, in feed order, empty where
+there were no rates; "terms": true marks days on which only other terms
+(extra adult or child prices, occupancy, minimum stay) changed.
+
+Usage:
+    python ratediff.py PREVIOUS CURRENT [--json FILE] [--html FILE]
+
+PREVIOUS and CURRENT are XML files, directories searched for
+rates.input.xml files, or rate stores. Without --json the JSON report is
+written to stdout.
+"""
+
+from collections import OrderedDict
+import argparse
+import datetime
+import hashlib
+import json
+import os.path
+import sys
+
+# Fields of a RateRange compared day by day, besides the room and rate code
+TERMS = ['room_price', 'extra_adult', 'child_price', 'minimum_nite_stay',
+         'adults', 'kids', 'occupancy', 'basis']
+
+
+def _digest(parts):
+    digest = hashlib.sha1()
+    for part in parts:
+        digest.update(repr(part).encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def schedules(rate_index):
+    """ The ranges of a hotel as an OrderedDict of room -> OrderedDict of rate
+    code -> [RateRange], in feed order. """
+    by_room = OrderedDict((room, OrderedDict()) for room in rate_index.rooms)
+    for rate_range in rate_index.ranges:
+        by_room.setdefault(rate_range.room, OrderedDict()).setdefault(rate_range.rate, []).append(rate_range)
+    return by_room
+
+
+def _terms(rate_range):
+    return tuple(getattr(rate_range, term) for term in TERMS)
+
+
+def schedule_hashes(rate_index, by_room=None):
+    """
+    @input a hotel's RateIndex, and optionally its schedules()
+    @returns the hash of the hotel's whole schedule, and an OrderedDict of
+        room -> (hash of the room, OrderedDict of rate code -> hash of its ranges)
+    """
+    rooms = OrderedDict()
+    for room, rates in (schedules(rate_index) if by_room is None else by_room).items():
+        rate_hashes = OrderedDict(
+            (rate, _digest((rate_range.start, rate_range.end) + _terms(rate_range) for rate_range in ranges))
+            for rate, ranges in rates.items())
+        rooms[room] = (_digest([rate_index.rooms.get(room, "")] + list(rate_hashes.items())),
+                       rate_hashes)
+    hotel_hash = _digest([rate_index.currency] + [(room, room_hash) for room, (room_hash, _) in rooms.items()])
+    return hotel_hash, rooms
+
+
+def _days(rate_ranges):
+    """ Day ordinal -> tuple of the terms of every one of rate_ranges covering it. """
+    days = dict()
+    for rate_range in rate_ranges:
+        terms = _terms(rate_range)
+        for day in range(rate_range.start, rate_range.end + 1):
+            days[day] = days.get(day, ()) + (terms,)
+    return days
+
+
+def schedule_changes(old_ranges, new_ranges):
+    """ Runs of consecutive days on which the terms of two schedules of a room
+    and rate differ, as report entries. """
+    old_days, new_days = _days(old_ranges), _days(new_ranges)
+
+    runs = []
+    for day in sorted(set(old_days) | set(new_days)):
+        old, new = old_days.get(day, ()), new_days.get(day, ())
+        if old == new:
+            continue
+        last = runs[-1] if runs else None
+        if last is not None and last['end'] == day - 1 and last['old_terms'] == old and last['new_terms'] == new:
+            last['end'] = day
+        else:
+            runs.append({'start': day, 'end': day, 'old_terms': old, 'new_terms': new})
+
+    changes = []
+    for run in runs:
+        change = OrderedDict([
+            ('start', datetime.date.fromordinal(run['start']).isoformat()),
+            ('end', datetime.date.fromordinal(run['end']).isoformat()),
+            ('old', [terms[0] for terms in run['old_terms']]),
+            ('new', [terms[0] for terms in run['new_terms']]),
+        ])
+        if change['old'] == change['new']:
+            change['terms'] = True
+        changes.append(change)
+    return changes
+
+
+def diff_hotel(previous, current):
+    """ The changes to one hotel between two RateIndex objects, either of
+    which may be None, or None if nothing changed. """
+    if previous is None:
+        return OrderedDict([('status', 'added'), ('rooms', list(current.rooms))])
+    if current is None:
+        return OrderedDict([('status', 'removed'), ('rooms', list(previous.rooms))])
+
+    old_schedules, new_schedules = schedules(previous), schedules(current)
+    old_hash, old_rooms = schedule_hashes(previous, old_schedules)
+    new_hash, new_rooms = schedule_hashes(current, new_schedules)
+    if old_hash == new_hash:
+        return None
+
+    report = OrderedDict([('status', 'changed')])
+    if previous.currency != current.currency:
+        report['currency'] = [previous.currency, current.currency]
+    report['rooms_added'] = [room for room in new_rooms if room not in old_rooms]
+    report['rooms_removed'] = [room for room in old_rooms if room not in new_rooms]
+    report['rooms'] = OrderedDict()
+    for room, (room_hash, new_rates) in new_rooms.items():
+        if room not in old_rooms or old_rooms[room][0] == room_hash:
+            continue
+        old_rates = old_rooms[room][1]
+        room_report = OrderedDict()
+        if previous.rooms.get(room, "") != current.rooms.get(room, ""):
+            room_report['description'] = [previous.rooms.get(room, ""), current.rooms.get(room, "")]
+        room_report['rates_added'] = [rate for rate in new_rates if rate not in old_rates]
+        room_report['rates_removed'] = [rate for rate in old_rates if rate not in new_rates]
+        room_report['rates'] = OrderedDict()
+        for rate in list(old_rates) + room_report['rates_added']:
+            if old_rates.get(rate) == new_rates.get(rate):
+                continue
+            changes = schedule_changes(old_schedules[room].get(rate, []), new_schedules[room].get(rate, []))
+            if changes:
+                room_report['rates'][rate] = changes
+        if any(room_report.values()):
+            report['rooms'][room] = room_report
+
+    if not any(value for key, value in report.items() if key != 'status'):
+        # Only the order of the feed changed
+        return None
+    return report
+
+
+def diff(previous, current):
+    """
+    @input two snapshots, each an OrderedDict of hotel code -> RateIndex
+    @returns the change report, see the module documentation
+    """
+    hotels = OrderedDict()
+    unchanged = 0
+    for code in list(previous) + [code for code in current if code not in previous]:
+        report = diff_hotel(previous.get(code), current.get(code))
+        if report is None:
+            unchanged += 1
+        else:
+            hotels[code] = report
+
+    statuses = [report['status'] for report in hotels.values()]
+    return OrderedDict([
+        ('summary', OrderedDict([
+            ('added', statuses.count('added')),
+            ('removed', statuses.count('removed')),
+            ('changed', statuses.count('changed')),
+            ('unchanged', unchanged),
+        ])),
+        ('hotels', hotels),
+    ])
+
+
+def render_html(report, environment, previous=None, current=None, self_contained=False):
+    """ @returns a generator over the HTML page of a change report """
+    template = environment.get_template('rate_changes.jinja2.html')
+    for chunk in template.generate(report=report, previous=previous, current=current,
+                                   self_contained=self_contained):
+        yield chunk
+
+
+def main(argv, template_environment=None):
+    """ template_environment() returns the Jinja2 environment to render --html with. """
+    parser = argparse.ArgumentParser(description="Report what changed between two snapshots of the rates.")
+    parser.add_argument('previous', help="XML file, search directory or rate store")
+    parser.add_argument('current', help="XML file, search directory or rate store")
+    parser.add_argument('--json', metavar='FILE', help="write the JSON report to FILE instead of stdout")
+    parser.add_argument('--html', metavar='FILE', help="also write the report as an HTML page")
+    arguments = parser.parse_args(argv)
+
+    import ratestore
+    for path in (arguments.previous, arguments.current):
+        if not os.path.exists(path):
+            raise SystemExit("Specified snapshot {0} does not exist.".format(path))
+    report = diff(ratestore.load_hotels([arguments.previous]), ratestore.load_hotels([arguments.current]))
+
+    from outputwriter import exit_on_closed_pipe, write_atomic
+    if arguments.json:
+        write_atomic(arguments.json, [json.dumps(report, indent=1)])
+    else:
+        with exit_on_closed_pipe():
+            print(json.dumps(report, indent=1))
+    if arguments.html:
+        if template_environment is None:
+            raise SystemExit("HTML reports are written through htmlgenerator.py diff.")
+        write_atomic(arguments.html, render_html(
+            report, template_environment(), arguments.previous, arguments.current))
+
+    summary = report['summary']
+    print("{0} added, {1} removed, {2} changed, {3} unchanged hotel(s)".format(
+        summary['added'], summary['removed'], summary['changed'], summary['unchanged']),
+        file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,360 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Flat export of the rates for analytics: one record per <date> range, or per
+day of every range, as JSON lines or CSV, optionally gzip'ed.
+
+Records are streamed from the feed through a pipeline of generators, from
+the parser's events to rows to encoded and compressed chunks, so memory use
+stays flat however large the feed is. A range record looks like:
+
+    {"hotel":"AAAAAA","currency":"usd","room":"DELUXE","rate":"DELUXE",
+     "start":"2018-08-22","end":"2018-08-24","room_price":146.0,...}
+
+and a day record has a "date" in place of "start" and "end". Missing terms
+are null in JSON lines and empty in CSV.
+
+With --shard every hotel is written to a file of its own in a directory,
+named after its hotel code, and the hotels are shared out between --jobs
+worker processes by the byte ranges they span, the way ratesplit splits the
+unsplit rates.xml.
+
+Usage:
+    python rateexport.py INPUT... [--pattern GLOB] [--per range|day] [--format jsonl|csv]
+                         [--output FILE | --shard DIRECTORY [--jobs N]]
+                         [--gzip] [--from YYYY-MM-DD] [--to YYYY-MM-DD]
+
+INPUT is an XML file, a directory searched for rates.input.xml files or a
+rate store. Without --output or --shard records are written to stdout.
+"""
+
+from collections import OrderedDict
+import argparse
+import csv
+import datetime
+import io
+import json
+import mmap
+import os
+import os.path
+import sys
+import zlib
+
+import ratefeed
+import ratesplit
+import ratestore
+from outputwriter import exit_on_closed_pipe, write_atomic
+from rateindex import TERMS, to_ordinal
+
+# Fields of each kind of record, see Records
+FIELDS = {
+    'range': ('hotel', 'currency', 'room', 'rate', 'start', 'end') + TERMS[2:],
+    'day': ('hotel', 'currency', 'room', 'rate', 'date') + TERMS[2:],
+}
+
+# Encoded rows are handed on this many at a time
+BATCH_ROWS = 512
+
+
+def index_events(rate_index):
+    """ The ratefeed.iter_events() events of a stored RateIndex. """
+    yield ('hotel', rate_index.hotel_code, rate_index.currency)
+    for room, description in rate_index.rooms.items():
+        yield ('room', room, description)
+    for rate_range in rate_index.ranges:
+        yield ('range', rate_range)
+    yield ('end', rate_index.hotel_code)
+
+
+class Records(object):
+    """
+    The records of ratefeed.iter_events() events, one per range or per day of
+    every range, clipped to the start and end day ordinals if given; ranges
+    outside of them are left out. Iterating gives a (head, first day, last
+    day, terms) span for each range, where head is (hotel, currency, room,
+    rate) and terms are the rest of FIELDS[per]: the day records of a range
+    share everything but their date, so encoders only encode the rest once.
+    self.count is the number of records iterated over so far.
+    """
+
+    def __init__(self, events, per='range', start=None, end=None):
+        self.events = events
+        self.per = per
+        self.fields = FIELDS[per]
+        self.start = start
+        self.end = end
+        self.count = 0
+        self._dates = dict()
+
+    def iso(self, ordinal):
+        """ ISO date of a day ordinal. Day records repeat the same few hundred
+        dates over and over. """
+        date = self._dates.get(ordinal)
+        if date is None:
+            date = self._dates[ordinal] = datetime.date.fromordinal(ordinal).isoformat()
+        return date
+
+    def __iter__(self):
+        hotel = currency = None
+        for event in self.events:
+            if event[0] == 'hotel':
+                hotel, currency = event[1], event[2]
+            if event[0] != 'range':
+                continue
+            rate_range = event[1]
+            first = rate_range.start if self.start is None else max(rate_range.start, self.start)
+            last = rate_range.end if self.end is None else min(rate_range.end, self.end)
+            if first > last:
+                continue
+            self.count += last - first + 1 if self.per == 'day' else 1
+            yield (hotel, currency, rate_range.room, rate_range.rate), first, last, tuple(rate_range[4:])
+
+    def rows(self):
+        """ Generator over every record as a tuple of FIELDS[per]. """
+        for head, first, last, terms in self:
+            if self.per == 'day':
+                for day in range(first, last + 1):
+                    yield head + (self.iso(day),) + terms
+            else:
+                yield head + (self.iso(first), self.iso(last)) + terms
+
+
+class _Lines(list):
+    """ A list csv.writer can write rows into. """
+    write = list.append
+
+
+def csv_chunks(records, header=True):
+    """ Generator over the Records as CSV text, about BATCH_ROWS rows per chunk. """
+    cells = _Lines()
+    writer = csv.writer(cells, lineterminator='')
+    lines = []
+    if header:
+        writer.writerow(records.fields)
+        lines.append(cells.pop() + '\n')
+    for head, first, last, terms in records:
+        writer.writerow(head)
+        writer.writerow(terms)
+        head, terms = cells.pop(0), cells.pop()
+        if records.per == 'day':
+            lines.extend(head + ',' + records.iso(day) + ',' + terms + '\n' for day in range(first, last + 1))
+        else:
+            lines.append(','.join((head, records.iso(first), records.iso(last), terms)) + '\n')
+        if len(lines) >= BATCH_ROWS:
+            yield ''.join(lines)
+            lines = []
+    if lines:
+        yield ''.join(lines)
+
+
+def jsonl_chunks(records):
+    """ Generator over the Records as JSON lines, about BATCH_ROWS rows per chunk. """
+    encoder = json.JSONEncoder(separators=(',', ':'))
+    head_fields, term_fields = records.fields[:4], TERMS[2:]
+    lines = []
+    for head, first, last, terms in records:
+        # Split at the braces, to put the dates in between
+        head = encoder.encode(OrderedDict(zip(head_fields, head)))[:-1]
+        terms = encoder.encode(OrderedDict(zip(term_fields, terms)))[1:]
+        if records.per == 'day':
+            lines.extend('{0},"date":"{1}",{2}\n'.format(head, records.iso(day), terms)
+                         for day in range(first, last + 1))
+        else:
+            lines.append('{0},"start":"{1}","end":"{2}",{3}\n'.format(
+                head, records.iso(first), records.iso(last), terms))
+        if len(lines) >= BATCH_ROWS:
+            yield ''.join(lines)
+            lines = []
+    if lines:
+        yield ''.join(lines)
+
+
+def encode(records, output_format):
+    """ The Records as chunks of text in output_format, 'jsonl' or 'csv'. """
+    if output_format == 'csv':
+        return csv_chunks(records)
+    return jsonl_chunks(records)
+
+
+def gzip_chunks(chunks, level=6):
+    """ Generator over chunks compressed into one gzip stream. The header has no
+    file name or time stamp, so the same records compress identically. """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export(events, path, per='range', output_format='jsonl', compress=False, start=None, end=None):
+    """
+    Stream the records of events to path, or to stdout if path is None.
+        @returns the number of records written
+    """
+    records = Records(events, per, start, end)
+    chunks = encode(records, output_format)
+    if compress:
+        chunks = gzip_chunks(chunks)
+    if path is not None:
+        write_atomic(path, chunks)
+        return records.count
+
+    with exit_on_closed_pipe() as stdout:
+        output = getattr(stdout, 'buffer', stdout)
+        for chunk in chunks:
+            output.write(chunk if isinstance(chunk, bytes) else chunk.encode('utf-8'))
+        output.flush()
+    return records.count
+
+
+def input_events(paths):
+    """ Generator over the events of every hotel of the given input files, in order. """
+    for path in paths:
+        if ratestore.is_database(path):
+            with ratestore.RateStore(path, read_only=True) as store:
+                for rate_index in store.load_all():
+                    for event in index_events(rate_index):
+                        yield event
+        else:
+            for event in ratefeed.iter_events(path):
+                yield event
+
+
+def plan_shards(paths, jobs=1):
+    """
+    @input input files and the number of worker processes
+    @returns a list of (path, [(hotel, shard name)]) tasks, covering every
+        hotel once. hotel is the byte offset of its <hotel> tag in an XML file,
+        or its code in a rate store. Shards are named after the hotel code,
+        with _2, _3... for codes seen before, as ratesplit names directories
+    """
+    found = []
+    for path in paths:
+        if ratestore.is_database(path):
+            with ratestore.RateStore(path, read_only=True) as store:
+                found.extend((path, code, code) for code in store.hotel_codes())
+        elif os.path.getsize(path) > 0:
+            with open(path, 'rb') as handle:
+                buffer = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+                try:
+                    found.extend((path, start, code) for start, code in ratesplit.hotel_offsets(buffer))
+                finally:
+                    buffer.close()
+
+    names = [name for _, name in ratesplit.directory_names(
+        [(hotel, code) for _, hotel, code in found])]
+    by_path = dict()
+    for (path, hotel, _), name in zip(found, names):
+        by_path.setdefault(path, []).append((hotel, name))
+
+    tasks = []
+    for path in paths:
+        hotels = by_path.get(path, [])
+        if not hotels:
+            continue
+        if ratestore.is_database(path):
+            size = max(1, -(-len(hotels) // jobs))
+            tasks.extend((path, hotels[index:index + size]) for index in range(0, len(hotels), size))
+        else:
+            tasks.extend((path, group) for group in ratesplit.byte_ranges(hotels, os.path.getsize(path), jobs))
+    return tasks
+
+
+def shard_events(path, hotels):
+    """ Generator over (shard name, events) for the given (hotel, shard name)
+    tuples of a plan_shards() task, one hotel in memory at a time. """
+    if ratestore.is_database(path):
+        with ratestore.RateStore(path, read_only=True) as store:
+            for code, name in hotels:
+                yield name, index_events(store.load(code))
+        return
+
+    with open(path, 'rb') as handle:
+        buffer = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            prefix = ratesplit.declaration_prefix(buffer)
+            for start, name in hotels:
+                hotel = io.BytesIO(prefix + buffer[start:ratesplit.hotel_end(buffer, start)])
+                yield name, ratefeed.iter_events(hotel)
+        finally:
+            buffer.close()
+
+
+def export_shards(path, hotels, directory, per='range', output_format='jsonl', compress=False,
+                  start=None, end=None):
+    """ Export each hotel of a plan_shards() task to its own file in directory.
+        @returns a list of (written path, number of records) tuples """
+    written = []
+    for name, events in shard_events(path, hotels):
+        shard = os.path.join(directory, name + '.' + output_format + ('.gz' if compress else ''))
+        written.append((shard, export(events, shard, per, output_format, compress, start, end)))
+    return written
+
+
+def _day(value):
+    """ argparse type of --from and --to. """
+    try:
+        return to_ordinal(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError("invalid date {0!r}, expected YYYY-MM-DD".format(value))
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Export the rates as flat JSON lines or CSV records.")
+    parser.add_argument('inputs', nargs='+', metavar='input',
+                        help="XML file, search directory or rate store")
+    parser.add_argument('--pattern', action='append', dest='patterns', metavar='GLOB',
+                        help="file name pattern to search directories for, such as *.xml "
+                             "(repeatable, default: rates.input.xml)")
+    parser.add_argument('--per', choices=sorted(FIELDS), default='range',
+                        help="one record per <date> range (default) or per day")
+    parser.add_argument('--format', dest='output_format', choices=['jsonl', 'csv'],
+                        help="default: from the --output file name, else jsonl")
+    parser.add_argument('--gzip', action='store_true',
+                        help="gzip the output (default for --output names ending in .gz)")
+    parser.add_argument('--from', dest='start', type=_day, metavar='YYYY-MM-DD',
+                        help="leave out the days before this date")
+    parser.add_argument('--to', dest='end', type=_day, metavar='YYYY-MM-DD',
+                        help="leave out the days after this date")
+    destination = parser.add_mutually_exclusive_group()
+    destination.add_argument('--output', '-o', metavar='FILE', help="default: stdout")
+    destination.add_argument('--shard', metavar='DIRECTORY',
+                             help="write each hotel to DIRECTORY/(hotel code).(format)[.gz]")
+    parser.add_argument('--jobs', type=int, default=1, metavar='N',
+                        help="worker processes exporting the hotels of --shard")
+    arguments = parser.parse_args(argv)
+
+    for path in arguments.inputs:
+        if not os.path.exists(path):
+            raise SystemExit("Specified input {0} does not exist.".format(path))
+    output = arguments.output if arguments.output not in (None, '-') else None
+    compress = arguments.gzip or (output or '').endswith('.gz')
+    output_format = arguments.output_format or (
+        'csv' if (output or '').replace('.gz', '').endswith('.csv') else 'jsonl')
+    options = (arguments.per, output_format, compress, arguments.start, arguments.end)
+    paths = list(ratestore.input_files(arguments.inputs, arguments.patterns))
+
+    if arguments.shard is None:
+        count = export(input_events(paths), output, *options)
+        print("Exported {0} record(s) to {1}".format(count, output or "stdout"), file=sys.stderr)
+        return 0
+
+    tasks = plan_shards(paths, max(1, arguments.jobs))
+    if arguments.jobs > 1 and len(tasks) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=arguments.jobs) as executor:
+            futures = [executor.submit(export_shards, path, hotels, arguments.shard, *options)
+                       for path, hotels in tasks]
+            written = [shard for future in futures for shard in future.result()]
+    else:
+        written = [shard for path, hotels in tasks
+                   for shard in export_shards(path, hotels, arguments.shard, *options)]
+    print("Exported {0} record(s) of {1} hotel(s) to {2}".format(
+        sum(count for _, count in written), len(written), arguments.shard), file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,146 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Streaming reader for hotel rate XML.
+
+The XML is read incrementally with xml.etree.ElementTree.iterparse and every
+<date> element is cleared as soon as its rate record has been taken out of
+it, so memory use stays flat whether the input is one of the split
+hotel_N.xml files or the original, unsplit rates.xml holding every hotel.
+"""
+
+import xml.etree.ElementTree as ElementTree
+
+from rateindex import RateIndex, RateRange, to_ordinal
+
+
+def _text_float(element, tag):
+    """ Float value of a child element's text, or None if it is missing. """
+    child = element.find(tag)
+    if child is None or child.text is None or not child.text.strip():
+        return None
+    return float(child.text.strip())
+
+
+def _attribute_int(element, attribute):
+    """ Integer value of an attribute, or None if it is missing or not a number. """
+    if element is None:
+        return None
+    value = element.get(attribute, "").strip()
+    return int(value) if value.isdigit() else None
+
+
+def _rate_range(date_element, room, rate):
+    """ Build a RateRange out of a closed <date> element, or return None for
+    blackout ranges and other <date> tags without a room price. """
+    room_price = _text_float(date_element, 'room_price')
+    if room_price is None:
+        return None
+
+    occupancy = date_element.find('occupancy')
+    minimum_nite_stay = date_element.find('minimum_nite_stay')
+    if minimum_nite_stay is not None and minimum_nite_stay.get('status') != 'y':
+        minimum_nite_stay = None
+
+    return RateRange(
+        room, rate,
+        to_ordinal(date_element.get('start')), to_ordinal(date_element.get('end')),
+        room_price,
+        extra_adult=_text_float(date_element, 'extra_adult'),
+        child_price=_text_float(date_element, 'child_price'),
+        minimum_nite_stay=_attribute_int(minimum_nite_stay, 'value'),
+        adults=_attribute_int(occupancy, 'adults'),
+        kids=_attribute_int(occupancy, 'kids'),
+        occupancy=_attribute_int(occupancy, 'total'),
+        basis=_attribute_int(date_element.find('room_price'), 'basis'))
+
+
+def iter_events(source):
+    """
+    Generator over the rate records of an XML file path or file object.
+
+    Yields tuples of the following kinds, in document order:
+        ('hotel', code, currency)        when a <hotel> opens
+        ('room', name, description)      once per <room>
+        ('range', RateRange)             for each priced <date>
+        ('end', code)                    when a <hotel> closes
+    """
+    root = None
+    stack = []
+    hotel = None
+    room = None
+    room_announced = False
+    rate = None
+
+    for event, element in ElementTree.iterparse(source, events=('start', 'end')):
+        tag = element.tag
+
+        if event == 'start':
+            if root is None:
+                root = element
+            stack.append(tag)
+
+            if tag == 'hotel':
+                hotel = element.get('code')
+                yield ('hotel', hotel, element.get('currency'))
+            elif tag == 'room':
+                room = element.get('name')
+                room_announced = False
+            elif tag == 'rate':
+                rate = element.get('code')
+            continue
+
+        stack.pop()
+        parent = stack[-1] if stack else None
+
+        if tag == 'description' and parent == 'room' and not room_announced:
+            room_announced = True
+            yield ('room', room, (element.text or "").strip())
+        elif tag == 'date' and parent == 'rate':
+            if not room_announced:
+                room_announced = True
+                yield ('room', room, "")
+            rate_range = _rate_range(element, room, rate)
+            element.clear()
+            if rate_range is not None:
+                yield ('range', rate_range)
+        elif tag == 'room':
+            if not room_announced:
+                yield ('room', room, "")
+            element.clear()
+        elif tag == 'hotel':
+            yield ('end', hotel)
+            element.clear()
+            # Drop the finished hotel from the document root as well, otherwise
+            # a multi-hotel rates.xml keeps an empty shell per hotel around
+            if root is not element:
+                root.clear()
+
+
+def iter_hotels(source):
+    """ Generator yielding a RateIndex for each <hotel> of an XML file path or
+    file object. Only one hotel is held in memory at a time. """
+    rate_index = None
+    for event in iter_events(source):
+        kind = event[0]
+        if kind == 'hotel':
+            rate_index = RateIndex(event[1], event[2])
+        elif kind == 'room':
+            rate_index.add_room(event[1], event[2])
+        elif kind == 'range':
+            rate_index.add_range(event[1])
+        elif kind == 'end':
+            yield rate_index
+            rate_index = None
+
+
+def iter_records(source):
+    """ Generator yielding a (hotel code, RateRange) tuple for every priced
+    <date> of an XML file path or file object as soon as it has been read. """
+    hotel = None
+    for event in iter_events(source):
+        if event[0] == 'hotel':
+            hotel = event[1]
+        elif event[0] == 'range':
+            yield (hotel, event[1])
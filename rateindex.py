@@ -0,0 +1,351 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Interval-based index of the <date> rate ranges found in a hotel's XML.
+
+Each <date start="..." end="..."> range is parsed once into a pair of
+ordinal integers (datetime.date.toordinal()) so that looking up the rates
+for a day, a room or a window of days never has to re-split or re-convert
+the date strings again. Day-by-day views are produced with a sweep line over
+the sorted range boundaries instead of testing every range against every day.
+
+Chain-wide feeds repeat the same dates, prices and whole rate schedules
+across rooms and hotels. Every value of an added range is interned, so that
+equal values are one shared object however many ranges hold them, and work
+done on a schedule can be kept in a ScheduleCache under its schedule_key() to
+be reused wherever the same schedule recurs.
+"""
+
+from collections import OrderedDict, namedtuple
+from bisect import bisect_right
+import datetime
+
+# A single <date> range of a <rate> belonging to a <room>. start and end are
+# inclusive day ordinals, prices are floats, basis is the number of guests
+# room_price is for, and the remaining fields are None when the feed leaves
+# them out.
+RateRange = namedtuple('RateRange', ['room', 'rate', 'start', 'end', 'room_price',
+                                     'extra_adult', 'child_price', 'minimum_nite_stay',
+                                     'adults', 'kids', 'occupancy', 'basis'])
+RateRange.__new__.__defaults__ = (None,) * 7
+
+
+# Fields of a RateRange besides its room and rate, see schedule_key()
+TERMS = RateRange._fields[2:]
+
+
+def to_ordinal(value):
+    """ Convert a 'YYYY-MM-DD' string, date or ordinal to a day ordinal. """
+    if isinstance(value, int):
+        return value
+    if isinstance(value, datetime.date):
+        return value.toordinal()
+    year, month, day = value.strip().split('-')
+    return datetime.date(int(year), int(month), int(day)).toordinal()
+
+
+class Window(namedtuple('Window', ['start', 'end'])):
+    """
+    The inclusive range of dates pages are rendered for, such as a year or the
+    span given with --from and --to. Either end may be None for an open end,
+    which resolve() closes at the first or last day a hotel has rates.
+    """
+    __slots__ = ()
+
+    @classmethod
+    def year(cls, year):
+        """ The window of a whole calendar year. """
+        return cls(datetime.date(year, 1, 1), datetime.date(year, 12, 31))
+
+    @classmethod
+    def of(cls, value):
+        """ A Window out of a Window, a (start, end) pair or a year. """
+        if isinstance(value, cls):
+            return value
+        if isinstance(value, int):
+            return cls.year(value)
+        start, end = value
+        return cls(*[None if day is None else datetime.date.fromordinal(to_ordinal(day))
+                     for day in (start, end)])
+
+    def __str__(self):
+        if self.start is not None and self.end is not None:
+            if (self.start.year == self.end.year and (self.start.month, self.start.day) == (1, 1)
+                    and (self.end.month, self.end.day) == (12, 31)):
+                return str(self.start.year)
+            return "{0} to {1}".format(self.start.isoformat(), self.end.isoformat())
+        if self.start is not None:
+            return "{0} onwards".format(self.start.isoformat())
+        if self.end is not None:
+            return "up to {0}".format(self.end.isoformat())
+        return "every day with rates"
+
+    def resolve(self, *rate_indexes):
+        """ The window with its open ends closed at the first and last day any of
+        the given hotels has rates, or at its other end if they have none. """
+        if self.start is not None and self.end is not None:
+            return self
+        first_days = [rate_index.first_day for rate_index in rate_indexes if len(rate_index)]
+        last_days = [rate_index.last_day for rate_index in rate_indexes if len(rate_index)]
+        start = self.start or (min(first_days) if first_days else self.end)
+        end = self.end or (max(last_days) if last_days else start)
+        if start is None:
+            raise ValueError("A window without rates needs a start or an end")
+        return Window(start, end)
+
+    @property
+    def days(self):
+        """ Number of days in a resolved window. """
+        return max(0, (self.end - self.start).days + 1)
+
+    def months(self):
+        """ (year, month) of every month a resolved window touches, in order. """
+        months = []
+        year, month = self.start.year, self.start.month
+        while (year, month) <= (self.end.year, self.end.month):
+            months.append((year, month))
+            year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+        return months
+
+
+class Interner(object):
+    """
+    Canonical copies of values: intern() returns the first value it was given
+    that is equal to, and of the same type as, the one passed in. Once it holds
+    limit values it starts over, which bounds the memory of long-running watch
+    and serve processes.
+    """
+
+    def __init__(self, limit=1 << 16):
+        self.limit = limit
+        # Type -> value -> the canonical copy of that value
+        self._tables = dict()
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def intern(self, value):
+        if value is None:
+            return None
+        table = self._tables.get(value.__class__)
+        if table is None:
+            table = self._tables[value.__class__] = dict()
+        canonical = table.get(value)
+        if canonical is None:
+            if self._size >= self.limit:
+                self._tables = dict()
+                self._size = 0
+                table = self._tables[value.__class__] = dict()
+            canonical = table[value] = value
+            self._size += 1
+        return canonical
+
+    def intern_range(self, rate_range):
+        """ The RateRange with every one of its values interned. """
+        return RateRange._make([self.intern(value) for value in rate_range])
+
+
+# Shared by every RateIndex of the process
+INTERNER = Interner()
+
+
+def schedule_key(rate_ranges, prices_only=False):
+    """
+    Hashable form of a schedule, a list of ranges in document order, without
+    their room and rate: equal for identical schedules of any room, rate or
+    hotel. With prices_only only the dates and room prices are kept, for work
+    that does not depend on the other terms.
+    """
+    if prices_only:
+        return tuple((rate_range.start, rate_range.end, rate_range.room_price) for rate_range in rate_ranges)
+    return tuple(rate_range[2:] for rate_range in rate_ranges)
+
+
+class ScheduleCache(object):
+    """
+    Results worked out from rate schedules, keyed by schedule_key() (plus
+    whatever else they depend on), so that a schedule repeated in other rooms
+    or hotels is only worked on once per process. Results are shared by every
+    caller and must not be modified. Once it holds limit results it starts
+    over, like Interner.
+    """
+
+    def __init__(self, limit=1 << 14):
+        self.limit = limit
+        self.hits = 0
+        self.misses = 0
+        self._results = dict()
+
+    def __len__(self):
+        return len(self._results)
+
+    def get(self, key, compute):
+        """ The result stored under key, or else compute()'s, which is stored.
+        compute() must not return None. """
+        result = self._results.get(key)
+        if result is None:
+            self.misses += 1
+            if len(self._results) >= self.limit:
+                self._results = dict()
+            result = self._results[key] = compute()
+        else:
+            self.hits += 1
+        return result
+
+
+class RateIndex(object):
+    """
+    Rate ranges for one hotel, indexed by day ordinal.
+
+    Ranges are appended in document order with add(). Query methods sort
+    and bucket them lazily the first time they are needed, so adding more
+    ranges afterwards simply invalidates the buckets.
+    """
+
+    def __init__(self, hotel_code=None, currency=None):
+        self.hotel_code = hotel_code
+        self.currency = currency
+
+        # Room name -> room description, in document order
+        self.rooms = OrderedDict()
+
+        # Every RateRange in document order
+        self.ranges = []
+
+        # Lazily built lookup structures, see _build()
+        self._by_room = None
+
+    def __len__(self):
+        return len(self.ranges)
+
+    def __repr__(self):
+        return "<RateIndex {0}: {1} rooms, {2} ranges>".format(
+            self.hotel_code, len(self.rooms), len(self.ranges))
+
+    def add_room(self, name, description=""):
+        """ Register a room and its human readable description. """
+        self.rooms[name] = description
+
+    def add(self, room, rate, start, end, room_price, **details):
+        """ Add a <date> range. start and end may be strings, dates or ordinals,
+        details are the optional RateRange fields (extra_adult, occupancy...). """
+        return self.add_range(RateRange(room, rate, to_ordinal(start), to_ordinal(end),
+                                        room_price, **details))
+
+    def add_range(self, rate_range):
+        """ Add an already converted RateRange, interning its values. """
+        rate_range = INTERNER.intern_range(rate_range)
+        if rate_range.room not in self.rooms:
+            self.rooms[rate_range.room] = ""
+        self.ranges.append(rate_range)
+        self._by_room = None
+        return self
+
+    @property
+    def first_day(self):
+        """ First day covered by any range, or None if the index is empty. """
+        if not self.ranges:
+            return None
+        return datetime.date.fromordinal(min(r.start for r in self.ranges))
+
+    @property
+    def last_day(self):
+        """ Last day covered by any range, or None if the index is empty. """
+        if not self.ranges:
+            return None
+        return datetime.date.fromordinal(max(r.end for r in self.ranges))
+
+    def coverage(self, start, end):
+        """ @returns the number of days from start to end inclusive on which the
+            hotel has rates, and the number of (day, range) pairs on them, both
+            counted from the ranges without going through the days """
+        start, end = to_ordinal(start), to_ordinal(end)
+        clipped = sorted((max(rate_range.start, start), min(rate_range.end, end))
+                         for rate_range in self.ranges if rate_range.end >= start and rate_range.start <= end)
+        days = rates = 0
+        covered_until = start - 1
+        for first, last in clipped:
+            rates += last - first + 1
+            if last > covered_until:
+                days += last - max(first, covered_until + 1) + 1
+                covered_until = last
+        return days, rates
+
+    def _build(self):
+        """ Group ranges per room, sorted by start, for point lookups. """
+        if self._by_room is None:
+            by_room = dict()
+            for position, rate_range in enumerate(self.ranges):
+                by_room.setdefault(rate_range.room, []).append((rate_range.start, position))
+            for entries in by_room.values():
+                entries.sort()
+            self._by_room = dict(
+                (room, ([start for start, _ in entries], [position for _, position in entries]))
+                for room, entries in by_room.items())
+        return self._by_room
+
+    def ranges_for_room(self, room, day):
+        """ Return the RateRanges of a room that cover the given day. """
+        day = to_ordinal(day)
+        starts, positions = self._build().get(room, ((), ()))
+        # Only ranges starting on or before the day can cover it
+        candidates = positions[:bisect_right(starts, day)]
+        return [self.ranges[position] for position in sorted(candidates)
+                if self.ranges[position].end >= day]
+
+    def rates_for_room(self, room, day):
+        """ Return the list of room prices of a room on the given day. """
+        return [rate_range.room_price for rate_range in self.ranges_for_room(room, day)]
+
+    def rates_for_day(self, day):
+        """ Return every room price, in document order, for the given day. """
+        day = to_ordinal(day)
+        for _, prices in self.sweep(day, day):
+            return prices
+        return []
+
+    def rates_for_range(self, start, end, room=None):
+        """ Return a list of (date, [prices]) tuples for every day from start
+        to end inclusive, optionally restricted to a single room. """
+        return list(self.sweep(start, end, room))
+
+    def sweep(self, start, end, room=None):
+        """ Generator yielding (date, [prices]) for every day from start to end
+        inclusive. See sweep_ranges(). """
+        for day, rate_ranges in self.sweep_ranges(start, end, room):
+            yield (day, [rate_range.room_price for rate_range in rate_ranges])
+
+    def sweep_ranges(self, start, end, room=None):
+        """
+        Generator yielding (date, [RateRange]) for every day from start to end
+        inclusive.
+
+        Every range is clipped to the window and turned into an opening and a
+        closing event. Walking the days once while applying the events keeps
+        the set of active ranges current, so each day costs only as much as
+        the number of ranges that actually cover it.
+        """
+        start, end = to_ordinal(start), to_ordinal(end)
+        if end < start:
+            return
+
+        openings = dict()
+        closings = dict()
+        for position, rate_range in enumerate(self.ranges):
+            if room is not None and rate_range.room != room:
+                continue
+            if rate_range.end < start or rate_range.start > end:
+                continue
+            openings.setdefault(max(rate_range.start, start), []).append(position)
+            closings.setdefault(min(rate_range.end, end) + 1, []).append(position)
+
+        active = set()
+        for ordinal in range(start, end + 1):
+            if ordinal in closings:
+                active.difference_update(closings[ordinal])
+            if ordinal in openings:
+                active.update(openings[ordinal])
+            yield (datetime.date.fromordinal(ordinal),
+                   [self.ranges[position] for position in sorted(active)])
@@ -0,0 +1,120 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Compact per-month rate data for the calendar page.
+
+Instead of one JSON object holding every room's prices for every day of the
+year, the rates of a hotel are split into one small JSON shard per month,
+which the calendar page only fetches once that month is opened. A shard
+looks like:
+
+    {"month": "2018-08", "runs": [[0, 1, 14, 14600], [3, 1, 31, 7200, 7400], ...]}
+
+Each run is [room number, first day, last day, price, price...]: the room's
+position in the room list written into the page, the first and last day of
+the month on which the room has exactly these prices, and the prices in
+integer cents, in document order. Days without rates have no run.
+
+The runs of a room only depend on its own schedule, so they are worked out
+per room, from the boundaries of its ranges rather than day by day, and kept
+in a ScheduleCache for every other room and hotel with the same schedule.
+"""
+
+from bisect import bisect_right
+from collections import OrderedDict
+import datetime
+import json
+
+from rateindex import ScheduleCache, schedule_key, to_ordinal
+from ratesummary import month_starts
+
+# Shards are written next to the pages of a hotel, under this directory
+SHARD_DIRECTORY = 'rates'
+
+
+def shard_name(month):
+    """ Output file name of the shard of a 'YYYY-MM' month. """
+    return "{0}/{1}.json".format(SHARD_DIRECTORY, month)
+
+
+def cents(price):
+    """ A float price as integer cents. """
+    return int(round(price * 100))
+
+
+# (window, schedule_key()) -> the room_runs() of that schedule in that window
+_RUNS = ScheduleCache()
+
+
+def room_runs(rate_ranges, start, end):
+    """
+    @input the ranges of one room in document order, and the first and last
+        day ordinals of the window to cover
+    @returns a list of (first day, last day, [prices in cents]) tuples, one for
+        each run of consecutive days with the same prices, in day order
+    """
+    openings = dict()
+    closings = dict()
+    for position, rate_range in enumerate(rate_ranges):
+        if rate_range.end < start or rate_range.start > end:
+            continue
+        openings.setdefault(max(rate_range.start, start), []).append(position)
+        closings.setdefault(min(rate_range.end, end) + 1, []).append(position)
+
+    runs = []
+    active = set()
+    boundaries = sorted(set(openings) | set(closings))
+    for first, following in zip(boundaries, boundaries[1:]):
+        active.difference_update(closings.get(first, ()))
+        active.update(openings.get(first, ()))
+        if not active:
+            continue
+        prices = [cents(rate_ranges[position].room_price) for position in sorted(active)]
+        if runs and runs[-1][1] == first - 1 and runs[-1][2] == prices:
+            runs[-1] = (runs[-1][0], following - 1, prices)
+        else:
+            runs.append((first, following - 1, prices))
+    return runs
+
+
+def month_shards(rate_index, start, end, cache=_RUNS):
+    """
+    @input a hotel's RateIndex, the window of days to cover and optionally the
+        ScheduleCache to keep the runs of its rooms in
+    @returns an OrderedDict of 'YYYY-MM' -> shard dict for every month in the
+        window in which the hotel has rates, holding the runs by first day and
+        room
+    """
+    start, end = to_ordinal(start), to_ordinal(end)
+    boundaries = month_starts(start, end)
+    by_room = OrderedDict((room, []) for room in rate_index.rooms)
+    for rate_range in rate_index.ranges:
+        by_room[rate_range.room].append(rate_range)
+
+    # (month index, first day, room number, run)
+    entries = []
+    for room_number, rate_ranges in enumerate(by_room.values()):
+        if not rate_ranges:
+            continue
+        for first, last, prices in cache.get((start, end, schedule_key(rate_ranges, prices_only=True)),
+                                             lambda: room_runs(rate_ranges, start, end)):
+            # Cut the run at month boundaries, days counting from 1 in each month
+            month = bisect_right(boundaries, first) - 1
+            while first <= last:
+                run_end = min(last, boundaries[month + 1] - 1)
+                entries.append((month, first, room_number, [
+                    room_number, first - boundaries[month] + 1, run_end - boundaries[month] + 1] + prices))
+                first = run_end + 1
+                month += 1
+
+    shards = OrderedDict()
+    for month, _, _, run in sorted(entries, key=lambda entry: entry[:3]):
+        name = datetime.date.fromordinal(boundaries[month]).isoformat()[:7]
+        shards.setdefault(name, OrderedDict([('month', name), ('runs', [])]))['runs'].append(run)
+    return shards
+
+
+def encode(data):
+    """ JSON without insignificant whitespace. """
+    return json.dumps(data, separators=(',', ':'))
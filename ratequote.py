@@ -0,0 +1,304 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Stay quotes: the total price of check-in D, N nights, A adults and K kids in
+a room, for the booking front-end.
+
+A night's price is the room_price of the <date> range covering it, for
+basis guests, plus extra_adult for every adult beyond basis and child_price
+for every kid. A rate cannot be booked for a night on which the party does
+not fit its occupancy (adults, kids and total guests), or needs a price the
+feed leaves out, and a stay must last at least the minimum_nite_stay of its
+check-in night. Where ranges of the same room and rate overlap, the one
+later in the feed wins.
+
+For each room, rate and party, the nightly prices of every day the rate
+covers are summed up once into a prefix sum array, in integer cents so that
+subtracting two sums is exact, next to a running count of the nights that
+cannot be booked. Any stay is then priced with two subtractions, however
+long it is:
+
+    total = totals[check_in + nights] - totals[check_in]
+    bookable = blocked[check_in + nights] == blocked[check_in]
+
+The arrays are built the first time a party asks for a rate, so batches of
+many queries for the same few party sizes share them, and so do the rates of
+other rooms and hotels with the same schedule.
+
+Usage:
+    python ratequote.py INPUT ROOM CHECK_IN NIGHTS [--adults 2] [--kids 0]
+                        [--rate CODE] [--hotel CODE]
+    python ratequote.py INPUT --batch QUERIES.csv [--hotel CODE]
+
+INPUT is an XML file, a directory searched for rates.input.xml files or a
+rate store. The batch file (- for stdin) has a header row naming its
+columns: room, check_in and nights, and optionally hotel, adults, kids and
+rate. Quotes are written to stdout as CSV, with an empty total for stays
+that cannot be booked.
+"""
+
+from array import array
+from collections import OrderedDict, namedtuple
+import argparse
+import csv
+import datetime
+import os.path
+import sys
+
+from rateindex import ScheduleCache, schedule_key, to_ordinal
+from ratejson import cents
+
+# A priced stay. total is in the hotel's currency
+Quote = namedtuple('Quote', ['hotel', 'room', 'rate', 'check_in', 'nights', 'adults', 'kids', 'total'])
+
+
+def nightly_cents(rate_range, adults, kids):
+    """ Price in cents of one night of a party under a RateRange, or None if
+    the party cannot book it. """
+    if rate_range is None:
+        return None
+    if ((rate_range.adults is not None and adults > rate_range.adults)
+            or (rate_range.kids is not None and kids > rate_range.kids)
+            or (rate_range.occupancy is not None and adults + kids > rate_range.occupancy)):
+        return None
+
+    extra_adults = max(0, adults - rate_range.basis) if rate_range.basis is not None else 0
+    if (extra_adults and rate_range.extra_adult is None) or (kids and rate_range.child_price is None):
+        return None
+    price = cents(rate_range.room_price)
+    if extra_adults:
+        price += extra_adults * cents(rate_range.extra_adult)
+    if kids:
+        price += kids * cents(rate_range.child_price)
+    return price
+
+
+# schedule_key() -> the _Plan of that schedule
+_PLANS = ScheduleCache()
+
+
+class _Plan(object):
+    """ The RateRange in effect on each day covered by one rate of a room. Only
+    the terms of the ranges are used, not their room and rate. """
+
+    def __init__(self, rate_ranges):
+        self.first = min(rate_range.start for rate_range in rate_ranges)
+        last = max(rate_range.end for rate_range in rate_ranges)
+        self.nights = [None] * (last - self.first + 1)
+        for rate_range in rate_ranges:
+            self.nights[rate_range.start - self.first:rate_range.end - self.first + 1] = \
+                [rate_range] * (rate_range.end - rate_range.start + 1)
+        self.minimum_stay = array('h', (
+            (rate_range.minimum_nite_stay or 0) if rate_range is not None else 0
+            for rate_range in self.nights))
+        # (adults, kids) -> (totals, blocked) prefix sums
+        self.tables = dict()
+
+    def table(self, adults, kids):
+        """ Prefix sums of the nightly prices of a party, and of the nights it
+        cannot book. """
+        table = self.tables.get((adults, kids))
+        if table is None:
+            totals = array('q', [0])
+            blocked = array('l', [0])
+            total = count = 0
+            for rate_range in self.nights:
+                price = nightly_cents(rate_range, adults, kids)
+                if price is None:
+                    count += 1
+                else:
+                    total += price
+                totals.append(total)
+                blocked.append(count)
+            table = self.tables[(adults, kids)] = (totals, blocked)
+        return table
+
+    def total(self, check_in, nights, adults, kids):
+        """ Total in cents of a stay, or None if it cannot be booked. """
+        first_night = check_in - self.first
+        if nights < 1 or first_night < 0 or first_night + nights > len(self.nights):
+            return None
+        if nights < self.minimum_stay[first_night]:
+            return None
+        totals, blocked = self.table(adults, kids)
+        if blocked[first_night + nights] != blocked[first_night]:
+            return None
+        return totals[first_night + nights] - totals[first_night]
+
+
+class QuoteEngine(object):
+    """ Stay quotes for the rooms of one hotel, from its RateIndex. """
+
+    def __init__(self, rate_index, plans=_PLANS):
+        """ plans is the ScheduleCache the plans of the rates are kept in. """
+        self.hotel_code = rate_index.hotel_code
+        by_plan = OrderedDict()
+        for rate_range in rate_index.ranges:
+            by_plan.setdefault(rate_range.room, OrderedDict()).setdefault(
+                rate_range.rate, []).append(rate_range)
+        # Room -> rate code -> _Plan
+        self._plans = OrderedDict(
+            (room, OrderedDict((rate, plans.get(schedule_key(rate_ranges), lambda: _Plan(rate_ranges)))
+                               for rate, rate_ranges in rates.items()))
+            for room, rates in by_plan.items())
+
+    def rates(self, room):
+        """ The rate codes of a room, in document order. """
+        return list(self._plans.get(room, ()))
+
+    def quote(self, room, check_in, nights, adults=2, kids=0, rate=None):
+        """
+        @input a room, the check-in date (a date, an ISO string or an ordinal),
+            the number of nights and guests, and optionally the rate code to
+            book; without one the cheapest bookable rate is quoted
+        @returns a Quote, or None if the stay cannot be booked
+        """
+        plans = self._plans.get(room, dict())
+        check_in = to_ordinal(check_in)
+        best = None
+        for code in ([rate] if rate is not None else plans):
+            plan = plans.get(code)
+            total = plan.total(check_in, nights, adults, kids) if plan is not None else None
+            if total is not None and (best is None or total < best[1]):
+                best = (code, total)
+        if best is None:
+            return None
+        return Quote(self.hotel_code, room, best[0], datetime.date.fromordinal(check_in),
+                     nights, adults, kids, best[1] / 100.0)
+
+    def quote_many(self, queries):
+        """ quote() every (room, check-in, nights[, adults[, kids[, rate]]]) tuple.
+            @returns a list with a Quote or None for each of them, in order """
+        return [self.quote(*query) for query in queries]
+
+
+def load_engines(inputs):
+    """ A QuoteEngine for every hotel of the given XML files, search
+    directories or rate stores, keyed by hotel code. """
+    import ratestore
+    return OrderedDict((code, QuoteEngine(rate_index))
+                       for code, rate_index in ratestore.load_hotels(inputs).items())
+
+
+def read_queries(handle, hotel=None):
+    """ Generator over (hotel, (room, check-in, nights, adults, kids, rate))
+    tuples read from a batch file. Exits with the line number of the first row
+    which leaves out a column or holds a value that is not one. """
+    name = getattr(handle, 'name', 'the batch file')
+    reader = csv.DictReader(handle)
+    missing = [column for column in ('room', 'check_in', 'nights')
+               if column not in (reader.fieldnames or ())]
+    if missing:
+        raise SystemExit("Line 1 of {0}: no {1} column.".format(name, ", ".join(missing)))
+    for row in reader:
+        try:
+            query = _row_query(row)
+        except ValueError as error:
+            raise SystemExit("Line {0} of {1}: {2}.".format(reader.line_num, name, error))
+        yield (row.get('hotel') or hotel, query)
+
+
+def _row_query(row):
+    """ The query of a batch file row, or ValueError saying what is wrong with it. """
+    for column in ('room', 'check_in', 'nights'):
+        if not row.get(column):
+            raise ValueError("no {0}".format(column))
+    try:
+        to_ordinal(row['check_in'])
+    except ValueError:
+        raise ValueError("check_in {0!r} is not a YYYY-MM-DD date".format(row['check_in']))
+
+    def count(column, default, minimum):
+        try:
+            return whole_number(row.get(column) or default, minimum)
+        except ValueError as error:
+            raise ValueError("{0} {1}".format(column, error))
+
+    return (row['room'], row['check_in'], count('nights', None, 1),
+            count('adults', 2, 0), count('kids', 0, 0), row.get('rate') or None)
+
+
+def whole_number(value, minimum=0):
+    """ The int of value, or ValueError if it is not a whole number of at least minimum. """
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        number = None
+    if number is None or number < minimum:
+        raise ValueError("{0!r} is not a whole number of at least {1}".format(value, minimum))
+    return number
+
+
+def _count(minimum):
+    """ argparse type of the nights and guests of a stay. """
+    def parse(value):
+        try:
+            return whole_number(value, minimum)
+        except ValueError as error:
+            raise argparse.ArgumentTypeError(str(error))
+    return parse
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Quote the total price of hotel stays.")
+    parser.add_argument('input', help="XML file, search directory or rate store")
+    parser.add_argument('room', nargs='?')
+    parser.add_argument('check_in', nargs='?', metavar='CHECK_IN', help="YYYY-MM-DD")
+    parser.add_argument('nights', nargs='?', type=_count(1))
+    parser.add_argument('--adults', type=_count(0), default=2)
+    parser.add_argument('--kids', type=_count(0), default=0)
+    parser.add_argument('--rate', help="rate code to book (default: the cheapest)")
+    parser.add_argument('--hotel', help="hotel code, needed when the input holds several hotels")
+    parser.add_argument('--batch', metavar='FILE', help="CSV file of stays to quote, - for stdin")
+    arguments = parser.parse_args(argv)
+
+    if arguments.batch is None and arguments.nights is None:
+        parser.error("give ROOM CHECK_IN NIGHTS, or --batch FILE")
+    if not os.path.exists(arguments.input):
+        raise SystemExit("Specified input {0} does not exist.".format(arguments.input))
+
+    engines = load_engines([arguments.input])
+    if not engines:
+        raise SystemExit("No hotels in {0}.".format(arguments.input))
+    default_hotel = arguments.hotel
+    if default_hotel is None and len(engines) == 1:
+        default_hotel = next(iter(engines))
+
+    if arguments.batch is None:
+        if default_hotel is None:
+            parser.error("--hotel is needed: INPUT holds several hotels")
+        return write_quotes(engines, [(default_hotel, (
+            arguments.room, arguments.check_in, arguments.nights,
+            arguments.adults, arguments.kids, arguments.rate))], arguments.input)
+    if arguments.batch == '-':
+        return write_quotes(engines, read_queries(sys.stdin, default_hotel), arguments.input)
+    with open(arguments.batch) as handle:
+        return write_quotes(engines, read_queries(handle, default_hotel), arguments.input)
+
+
+def write_quotes(engines, queries, source):
+    """ Quote every (hotel, query) of queries and write the quotes to stdout as CSV. """
+    from outputwriter import exit_on_closed_pipe
+    with exit_on_closed_pipe() as stdout:
+        writer = csv.writer(stdout, lineterminator='\n')
+        writer.writerow(Quote._fields)
+        for hotel, query in queries:
+            engine = engines.get(hotel)
+            if engine is None:
+                raise SystemExit("No hotel code {0} in {1}.".format(hotel, source))
+            try:
+                quote = engine.quote(*query)
+            except ValueError as error:
+                raise SystemExit("Invalid stay {0}: {1}".format(query, error))
+            if quote is None:
+                room, check_in, nights, adults, kids, rate = query
+                quote = Quote(hotel, room, rate, check_in, nights, adults, kids, None)
+            writer.writerow(["" if value is None else
+                             "{0:.2f}".format(value) if field == 'total' else value
+                             for field, value in zip(Quote._fields, quote)])
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
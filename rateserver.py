@@ -0,0 +1,203 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Small HTTP server rendering the pages of any hotel and year on demand, for --serve.
+
+Pages are rendered from the rates held in memory the first time they are
+asked for and kept, together with a gzip'ed copy, in an LRU cache bounded by
+size. Cache keys include a version of the hotel's input (the content hashes
+of the files it was read from), so a changed feed simply misses the cache.
+Every page gets an ETag derived from the same key, which lets a browser
+revalidate a page with If-None-Match without it being rendered again.
+
+URLs follow the layout of the output directory, with an optional year in
+place of the dates the generator was given:
+
+    /<hotel code>/rate_calendar.html
+    /<hotel code>/<year>/rates_yearly_summary.html
+    /<hotel code>/<year>/rates/<year>-<month>.json
+"""
+
+from collections import OrderedDict, namedtuple
+import gzip
+import hashlib
+import re
+import threading
+
+try:
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+except ImportError:
+    # Python < 3.7
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+
+    class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+        daemon_threads = True
+
+# A rendered page, its gzip'ed copy and its ETag
+Page = namedtuple('Page', ['body', 'gzipped', 'etag'])
+
+PAGE_PATH = re.compile(r'^/(?P<hotel>[A-Za-z0-9_-]+)/(?:(?P<year>\d{4})/)?'
+                       r'(?P<file>[a-z_]+\.html|rates/\d{4}-\d{2}\.json)$')
+
+CONTENT_TYPES = {
+    'html': 'text/html; charset=utf-8',
+    'json': 'application/json',
+}
+
+
+def etag(key):
+    """ Quoted ETag for a cache key. """
+    return '"{0}"'.format(hashlib.sha1(repr(key).encode('utf-8')).hexdigest()[:24])
+
+
+class PageCache(object):
+    """ Thread safe LRU cache of Page objects, bounded by their total size in bytes. """
+
+    def __init__(self, max_bytes=64 << 20):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._pages = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._pages)
+
+    @staticmethod
+    def page_size(page):
+        return len(page.body) + len(page.gzipped)
+
+    def get(self, key):
+        """ @returns the cached Page, marked most recently used, or None """
+        with self._lock:
+            page = self._pages.pop(key, None)
+            if page is not None:
+                self._pages[key] = page
+            return page
+
+    def put(self, key, page):
+        """ Cache a page, evicting the least recently used ones to make room.
+        Pages larger than the whole cache are not kept. """
+        with self._lock:
+            old = self._pages.pop(key, None)
+            if old is not None:
+                self.size -= self.page_size(old)
+            if self.page_size(page) > self.max_bytes:
+                return page
+            self._pages[key] = page
+            self.size += self.page_size(page)
+            while self.size > self.max_bytes:
+                _, evicted = self._pages.popitem(last=False)
+                self.size -= self.page_size(evicted)
+            return page
+
+
+class RateServer(ThreadingHTTPServer):
+    """
+    Serves rendered pages on a thread per request.
+
+    lookup(hotel code) returns the hotel's (RateIndex, input version) or None
+    for unknown hotels; render(rate_index, year or window, output file)
+    returns the page's text chunks, or raises KeyError for a page the hotel
+    does not have. output_files are the HTML page names that may be asked for,
+    default_window what is rendered for URLs without a year. Requests are
+    logged to stderr unless quiet.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, lookup, render, output_files, default_window, max_bytes=64 << 20,
+                 quiet=False):
+        ThreadingHTTPServer.__init__(self, address, RateRequestHandler)
+        self.lookup = lookup
+        self.render = render
+        self.output_files = list(output_files)
+        self.default_window = default_window
+        self.quiet = quiet
+        self.cache = PageCache(max_bytes)
+
+        # Cache key -> lock held while that page renders, so it renders once
+        self._rendering = dict()
+        self._rendering_lock = threading.Lock()
+
+    def page(self, key, rate_index, window, output_file):
+        """ The cached page for key, rendering it if it is not cached yet. """
+        page = self.cache.get(key)
+        if page is not None:
+            return page
+
+        with self._rendering_lock:
+            lock = self._rendering.setdefault(key, threading.Lock())
+        try:
+            with lock:
+                # Another thread may have rendered it while this one waited
+                page = self.cache.get(key)
+                if page is None:
+                    body = u''.join(self.render(rate_index, window, output_file)).encode('utf-8')
+                    page = self.cache.put(key, Page(body, gzip.compress(body), etag(key)))
+        finally:
+            with self._rendering_lock:
+                self._rendering.pop(key, None)
+        return page
+
+
+class RateRequestHandler(BaseHTTPRequestHandler):
+    """ GET and HEAD of the pages of RateServer. """
+
+    server_version = 'HotelHTMLGenerator'
+
+    def log_message(self, format, *args):
+        # The access log, left out with -q/--quiet
+        if not self.server.quiet:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+    def do_HEAD(self):
+        self.respond(send_body=False)
+
+    def do_GET(self):
+        self.respond(send_body=True)
+
+    def respond(self, send_body):
+        match = PAGE_PATH.match(self.path.split('?', 1)[0])
+        if match is None or (match.group('file').endswith('.html')
+                             and match.group('file') not in self.server.output_files):
+            return self.send_error(404, "No such page")
+
+        found = self.server.lookup(match.group('hotel'))
+        if found is None:
+            return self.send_error(404, "No such hotel code")
+        rate_index, version = found
+
+        window = int(match.group('year')) if match.group('year') else self.server.default_window
+        key = (rate_index.hotel_code, window, match.group('file'), version)
+
+        # Revalidation needs nothing but the key, the page is not rendered for it
+        tag = etag(key)
+        if_none_match = self.headers.get('If-None-Match', '')
+        if if_none_match.strip() == '*' or tag in [value.strip() for value in if_none_match.split(',')]:
+            self.send_response(304)
+            self.send_header('ETag', tag)
+            self.end_headers()
+            return
+
+        try:
+            page = self.server.page(key, rate_index, window, match.group('file'))
+        except KeyError:
+            # Such as the rates of a month without any
+            return self.send_error(404, "No such page")
+        accept_encoding = self.headers.get('Accept-Encoding', '')
+        use_gzip = 'gzip' in [value.split(';')[0].strip() for value in accept_encoding.split(',')]
+        body = page.gzipped if use_gzip else page.body
+
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPES[match.group('file').rsplit('.', 1)[1]])
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', page.etag)
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Vary', 'Accept-Encoding')
+        if use_gzip:
+            self.send_header('Content-Encoding', 'gzip')
+        self.end_headers()
+        if send_body:
+            self.wfile.write(body)
@@ -0,0 +1,182 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Streaming splitter turning the unsplit rates.xml into one rates.input.xml per
+hotel, laid out as <output directory>/<hotel code>/rates.input.xml for the
+generator to find.
+
+The file is memory-mapped and scanned for the byte offsets of its <hotel>
+start tags; no DOM is built and nothing is re-serialized, so every hotel is
+copied to its own file byte for byte, in chunks, whatever the size of the
+feed. Hotels are then split into contiguous byte ranges of about the same
+size, which can be written by several processes at once.
+
+<hotel> elements must not nest, which the feed format guarantees. Comments
+and CDATA sections are not looked into, so a literal "<hotel" in one of them
+would be taken for a hotel.
+"""
+
+import argparse
+import mmap
+import os
+import os.path
+import re
+
+from outputwriter import write_atomic
+
+HOTEL_START = b'<hotel'
+HOTEL_END = b'</hotel>'
+
+# Name of the file written for each hotel, the one the generator searches for
+OUTPUT_FILENAME = 'rates.input.xml'
+
+_XML_DECLARATION = re.compile(br'^\s*(<\?xml[^>]*\?>)')
+_HOTEL_CODE = re.compile(br'\scode\s*=\s*["\']([^"\']*)["\']')
+_SAFE_NAME = re.compile(r'[^A-Za-z0-9_.-]')
+
+
+def hotel_offsets(buffer):
+    """
+    Generator over (start offset, hotel code) of every <hotel> start tag in a
+    bytes-like buffer, such as an mmap. The code is None if the tag has none.
+    """
+    position = buffer.find(HOTEL_START)
+    while position != -1:
+        after = buffer[position + len(HOTEL_START):position + len(HOTEL_START) + 1]
+        # Skip other elements whose name starts with hotel, such as <hotels>
+        if after in (b'>', b'/') or after.isspace():
+            tag_end = buffer.find(b'>', position)
+            match = _HOTEL_CODE.search(buffer[position:tag_end])
+            yield position, (match.group(1).decode('utf-8') if match else None)
+        position = buffer.find(HOTEL_START, position + len(HOTEL_START))
+
+
+def hotel_end(buffer, start):
+    """ Offset just past the </hotel> end tag of the hotel starting at start. """
+    tag_end = buffer.find(b'>', start)
+    if buffer[tag_end - 1:tag_end] == b'/':
+        # <hotel .../> without content
+        return tag_end + 1
+    end = buffer.find(HOTEL_END, tag_end)
+    if end == -1:
+        raise ValueError("<hotel> at byte {0} has no </hotel>".format(start))
+    return end + len(HOTEL_END)
+
+
+def directory_names(offsets):
+    """
+    @input (start offset, hotel code) tuples in document order
+    @returns a (start offset, directory name) tuple for each hotel. Directories
+        are named after the hotel code; a code seen before gets _2, _3... and a
+        hotel without a code is named after its offset
+    """
+    seen = dict()
+    names = []
+    for start, code in offsets:
+        name = _SAFE_NAME.sub('_', code) if code else "hotel_at_{0}".format(start)
+        seen[name] = seen.get(name, 0) + 1
+        if seen[name] > 1:
+            name = "{0}_{1}".format(name, seen[name])
+        names.append((start, name))
+    return names
+
+
+def byte_ranges(hotels, size, parts):
+    """
+    Split (start offset, directory name) tuples into at most parts contiguous
+    groups of about the same number of bytes.
+    """
+    if not hotels:
+        return []
+    parts = max(1, min(parts, len(hotels)))
+    groups = [[] for _ in range(parts)]
+    for index, hotel in enumerate(hotels):
+        following = hotels[index + 1][0] if index + 1 < len(hotels) else size
+        # Place each hotel by the middle of the bytes it spans
+        middle = (hotel[0] + following) // 2
+        groups[min(parts - 1, middle * parts // max(size, 1))].append(hotel)
+    return [group for group in groups if group]
+
+
+def declaration_prefix(buffer):
+    """ The XML declaration at the start of buffer and a newline, to put ahead
+    of a hotel copied out of it, or b'' if it has none. """
+    declaration = _XML_DECLARATION.match(buffer[:1024])
+    return declaration.group(1) + b'\n' if declaration else b''
+
+
+def _chunks(buffer, start, end, chunk_size=1 << 20):
+    """ Generator over the bytes of buffer from start to end, chunk_size at a time. """
+    for position in range(start, end, chunk_size):
+        yield buffer[position:min(end, position + chunk_size)]
+
+
+def write_hotels(source, output_directory, hotels):
+    """
+    Copy the given (start offset, directory name) hotels of source to
+    <output directory>/<directory name>/rates.input.xml, each preceded by the
+    source's XML declaration, if it has one.
+        @returns the paths written
+    """
+    written = []
+    with open(source, 'rb') as handle:
+        buffer = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            prefix = [declaration_prefix(buffer)]
+            for start, name in hotels:
+                path = os.path.join(output_directory, name, OUTPUT_FILENAME)
+                end = hotel_end(buffer, start)
+                write_atomic(path, prefix + list(_chunks(buffer, start, end)) + [b'\n'])
+                written.append(path)
+        finally:
+            buffer.close()
+    return written
+
+
+def split(source, output_directory, jobs=1):
+    """
+    Split every hotel of source into output_directory, on jobs worker
+    processes when jobs is more than 1.
+        @returns a (directory name, written path) tuple for each hotel, in
+        document order
+    """
+    if os.path.getsize(source) == 0:
+        return []
+    with open(source, 'rb') as handle:
+        buffer = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            hotels = directory_names(hotel_offsets(buffer))
+            size = len(buffer)
+        finally:
+            buffer.close()
+
+    groups = byte_ranges(hotels, size, jobs)
+    if jobs > 1 and len(groups) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            written = [path for paths in executor.map(
+                write_hotels, [source] * len(groups), [output_directory] * len(groups), groups)
+                for path in paths]
+    else:
+        written = [path for group in groups for path in write_hotels(source, output_directory, group)]
+
+    return [(name, path) for (_, name), path in zip(hotels, written)]
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+        description="Split the unsplit rates.xml into a search directory holding a "
+                    "(hotel code)/rates.input.xml file per hotel.")
+    parser.add_argument('source', metavar='rates.xml')
+    parser.add_argument('output_directory')
+    parser.add_argument('--jobs', type=int, default=1, metavar='N', help="worker processes")
+    arguments = parser.parse_args(argv)
+
+    if not os.path.isfile(arguments.source):
+        raise SystemExit("Specified rates XML file does not exist.")
+    hotels = split(arguments.source, arguments.output_directory, arguments.jobs)
+    for _, path in hotels:
+        print("Wrote {0}".format(path))
+    print("Split {0} hotels out of {1}".format(len(hotels), arguments.source))
+    return 0
@@ -0,0 +1,402 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Persistent SQLite store of parsed hotel rates, and a command line to query it.
+
+Hotels, their rooms, rate codes and priced <date> ranges are ingested once
+into a local database with indexes on hotel, room and date range, so that
+questions such as "lowest price for room 1VILISLGV in October" or "which
+hotels changed rates since yesterday" are answered by an indexed query
+rather than a run over the XML. The generator can also render straight from
+a store: pass the database file in place of the search directory.
+
+Dates are kept as ISO 'YYYY-MM-DD' text, which sorts and compares like the
+dates themselves. Each hotel carries a hash of its rates, and the time they
+last changed, so re-ingesting an unchanged feed changes nothing.
+
+Usage:
+    python ratestore.py ingest DATABASE INPUT [INPUT ...]
+    python ratestore.py hotels DATABASE
+    python ratestore.py lowest DATABASE ROOM FROM TO [--hotel CODE] [--limit N]
+    python ratestore.py day DATABASE DATE [--hotel CODE] [--room ROOM]
+    python ratestore.py changed DATABASE [--since TIMESTAMP]
+    python ratestore.py sql DATABASE QUERY
+
+INPUT is an XML file, or a directory searched for rates.input.xml files.
+"""
+
+import argparse
+from collections import OrderedDict
+import datetime
+import hashlib
+import os.path
+import sqlite3
+import sys
+import time
+
+import discovery
+import ratefeed
+from rateindex import RateIndex, RateRange, to_ordinal
+
+# Bump when the schema changes; older databases have to be ingested again
+SCHEMA_VERSION = 2
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS hotels (
+    code TEXT PRIMARY KEY,
+    currency TEXT,
+    source TEXT,
+    rates_hash TEXT,
+    ingested_at TEXT,
+    changed_at TEXT
+);
+CREATE TABLE IF NOT EXISTS rooms (
+    hotel TEXT NOT NULL,
+    name TEXT NOT NULL,
+    description TEXT,
+    position INTEGER NOT NULL,
+    PRIMARY KEY (hotel, name)
+);
+CREATE TABLE IF NOT EXISTS rates (
+    hotel TEXT NOT NULL,
+    room TEXT NOT NULL,
+    code TEXT NOT NULL,
+    PRIMARY KEY (hotel, room, code)
+);
+CREATE TABLE IF NOT EXISTS ranges (
+    hotel TEXT NOT NULL,
+    room TEXT NOT NULL,
+    rate TEXT,
+    start_date TEXT NOT NULL,
+    end_date TEXT NOT NULL,
+    room_price REAL NOT NULL,
+    extra_adult REAL,
+    child_price REAL,
+    minimum_nite_stay INTEGER,
+    adults INTEGER,
+    kids INTEGER,
+    occupancy INTEGER,
+    basis INTEGER,
+    position INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ranges_by_hotel_room ON ranges (hotel, room, start_date, end_date);
+CREATE INDEX IF NOT EXISTS ranges_by_room ON ranges (room, start_date, end_date);
+CREATE INDEX IF NOT EXISTS ranges_by_date ON ranges (start_date, end_date);
+"""
+
+# Columns of ranges holding the RateRange fields after room, rate and the dates
+DETAIL_COLUMNS = ['room_price', 'extra_adult', 'child_price', 'minimum_nite_stay',
+                  'adults', 'kids', 'occupancy', 'basis']
+
+# First bytes of every SQLite database file
+SQLITE_MAGIC = b'SQLite format 3\x00'
+
+
+def is_database(path):
+    """ True if path is an SQLite database rather than XML. """
+    try:
+        with open(path, 'rb') as handle:
+            return handle.read(len(SQLITE_MAGIC)) == SQLITE_MAGIC
+    except (IOError, OSError):
+        return False
+
+
+def iso(value):
+    """ ISO date text of a day ordinal, date or ISO string. """
+    return datetime.date.fromordinal(to_ordinal(value)).isoformat()
+
+
+def now():
+    """ Current UTC time as ISO text, to the second. """
+    return datetime.datetime.utcnow().replace(microsecond=0).isoformat() + 'Z'
+
+
+class RateStore(object):
+    """ A database of hotel rates, created on first use. """
+
+    def __init__(self, path, read_only=False):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.row_factory = sqlite3.Row
+
+        try:
+            version = self.connection.execute('PRAGMA user_version').fetchone()[0]
+        except sqlite3.DatabaseError:
+            self.connection.close()
+            raise
+        if version not in (0, SCHEMA_VERSION):
+            self.connection.close()
+            raise ValueError("{0} has schema version {1}, expected {2}".format(
+                path, version, SCHEMA_VERSION))
+        if read_only:
+            self.connection.execute('PRAGMA query_only = ON')
+            return
+        with self.connection:
+            self.connection.executescript(SCHEMA)
+            self.connection.execute('PRAGMA user_version = {0}'.format(SCHEMA_VERSION))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def rates_hash(self, hotel_code):
+        """ Hash of everything stored for a hotel, in document order. """
+        digest = hashlib.sha1()
+        for table, order in (('rooms', 'position'), ('ranges', 'position')):
+            for row in self.connection.execute(
+                    'SELECT * FROM {0} WHERE hotel = ? ORDER BY {1}'.format(table, order), (hotel_code,)):
+                digest.update(repr(tuple(row)).encode('utf-8'))
+        return digest.hexdigest()
+
+    def ingest(self, hotels):
+        """
+        Replace the stored rates of every hotel in hotels, an iterable of
+        (source path, RateIndex) tuples, in one transaction. Several RateIndex
+        objects with the same hotel code are merged, as the generator does.
+        Hotels missing from hotels are left as they are.
+            @returns the codes of the hotels whose rates changed, in order
+        """
+        cursor = self.connection.cursor()
+        # Hotel code -> (previous rates hash, next range position)
+        seen = dict()
+        started = now()
+        with self.connection:
+            for source, rate_index in hotels:
+                code = rate_index.hotel_code
+                if code not in seen:
+                    previous = cursor.execute(
+                        'SELECT rates_hash FROM hotels WHERE code = ?', (code,)).fetchone()
+                    seen[code] = [previous[0] if previous else None, 0]
+                    for table in ('rooms', 'rates', 'ranges'):
+                        cursor.execute('DELETE FROM {0} WHERE hotel = ?'.format(table), (code,))
+                    cursor.execute(
+                        'INSERT OR IGNORE INTO hotels (code) VALUES (?)', (code,))
+                    cursor.execute(
+                        'UPDATE hotels SET currency = ?, source = ?, ingested_at = ? WHERE code = ?',
+                        (rate_index.currency, source, started, code))
+
+                position = cursor.execute(
+                    'SELECT COUNT(*) FROM rooms WHERE hotel = ?', (code,)).fetchone()[0]
+                for name, description in rate_index.rooms.items():
+                    if cursor.execute('INSERT OR IGNORE INTO rooms VALUES (?, ?, ?, ?)',
+                                      (code, name, description, position)).rowcount:
+                        position += 1
+
+                cursor.executemany('INSERT OR IGNORE INTO rates VALUES (?, ?, ?)', set(
+                    (code, rate_range.room, rate_range.rate) for rate_range in rate_index.ranges
+                    if rate_range.rate is not None))
+                first = seen[code][1]
+                cursor.executemany(
+                    'INSERT INTO ranges VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    ((code, rate_range.room, rate_range.rate, iso(rate_range.start),
+                      iso(rate_range.end)) + tuple(rate_range[4:]) + (first + offset,)
+                     for offset, rate_range in enumerate(rate_index.ranges)))
+                seen[code][1] = first + len(rate_index.ranges)
+
+            changed = []
+            for code, (previous, _) in seen.items():
+                rates_hash = self.rates_hash(code)
+                if rates_hash != previous:
+                    changed.append(code)
+                    cursor.execute('UPDATE hotels SET rates_hash = ?, changed_at = ? WHERE code = ?',
+                                   (rates_hash, started, code))
+        return changed
+
+    def ingest_files(self, paths):
+        """ ingest() every hotel of the given XML files. """
+        return self.ingest((path, rate_index) for path in paths
+                           for rate_index in ratefeed.iter_hotels(path))
+
+    def hotel_codes(self):
+        return [row[0] for row in self.connection.execute('SELECT code FROM hotels ORDER BY code')]
+
+    def load(self, hotel_code):
+        """ @returns the stored RateIndex of a hotel, or None if it is unknown """
+        hotel = self.connection.execute(
+            'SELECT code, currency FROM hotels WHERE code = ?', (hotel_code,)).fetchone()
+        if hotel is None:
+            return None
+        rate_index = RateIndex(hotel['code'], hotel['currency'])
+        for row in self.connection.execute(
+                'SELECT name, description FROM rooms WHERE hotel = ? ORDER BY position', (hotel_code,)):
+            rate_index.add_room(row['name'], row['description'])
+        for row in self.connection.execute(
+                'SELECT room, rate, start_date, end_date, {0} FROM ranges WHERE hotel = ? '
+                'ORDER BY position'.format(', '.join(DETAIL_COLUMNS)), (hotel_code,)):
+            rate_index.add_range(RateRange(
+                row['room'], row['rate'], to_ordinal(row['start_date']), to_ordinal(row['end_date']),
+                *[row[column] for column in DETAIL_COLUMNS]))
+        return rate_index
+
+    def load_all(self):
+        """ Generator over the RateIndex of every stored hotel. """
+        for code in self.hotel_codes():
+            yield self.load(code)
+
+    def hotels(self):
+        """ Every hotel with its number of rooms and ranges. """
+        return self.connection.execute(
+            'SELECT code, currency, '
+            '(SELECT COUNT(*) FROM rooms WHERE rooms.hotel = hotels.code) AS rooms, '
+            '(SELECT COUNT(*) FROM ranges WHERE ranges.hotel = hotels.code) AS ranges, '
+            'changed_at, source FROM hotels ORDER BY code').fetchall()
+
+    def lowest(self, room, start, end, hotel=None, limit=1):
+        """ The cheapest ranges of a room overlapping the window from start to end. """
+        query = ('SELECT hotel, room, rate, start_date, end_date, room_price FROM ranges '
+                 'WHERE room = ? AND start_date <= ? AND end_date >= ?')
+        parameters = [room, iso(end), iso(start)]
+        if hotel is not None:
+            query += ' AND hotel = ?'
+            parameters.append(hotel)
+        query += ' ORDER BY room_price, hotel, position LIMIT ?'
+        parameters.append(limit)
+        return self.connection.execute(query, parameters).fetchall()
+
+    def rates_for_day(self, day, hotel=None, room=None):
+        """ Every range covering a day, optionally of one hotel or room. """
+        query = ('SELECT hotel, room, rate, start_date, end_date, room_price FROM ranges '
+                 'WHERE start_date <= ? AND end_date >= ?')
+        parameters = [iso(day), iso(day)]
+        for column, value in (('hotel', hotel), ('room', room)):
+            if value is not None:
+                query += ' AND {0} = ?'.format(column)
+                parameters.append(value)
+        query += ' ORDER BY hotel, position'
+        return self.connection.execute(query, parameters).fetchall()
+
+    def changed_since(self, timestamp):
+        """ Hotels whose rates changed at or after an ISO timestamp. """
+        return self.connection.execute(
+            'SELECT code, changed_at, source FROM hotels WHERE changed_at >= ? ORDER BY changed_at, code',
+            (timestamp,)).fetchall()
+
+
+def input_files(inputs, patterns=None):
+    """ XML files given directly, and rates.input.xml files (or files matching
+    the given patterns) below given directories, in path order. """
+    for path in inputs:
+        if os.path.isdir(path):
+            for found in sorted(entry.path for entry in discovery.discover(
+                    os.path.realpath(path), patterns or discovery.DEFAULT_PATTERNS)):
+                yield found
+        else:
+            yield path
+
+
+def load_hotels(inputs):
+    """ The RateIndex of every hotel of the given XML files, search directories
+    or rate stores, keyed by hotel code. Hotels found in several files are
+    merged, as the generator does. """
+    hotels = OrderedDict()
+    for path in input_files(inputs):
+        if is_database(path):
+            with RateStore(path, read_only=True) as store:
+                rate_indexes = list(store.load_all())
+        else:
+            rate_indexes = ratefeed.iter_hotels(path)
+        for rate_index in rate_indexes:
+            merged = hotels.setdefault(
+                rate_index.hotel_code, RateIndex(rate_index.hotel_code, rate_index.currency))
+            for room, description in rate_index.rooms.items():
+                merged.rooms.setdefault(room, description)
+            for rate_range in rate_index.ranges:
+                merged.add_range(rate_range)
+    return hotels
+
+
+def print_rows(rows):
+    """ Print query results as tab separated columns under a header. """
+    if not rows:
+        print("No results.")
+        return
+    print("\t".join(rows[0].keys()))
+    for row in rows:
+        print("\t".join("" if value is None else str(value) for value in row))
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Ingest hotel rates into SQLite and query them.")
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    ingest = commands.add_parser('ingest', help="store the hotels of XML files or search directories")
+    ingest.add_argument('database')
+    ingest.add_argument('inputs', nargs='+')
+
+    hotels = commands.add_parser('hotels', help="list the stored hotels")
+    hotels.add_argument('database')
+
+    lowest = commands.add_parser('lowest', help="cheapest rates of a room between two dates")
+    lowest.add_argument('database')
+    lowest.add_argument('room')
+    lowest.add_argument('start', metavar='FROM')
+    lowest.add_argument('end', metavar='TO')
+    lowest.add_argument('--hotel')
+    lowest.add_argument('--limit', type=int, default=1)
+
+    day = commands.add_parser('day', help="every rate on a day")
+    day.add_argument('database')
+    day.add_argument('day', metavar='DATE')
+    day.add_argument('--hotel')
+    day.add_argument('--room')
+
+    changed = commands.add_parser('changed', help="hotels whose rates changed")
+    changed.add_argument('database')
+    changed.add_argument('--since', default='', help="ISO timestamp, default: ever")
+
+    sql = commands.add_parser('sql', help="run a read-only SQL query")
+    sql.add_argument('database')
+    sql.add_argument('query')
+
+    arguments = parser.parse_args(argv)
+
+    if arguments.command != 'ingest' and not os.path.isfile(arguments.database):
+        raise SystemExit("Rate store {0} does not exist.".format(arguments.database))
+
+    started = time.time()
+    try:
+        store = RateStore(arguments.database, read_only=arguments.command != 'ingest')
+    except sqlite3.DatabaseError:
+        raise SystemExit("{0} is not a rate store.".format(arguments.database))
+    except ValueError as error:
+        raise SystemExit("Unable to open rate store: {0}".format(error))
+
+    if arguments.command == 'ingest':
+        with store:
+            changed_codes = store.ingest_files(input_files(arguments.inputs))
+        for code in changed_codes:
+            print("Changed: {0}".format(code))
+        print("Ingested into {0}, {1} hotel(s) changed".format(arguments.database, len(changed_codes)))
+        return 0
+
+    with store:
+        try:
+            if arguments.command == 'hotels':
+                rows = store.hotels()
+            elif arguments.command == 'lowest':
+                rows = store.lowest(arguments.room, arguments.start, arguments.end,
+                                    arguments.hotel, arguments.limit)
+            elif arguments.command == 'day':
+                rows = store.rates_for_day(arguments.day, arguments.hotel, arguments.room)
+            elif arguments.command == 'changed':
+                rows = store.changed_since(arguments.since)
+            else:
+                rows = store.connection.execute(arguments.query).fetchall()
+        except (sqlite3.Error, ValueError) as error:
+            raise SystemExit("Query failed: {0}".format(error))
+    from outputwriter import exit_on_closed_pipe
+    with exit_on_closed_pipe():
+        print_rows(rows)
+    print("({0} row(s) in {1:.1f} ms)".format(len(rows), (time.time() - started) * 1000), file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
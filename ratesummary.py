@@ -0,0 +1,132 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Monthly low/high/mean rate summary per room, for rates_yearly_summary.
+
+Rather than expanding every range into one cell per day and reducing the
+resulting day x room matrix, each <date> range is cut at month boundaries
+into (room, month, price, nights) segments and the reductions are done on
+those groups. The result is the same as reducing the matrix, with every day
+a range covers weighted as one entry, but the cost only depends on the
+number of ranges. A room's months only depend on its own schedule, so they
+are kept in a ScheduleCache for every other room and hotel with the same one.
+"""
+
+from bisect import bisect_right
+from collections import OrderedDict, namedtuple
+import datetime
+
+from rateindex import ScheduleCache, schedule_key, to_ordinal
+
+# Summary of one room for one month. month is the first day of the month,
+# percentiles maps each requested percentile to its rate.
+MonthSummary = namedtuple('MonthSummary', ['month', 'low', 'high', 'mean', 'nights', 'percentiles'])
+
+# (window, percentiles, schedule_key()) -> the summarize_schedule() of that schedule
+_SUMMARIES = ScheduleCache()
+
+
+def month_starts(start, end):
+    """ Ordinals of the first day of every month from start's month through
+    end's month, plus the first day of the month after end. """
+    day = datetime.date.fromordinal(to_ordinal(start)).replace(day=1)
+    last = datetime.date.fromordinal(to_ordinal(end))
+    starts = []
+    while day <= last:
+        starts.append(day.toordinal())
+        day = (day + datetime.timedelta(days=32)).replace(day=1)
+    starts.append(day.toordinal())
+    return starts
+
+
+def weighted_percentile(segments, percentile):
+    """ Nearest-rank percentile of (price, nights) pairs sorted by price. """
+    total = sum(nights for _, nights in segments)
+    threshold = total * percentile / 100.0
+    seen = 0
+    for price, nights in segments:
+        seen += nights
+        if seen >= threshold:
+            return price
+    return segments[-1][0]
+
+
+def segments(rate_ranges, start, end, boundaries=None):
+    """
+    Generator yielding (room, month index, price, nights) for every one of
+    rate_ranges clipped to the window and cut at month boundaries. Month index
+    counts from the month of start; boundaries are its month_starts(), if
+    already known.
+    """
+    start, end = to_ordinal(start), to_ordinal(end)
+    if boundaries is None:
+        boundaries = month_starts(start, end)
+
+    for rate_range in rate_ranges:
+        first, last = max(rate_range.start, start), min(rate_range.end, end)
+        month = bisect_right(boundaries, first) - 1
+        while first <= last:
+            segment_end = min(last, boundaries[month + 1] - 1)
+            yield (rate_range.room, month, rate_range.room_price, segment_end - first + 1)
+            first = segment_end + 1
+            month += 1
+
+
+def summarize_schedule(rate_ranges, start, end, percentiles=(), boundaries=None):
+    """ The list of MonthSummary of one room's ranges, for the months of the
+    window in which it has rates. """
+    if boundaries is None:
+        boundaries = month_starts(start, end)
+
+    # Month -> [low, high, price x nights, nights, [(price, nights)]]
+    groups = dict()
+    for _, month, price, nights in segments(rate_ranges, start, end, boundaries):
+        group = groups.get(month)
+        if group is None:
+            groups[month] = [price, price, price * nights, nights, [(price, nights)]]
+            continue
+        if price < group[0]:
+            group[0] = price
+        if price > group[1]:
+            group[1] = price
+        group[2] += price * nights
+        group[3] += nights
+        group[4].append((price, nights))
+
+    months = []
+    for month in sorted(groups):
+        low, high, weighted, nights, pairs = groups[month]
+        pairs.sort()
+        months.append(MonthSummary(
+            datetime.date.fromordinal(boundaries[month]), low, high, weighted / nights, nights,
+            OrderedDict((p, weighted_percentile(pairs, p)) for p in percentiles)))
+    return months
+
+
+def summarize(rate_index, start, end, percentiles=(), cache=_SUMMARIES):
+    """
+    @input a hotel's RateIndex, the window to summarize, optionally a list of
+        percentiles (0-100) to compute as well and the ScheduleCache to keep
+        the summaries of its rooms in
+    @returns OrderedDict of room name -> list of MonthSummary, in room order,
+        holding only the months in which the room has rates. The lists may be
+        shared with other rooms and hotels
+    """
+    start, end = to_ordinal(start), to_ordinal(end)
+    percentiles = tuple(percentiles)
+    boundaries = month_starts(start, end)
+    by_room = OrderedDict((room, []) for room in rate_index.rooms)
+    for rate_range in rate_index.ranges:
+        by_room[rate_range.room].append(rate_range)
+
+    return OrderedDict(
+        (room, cache.get((start, end, percentiles, schedule_key(rate_ranges, prices_only=True)),
+                         lambda: summarize_schedule(rate_ranges, start, end, percentiles, boundaries)))
+        for room, rate_ranges in by_room.items())
+
+
+def summarize_hotels(rate_indexes, start, end, percentiles=()):
+    """ summarize() every hotel, keyed by hotel code. """
+    return OrderedDict((rate_index.hotel_code, summarize(rate_index, start, end, percentiles))
+                       for rate_index in rate_indexes)
@@ -0,0 +1,141 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Read-ahead of input files, so that waiting on the disk overlaps with parsing.
+
+A background thread memory-maps the input files a few paths ahead of the one
+being parsed and reads each of them through once, which pulls it into the
+page cache while the GIL is released. The parser is then handed the mapping
+itself, so ElementTree reads straight out of the page cache instead of out of
+a copy of the whole file. The number of files mapped ahead is bounded, so a
+slow parser never has more than depth files waiting in memory.
+
+    with ReadAhead(paths, depth=4) as files:
+        for path, buffer in files:
+            ...  # buffer is an mmap, or None for a path that was not wanted
+
+Each buffer is closed as soon as the loop moves on to the next path.
+"""
+
+import mmap
+import os
+import queue
+import threading
+
+# Size of the scratch buffer files are read through in to warm the page cache
+_SCRATCH_SIZE = 1 << 20
+
+_DONE = object()
+
+
+class _Failure(object):
+    """ An exception raised in the reader thread, to re-raise in the consumer's. """
+
+    def __init__(self, path, error):
+        self.path = path
+        self.error = error
+
+
+def map_file(path, scratch=None):
+    """
+    Memory-map a file read-only, first reading it through into scratch (a
+    bytearray) if given, so that its pages are in memory when it is parsed.
+        @returns the mmap, or None for an empty file, which cannot be mapped
+    """
+    with open(path, 'rb') as handle:
+        if scratch is not None:
+            view = memoryview(scratch)
+            while handle.readinto(view):
+                pass
+        if os.fstat(handle.fileno()).st_size == 0:
+            return None
+        buffer = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+    if hasattr(buffer, 'madvise'):
+        # Python 3.8+, the parser reads the mapping from start to end
+        buffer.madvise(mmap.MADV_SEQUENTIAL)
+    return buffer
+
+
+class ReadAhead(object):
+    """
+    Iterable over a (path, buffer) tuple for every path in paths, in order,
+    with the next depth wanted files mapped by a background thread.
+
+    wanted(path) tells which paths to map at all, e.g. only the inputs
+    without a current rate cache; the others come with None as buffer. An
+    error mapping a file is raised when the loop gets to that file.
+    """
+
+    def __init__(self, paths, depth=4, wanted=None):
+        self.paths = list(paths)
+        self.depth = max(1, depth)
+        self.wanted = wanted
+        self._queue = queue.Queue(maxsize=self.depth)
+        self._stop = threading.Event()
+        self._thread = None
+        self._current = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _put(self, item):
+        """ Queue an item unless the consumer stopped. @returns False if it did """
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _read(self):
+        scratch = bytearray(_SCRATCH_SIZE)
+        for path in self.paths:
+            try:
+                buffer = map_file(path, scratch) if self.wanted is None or self.wanted(path) else None
+            except Exception as error:
+                buffer = _Failure(path, error)
+            if not self._put((path, buffer)):
+                if isinstance(buffer, mmap.mmap):
+                    buffer.close()
+                return
+        self._put(_DONE)
+
+    def __iter__(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._read, name='read-ahead')
+            self._thread.daemon = True
+            self._thread.start()
+        while True:
+            item = self._queue.get()
+            self._release()
+            if item is _DONE:
+                return
+            path, buffer = item
+            if isinstance(buffer, _Failure):
+                raise buffer.error
+            self._current = buffer
+            yield path, buffer
+
+    def _release(self):
+        if isinstance(self._current, mmap.mmap):
+            self._current.close()
+        self._current = None
+
+    def close(self):
+        """ Stop reading ahead and close every buffer still mapped. """
+        self._stop.set()
+        self._release()
+        if self._thread is not None:
+            self._thread.join()
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _DONE and isinstance(item[1], mmap.mmap):
+                item[1].close()
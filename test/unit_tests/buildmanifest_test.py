@@ -0,0 +1,69 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Tests for the incremental build manifest.
+"""
+
+import os
+import sys
+
+# Fix for problems with PATH variable
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+from buildmanifest import BuildManifest
+
+
+def build(tmpdir, year=2018):
+    """ A manifest over a templates directory holding a single template. """
+    templates = tmpdir.ensure('templates', dir=True)
+    if not templates.join('page.html').check():
+        templates.join('page.html').write('{{ page }}')
+    return BuildManifest(str(tmpdir.join('output')), year, str(templates))
+
+
+def record_run(tmpdir, manifest, source):
+    """ Pretend the source was rendered and save the manifest. """
+    output = tmpdir.join('output', 'AAAAAA', 'rate_calendar.html')
+    output.ensure().write('<html></html>')
+    manifest.record(str(source), ['AAAAAA'], [str(output)]).save()
+    return output
+
+
+class TestBuildManifest(object):
+
+    def test_unchanged_input_is_fresh(self, tmpdir):
+        """ An input rebuilt last time is skipped, even if merely touched. """
+        source = tmpdir.join('rates.input.xml')
+        source.write('<hotel code="AAAAAA"/>')
+        assert not build(tmpdir).is_fresh(str(source))
+
+        record_run(tmpdir, build(tmpdir), source)
+        assert build(tmpdir).is_fresh(str(source))
+
+        source.setmtime(source.mtime() + 10)
+        assert build(tmpdir).is_fresh(str(source))
+
+    def test_changed_input_is_stale(self, tmpdir):
+        """ Different content means a rebuild. """
+        source = tmpdir.join('rates.input.xml')
+        source.write('<hotel code="AAAAAA"/>')
+        record_run(tmpdir, build(tmpdir), source)
+
+        source.write('<hotel code="AAAAAA" currency="usd"/>')
+        assert not build(tmpdir).is_fresh(str(source))
+
+    def test_settings_and_outputs(self, tmpdir):
+        """ A new year, edited templates or a missing output invalidate everything. """
+        source = tmpdir.join('rates.input.xml')
+        source.write('<hotel code="AAAAAA"/>')
+        output = record_run(tmpdir, build(tmpdir), source)
+
+        assert not build(tmpdir, year=2019).is_fresh(str(source))
+
+        output.remove()
+        assert not build(tmpdir).is_fresh(str(source))
+
+        record_run(tmpdir, build(tmpdir), source)
+        tmpdir.join('templates', 'page.html').write('{{ page }}!')
+        assert not build(tmpdir).is_fresh(str(source))
@@ -0,0 +1,164 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Tests for the command line of the generator.
+"""
+
+import datetime
+import os
+import subprocess
+import sys
+
+import pytest
+
+# Fix for problems with PATH variable
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..')
+sys.path.insert(0, ROOT)
+
+import htmlgenerator
+
+SCRIPT = os.path.join(ROOT, 'htmlgenerator.py')
+SAMPLE_HOTEL = os.path.join(ROOT, 'misc', 'hotel_xml_files', 'AAAAAA.xml')
+
+
+def split_hotel(tmpdir):
+    """ A search directory holding the sample hotel split over two input files,
+    two rooms each. @returns the search directory and the two input files """
+    with open(SAMPLE_HOTEL) as sample:
+        lines = sample.read().splitlines(True)
+    # Lines 1-2 open the hotel and the last two close it
+    head, rooms, tail = lines[:2], lines[2:-2], lines[-2:]
+    split = rooms.index('  <room name="ORD">\n')
+    search = tmpdir.join('search')
+    inputs = []
+    for name, part in (('a', rooms[:split]), ('b', rooms[split:])):
+        path = search.join(name, 'rates.input.xml')
+        path.write(''.join(head + part + tail), ensure=True)
+        inputs.append(path)
+    return str(search), inputs
+
+
+def summary_rooms(output_directory, hotel_code='AAAAAA'):
+    """ Number of rooms in the written summary page of a hotel. """
+    with open(os.path.join(output_directory, hotel_code, 'rates_yearly_summary.html')) as page:
+        return page.read().count('<th colspan="3">')
+
+
+def run(*arguments):
+    """ Run the script in a fresh interpreter. @returns its exit status and output """
+    process = subprocess.Popen([sys.executable, SCRIPT] + list(arguments), cwd=ROOT,
+                               stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    output = process.communicate()[0].decode('utf-8')
+    return process.returncode, output
+
+
+class TestCommandLine(object):
+
+    def test_options(self):
+        options = htmlgenerator.build_parser().parse_args(
+            ['in', 'out', '--year', '2019', '--pattern', '*.xml', '--pattern', 'x.xml', '-q'])
+        assert (options.search_directory, options.output_directory) == ('in', 'out')
+        assert options.year == 2019 and options.quiet
+        assert options.patterns == ['*.xml', 'x.xml']
+
+    def test_defaults_without_options(self):
+        """ Constructed from code, the generator ignores the interpreter's own arguments. """
+        generator = htmlgenerator.HotelHTMLGenerator('in', 'out', year=2020, jobs=3)
+        assert (generator.year, generator.jobs) == (2020, 3)
+        assert generator.search_patterns == ['rates.input.xml']
+
+    def test_quiet_leaves_print_alone(self, capsys):
+        """ --quiet silences the generator's own messages, not print() for everyone else. """
+        options = htmlgenerator.build_parser().parse_args(['in', 'out', '-q'])
+        generator = htmlgenerator.HotelHTMLGenerator('in', 'out', options=options)
+        generator.report("Wrote a page")
+        assert 'print' not in vars(htmlgenerator)
+        assert capsys.readouterr().out == ''
+
+    def test_date_window(self):
+        """ --from and --to give the dates to render, instead of a year. """
+        options = htmlgenerator.build_parser().parse_args(['in', 'out', '--from', '2018-06-01', '-q'])
+        generator = htmlgenerator.HotelHTMLGenerator('in', 'out', options=options)
+        assert generator.year is None
+        assert generator.window == (datetime.date(2018, 6, 1), None)
+        assert htmlgenerator.HotelHTMLGenerator('in', 'out', year=2020).window.days == 366
+
+        for arguments in (['--year', '2018', '--to', '2018-12-31'], ['--from', '2019-01-02', '--to', '2019-01-01']):
+            options = htmlgenerator.build_parser().parse_args(['in', 'out', '-q'] + arguments)
+            with pytest.raises(SystemExit):
+                htmlgenerator.HotelHTMLGenerator('in', 'out', options=options)
+        with pytest.raises(SystemExit):
+            htmlgenerator.build_parser().parse_args(['--from', '2018-02-30'])
+
+    def test_version_and_help(self):
+        status, output = run('--version')
+        assert status == 0 and output.strip() == "htmlgenerator.py {0}".format(htmlgenerator.__version__)
+        status, output = run('--help')
+        assert status == 0 and '--read-ahead' in output and 'Reticulating' not in output
+
+    def test_quiet_incremental_run(self, tmpdir):
+        output_directory = str(tmpdir.join('output'))
+        status, output = run(SAMPLE_HOTEL, output_directory, '--quiet', '--no-cache')
+        assert status == 0 and output == ''
+        assert os.path.isfile(os.path.join(output_directory, 'AAAAAA', 'rate_calendar.html'))
+
+        status, output = run(SAMPLE_HOTEL, output_directory, '--no-banner', '--no-cache')
+        assert status == 0 and 'All output files are up to date.' in output
+        assert 'HTMLGenerator' not in output and '|_|' not in output
+
+    def test_missing_shard_is_rebuilt(self, tmpdir):
+        """ The rate shards are outputs too, so deleting one rebuilds its hotel. """
+        output_directory = str(tmpdir.join('output'))
+        shard = os.path.join(output_directory, 'AAAAAA', 'rates', '2018-08.json')
+        for jobs in ('1', '2'):
+            assert run(SAMPLE_HOTEL, output_directory, '-q', '--jobs', jobs, '--no-cache')[0] == 0
+            assert os.path.isfile(shard)
+            os.remove(shard)
+            assert run(SAMPLE_HOTEL, output_directory, '-q', '--jobs', jobs, '--no-cache')[0] == 0
+            assert os.path.isfile(shard)
+
+    def test_stale_shards_are_removed(self, tmpdir):
+        """ Shards of months that leave the window go when the hotel is rebuilt. """
+        for jobs in ('1', '2'):
+            output_directory = str(tmpdir.join('output' + jobs))
+            shards = os.path.join(output_directory, 'AAAAAA', 'rates')
+            assert run(SAMPLE_HOTEL, output_directory, '-q', '--jobs', jobs, '--no-cache', '--precompress')[0] == 0
+            assert '2018-08.json.gz' in os.listdir(shards)
+            assert run(SAMPLE_HOTEL, output_directory, '-q', '--jobs', jobs, '--no-cache',
+                       '--from', '2018-10-01', '--to', '2018-12-31')[0] == 0
+            assert sorted(name for name in os.listdir(shards) if name.endswith('.json')) == \
+                ['2018-10.json', '2018-11.json', '2018-12.json']
+            assert not [name for name in os.listdir(shards) if name.endswith('.gz')]
+
+    def test_incremental_run_of_split_hotel(self, tmpdir):
+        """ Changing one file of a hotel split over two rebuilds it from both. """
+        search, inputs = split_hotel(tmpdir)
+        output_directory = str(tmpdir.join('output'))
+        assert run(search, output_directory, '-q')[0] == 0
+        assert summary_rooms(output_directory) == 4
+
+        inputs[0].write(inputs[0].read().replace('146.00', '147.00'))
+        assert run(search, output_directory, '-q')[0] == 0
+        assert summary_rooms(output_directory) == 4
+
+    def test_parallel_run_of_split_hotel(self, tmpdir):
+        """ With --jobs, a hotel split over two files is rendered from both, as it is serially. """
+        search, _ = split_hotel(tmpdir)
+        pages = []
+        for jobs in ('1', '2'):
+            output_directory = str(tmpdir.join('output' + jobs))
+            assert run(search, output_directory, '-q', '--jobs', jobs, '--no-cache')[0] == 0
+            assert summary_rooms(output_directory) == 4
+            pages.append(dict(
+                (name, open(os.path.join(output_directory, 'AAAAAA', name)).read())
+                for name in ('rate_calendar.html', 'rates_yearly_summary.html')))
+        assert pages[0] == pages[1]
+
+    def test_lazy_imports(self):
+        """ Importing the module leaves what only rendering, serving and rate stores need. """
+        output = subprocess.check_output([sys.executable, '-c', (
+            "import sys, htmlgenerator; "
+            "print(sorted(set(['jinja2', 'sqlite3', 'http.server', 'xml.etree.ElementTree']) "
+            "& set(sys.modules)))")], cwd=ROOT)
+        assert output.decode('utf-8').strip() == '[]'
@@ -0,0 +1,86 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Tests for scandir based discovery of rate XML files.
+"""
+
+import os
+import sys
+import threading
+import time
+
+# Fix for problems with PATH variable
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+import discovery
+
+
+def make_tree(tmpdir):
+    """ A small search tree with matches at several depths. """
+    tmpdir.join('rates.input.xml').write('<hotel/>')
+    tmpdir.join('a', 'rates.input.xml').write('<hotel/>', ensure=True)
+    tmpdir.join('a', 'b', 'c', 'RATES.INPUT.XML').write('<hotel/>', ensure=True)
+    tmpdir.join('a', 'notes.txt').write('')
+    tmpdir.join('d', 'hotel_1.xml').write('<hotel/>', ensure=True)
+    tmpdir.join('e').ensure(dir=True)
+    return tmpdir
+
+
+def relative_paths(tmpdir, entries):
+    return sorted(os.path.relpath(entry.path, str(tmpdir)) for entry in entries)
+
+
+class TestDiscovery(object):
+
+    def test_matches(self):
+        """ Patterns are globs, matched case insensitively. """
+        assert discovery.matches('Rates.Input.XML', discovery.DEFAULT_PATTERNS)
+        assert discovery.matches('hotel_12.xml', ['*.xml'])
+        assert not discovery.matches('rates.input.xml.bak', discovery.DEFAULT_PATTERNS)
+
+    def test_walk(self, tmpdir):
+        """ The walk finds nested matches only. """
+        make_tree(tmpdir)
+        assert relative_paths(tmpdir, discovery.walk(str(tmpdir))) == [
+            os.path.join('a', 'b', 'c', 'RATES.INPUT.XML'),
+            os.path.join('a', 'rates.input.xml'),
+            'rates.input.xml']
+
+    def test_discover_matches_walk(self, tmpdir):
+        """ The threaded discovery finds what the plain walk finds, top level first. """
+        make_tree(tmpdir)
+        for threads in (1, 4):
+            entries = list(discovery.discover(str(tmpdir), ['*.xml'], threads=threads))
+            assert entries[0].name == 'rates.input.xml'
+            assert relative_paths(tmpdir, entries) == relative_paths(
+                tmpdir, discovery.walk(str(tmpdir), ['*.xml']))
+
+    def test_symlinked_directories_not_followed(self, tmpdir):
+        """ A symlink back up the tree does not loop the walk. """
+        make_tree(tmpdir)
+        os.symlink(str(tmpdir), str(tmpdir.join('a', 'loop')))
+        entries = list(discovery.discover(str(tmpdir)))
+        assert len(entries) == 3
+
+    def test_close_early(self, tmpdir):
+        """ Closing the generator stops the walker threads. """
+        for number in range(20):
+            tmpdir.join(str(number), 'rates.input.xml').write('<hotel/>', ensure=True)
+        found = discovery.discover(str(tmpdir), threads=2)
+        assert next(found).name == 'rates.input.xml'
+        found.close()
+
+    def test_close_early_with_many_subtrees(self, tmpdir):
+        """ More subtrees than fit the queue of matches: none of them is left
+        waiting on it once the generator is closed. """
+        for number in range(2500):
+            tmpdir.join('{0:04d}'.format(number), 'rates.input.xml').write('<hotel/>', ensure=True)
+        threads = threading.active_count()
+        found = discovery.discover(str(tmpdir), threads=2)
+        assert next(found).name == 'rates.input.xml'
+        found.close()
+        deadline = time.time() + 5
+        while threading.active_count() > threads and time.time() < deadline:
+            time.sleep(0.05)
+        assert threading.active_count() == threads
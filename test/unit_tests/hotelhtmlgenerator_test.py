@@ -8,6 +8,7 @@
 
 """
 
+import unittest
 import pytest
 import htmlgenerator
 
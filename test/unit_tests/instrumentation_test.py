@@ -0,0 +1,57 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Tests for the per-stage metrics.
+"""
+
+import json
+import os
+import sys
+
+import pytest
+
+# Fix for problems with PATH variable
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+from instrumentation import Metrics
+
+
+class TestMetrics(object):
+
+    def test_stage_records(self):
+        """ Each stage records its times, counters and hotel. """
+        metrics = Metrics()
+        with metrics.stage('parse', 'AAAAAA') as stage:
+            stage['counts']['days_matched'] = 12
+        record, = metrics.records
+        assert (record['stage'], record['hotel']) == ('parse', 'AAAAAA')
+        assert record['counts'] == {'days_matched': 12}
+        assert record['wall_seconds'] >= 0 and record['cpu_seconds'] >= 0
+
+    def test_failed_stage_is_recorded(self):
+        """ A stage that raises is still measured. """
+        metrics = Metrics()
+        with pytest.raises(ValueError):
+            with metrics.stage('xml_load'):
+                raise ValueError("not well-formed")
+        assert [record['stage'] for record in metrics.records] == ['xml_load']
+
+    def test_totals(self, tmpdir):
+        """ Totals add up the records of a stage, including ones from workers. """
+        metrics = Metrics()
+        for hotel, rooms in (('AAAAAA', 4), ('HNLADR', 23)):
+            with metrics.stage('xml_load', hotel) as stage:
+                stage['counts']['rooms'] = rooms
+        worker = Metrics()
+        with worker.stage('xml_load', 'HNLALC') as stage:
+            stage['counts']['rooms'] = 3
+        metrics.extend(worker.records)
+
+        totals = metrics.totals()['xml_load']
+        assert totals['records'] == 3
+        assert totals['counts'] == {'rooms': 30}
+
+        report = json.loads(open(metrics.save(str(tmpdir.join('metrics.json')))).read())
+        assert report['totals']['xml_load']['counts'] == {'rooms': 30}
+        assert len(report['records']) == 3
@@ -0,0 +1,70 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Tests for minifying and precompressing output files.
+"""
+
+import gzip
+import os
+import sys
+
+# Fix for problems with PATH variable
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+import outputformat
+
+PAGE = u"""<!DOCTYPE html>
+<html>
+  <!-- The rate calendar -->
+  <head>
+    <style type="text/css">
+    /* Month tables */
+    table.month th, table.month td {
+      padding: .2rem .4rem;
+    }
+    </style>
+  </head>
+  <body>
+    <div data-rooms="[&#34;DELUXE  KING&#34;]">
+      <p>Summary   of
+         rates</p>
+    </div>
+    <pre>  ORD:   72.00</pre>
+    <script>
+      var rooms = 'A  B';
+    </script>
+  </body>
+</html>
+"""
+
+
+class TestOutputFormat(object):
+
+    def test_minify_html(self):
+        """ Whitespace in text collapses, tags and preserved elements are kept. """
+        html = outputformat.minify_html(PAGE)
+        assert html.startswith('<!DOCTYPE html> <html> <head> <style type="text/css">')
+        assert 'table.month th,table.month td{padding:.2rem .4rem}' in html
+        assert '<!--' not in html and 'Month tables' not in html
+        assert '<div data-rooms="[&#34;DELUXE  KING&#34;]">' in html
+        assert '<p>Summary of rates</p>' in html
+        assert '<pre>  ORD:   72.00</pre>' in html
+        assert "<script>\n      var rooms = 'A  B';\n    </script>" in html
+        assert html.endswith('</body> </html>')
+
+    def test_precompress(self):
+        """ Siblings decompress to the data and are the same on every run. """
+        data = PAGE.encode('utf-8')
+        siblings = dict(outputformat.precompress(data))
+        assert tuple(siblings) == outputformat.PRECOMPRESSED_SUFFIXES
+        assert gzip.decompress(siblings['.gz']) == data
+        assert outputformat.precompress(data) == outputformat.precompress(data)
+
+    def test_remove_siblings(self, tmpdir):
+        page = tmpdir.join('rate_calendar.html')
+        for suffix in ('', '.gz', '.br'):
+            tmpdir.join('rate_calendar.html' + suffix).write('')
+        outputformat.remove_siblings(str(page), keep=('.gz',))
+        assert sorted(path.basename for path in tmpdir.listdir()) == [
+            'rate_calendar.html', 'rate_calendar.html.gz']
@@ -0,0 +1,70 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Tests for the atomic output writer.
+"""
+
+import os
+import sys
+
+import pytest
+
+# Fix for problems with PATH variable
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+from outputwriter import OutputWriter, exit_on_closed_pipe, write_atomic
+
+
+def failing_chunks():
+    """ A render that breaks half way through. """
+    yield u'<html>'
+    raise RuntimeError("template error")
+
+
+class TestOutputWriter(object):
+
+    def test_write_atomic(self, tmpdir):
+        """ Chunks end up in the file and no temporary file is left behind. """
+        path = str(tmpdir.join('AAAAAA', 'rate_calendar.html'))
+        write_atomic(path, iter([u'<html>', u'café', u'</html>']))
+        with open(path, 'rb') as written:
+            assert written.read() == u'<html>café</html>'.encode('utf-8')
+        assert os.listdir(os.path.dirname(path)) == ['rate_calendar.html']
+
+    def test_failed_write_keeps_old_file(self, tmpdir):
+        """ A render error leaves the previous page untouched. """
+        page = tmpdir.join('rate_calendar.html')
+        page.write('old page')
+        with pytest.raises(RuntimeError):
+            write_atomic(str(page), failing_chunks())
+        assert page.read() == 'old page'
+        assert tmpdir.listdir() == [page]
+
+    def test_pool(self, tmpdir):
+        """ Every submitted page is written, and errors surface on close. """
+        writer = OutputWriter(max_workers=2)
+        paths = [str(tmpdir.join('hotel_{0}'.format(n), 'page.html')) for n in range(10)]
+        for n, path in enumerate(paths):
+            writer.submit(path, [u'page {0}'.format(n)])
+        assert sorted(writer.close()) == sorted(paths)
+        assert tmpdir.join('hotel_7', 'page.html').read() == 'page 7'
+
+        writer = OutputWriter(max_workers=1)
+        tmpdir.join('taken').write('a file, not a directory')
+        writer.submit(str(tmpdir.join('taken', 'page.html')), [u'page'])
+        with pytest.raises(OSError):
+            writer.close()
+
+    def test_exit_on_closed_pipe(self):
+        """ Writing to a pipe nobody reads any more exits quietly, and the
+        stream is left pointing at devnull for the flush on the way out. """
+        read_end, write_end = os.pipe()
+        os.close(read_end)
+        with os.fdopen(write_end, 'w') as stream:
+            with pytest.raises(SystemExit) as error:
+                with exit_on_closed_pipe(stream):
+                    stream.write(u'hotel,room\n')
+            assert error.value.code == 1
+            stream.write(u'AAAAAA,STD\n')
+            stream.flush()
@@ -0,0 +1,67 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Tests for the binary rate cache.
+"""
+
+import os
+import shutil
+import sys
+
+# Fix for problems with PATH variable
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+import ratecache
+import ratefeed
+
+SAMPLE_HOTEL = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            '..', '..', 'misc', 'hotel_xml_files', 'AAAAAA.xml')
+
+
+def sample_source(tmpdir):
+    """ A copy of the sample hotel, so the cache is written to tmpdir. """
+    source = str(tmpdir.join('rates.input.xml'))
+    shutil.copy(SAMPLE_HOTEL, source)
+    return source
+
+
+class TestRateCache(object):
+
+    def test_round_trip(self, tmpdir):
+        """ Hotels loaded from the cache equal the ones parsed from XML. """
+        source = sample_source(tmpdir)
+        parsed = list(ratefeed.iter_hotels(source))
+        ratecache.save(source, parsed)
+
+        loaded = ratecache.load(source)
+        assert [(hotel.hotel_code, hotel.currency, list(hotel.rooms.items()), hotel.ranges)
+                for hotel in loaded] == \
+               [(hotel.hotel_code, hotel.currency, list(hotel.rooms.items()), hotel.ranges)
+                for hotel in parsed]
+
+    def test_columns(self, tmpdir):
+        """ Columns are typed views straight over the cache file. """
+        source = sample_source(tmpdir)
+        parsed, = ratefeed.iter_hotels(source)
+        with ratecache.RateCache(ratecache.save(source, [parsed])) as cache:
+            assert len(cache) == len(parsed.ranges)
+            assert list(cache.columns['room_price']) == [r.room_price for r in parsed.ranges]
+            assert list(cache.columns['start']) == [r.start for r in parsed.ranges]
+
+    def test_stale_cache(self, tmpdir):
+        """ A cache is ignored once its input changes, or when there is none. """
+        source = sample_source(tmpdir)
+        assert ratecache.load(source) is None
+
+        ratecache.save(source, list(ratefeed.iter_hotels(source)))
+        with open(source, 'a') as handle:
+            handle.write('\n')
+        assert ratecache.load(source) is None
+
+    def test_corrupt_cache(self, tmpdir):
+        """ Garbage in place of a cache is treated as a missing cache. """
+        source = sample_source(tmpdir)
+        with open(ratecache.cache_path(source), 'wb') as handle:
+            handle.write(b'not a cache at all')
+        assert ratecache.load(source) is None
@@ -0,0 +1,92 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Tests for rate snapshot diffing.
+"""
+
+from collections import OrderedDict
+import json
+import os
+import sys
+
+# Fix for problems with PATH variable
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+import htmlgenerator
+import ratediff
+from rateindex import RateIndex
+
+
+def make_hotel(code='AAAAAA', price=100.0, occupancy=4):
+    rate_index = RateIndex(code, 'usd')
+    rate_index.add_room('STD', 'Standard')
+    rate_index.add_room('DLX', 'Deluxe')
+    rate_index.add('STD', 'BAR', '2018-08-01', '2018-08-10', price, occupancy=occupancy)
+    rate_index.add('STD', 'BAR', '2018-08-11', '2018-08-20', 120.0, occupancy=occupancy)
+    rate_index.add('DLX', 'BAR', '2018-08-01', '2018-08-20', 200.0)
+    return rate_index
+
+
+def snapshot(*rate_indexes):
+    return OrderedDict((rate_index.hotel_code, rate_index) for rate_index in rate_indexes)
+
+
+class TestRateDiff(object):
+
+    def test_unchanged(self):
+        report = ratediff.diff(snapshot(make_hotel()), snapshot(make_hotel()))
+        assert report['summary'] == {'added': 0, 'removed': 0, 'changed': 0, 'unchanged': 1}
+        assert report['hotels'] == {}
+
+    def test_hashes_skip_unchanged_schedules(self):
+        old_hash, old_rooms = ratediff.schedule_hashes(make_hotel())
+        new_hash, new_rooms = ratediff.schedule_hashes(make_hotel(price=110.0))
+        assert old_hash != new_hash
+        assert old_rooms['STD'][0] != new_rooms['STD'][0]
+        assert old_rooms['DLX'] == new_rooms['DLX']
+
+    def test_price_changes_by_date_range(self):
+        current = make_hotel(price=110.0)
+        current.add('STD', 'BAR', '2018-08-21', '2018-08-22', 130.0)
+        report = ratediff.diff(snapshot(make_hotel()), snapshot(current))
+        hotel = report['hotels']['AAAAAA']
+        assert hotel['status'] == 'changed' and list(hotel['rooms']) == ['STD']
+        assert hotel['rooms']['STD']['rates']['BAR'] == [
+            {'start': '2018-08-01', 'end': '2018-08-10', 'old': [100.0], 'new': [110.0]},
+            {'start': '2018-08-21', 'end': '2018-08-22', 'old': [], 'new': [130.0]},
+        ]
+
+    def test_other_terms(self):
+        report = ratediff.diff(snapshot(make_hotel()), snapshot(make_hotel(occupancy=3)))
+        changes = report['hotels']['AAAAAA']['rooms']['STD']['rates']['BAR']
+        assert [(change['start'], change['end'], change['old'], change.get('terms')) for change in changes] == [
+            ('2018-08-01', '2018-08-10', [100.0], True), ('2018-08-11', '2018-08-20', [120.0], True)]
+
+    def test_hotels_rooms_and_rates_added_and_removed(self):
+        current = make_hotel()
+        current.add_room('STE', 'Suite')
+        current.add('DLX', 'SAVER', '2018-08-01', '2018-08-05', 180.0)
+        report = ratediff.diff(snapshot(make_hotel(), make_hotel('BBBBBB')),
+                               snapshot(current, make_hotel('CCCCCC')))
+        assert report['summary'] == {'added': 1, 'removed': 1, 'changed': 1, 'unchanged': 0}
+        assert report['hotels']['BBBBBB']['status'] == 'removed'
+        assert report['hotels']['CCCCCC'] == {'status': 'added', 'rooms': ['STD', 'DLX']}
+        hotel = report['hotels']['AAAAAA']
+        assert hotel['rooms_added'] == ['STE']
+        assert hotel['rooms']['DLX']['rates_added'] == ['SAVER']
+
+    def test_reordered_feed_is_unchanged(self):
+        current = RateIndex('AAAAAA', 'usd')
+        current.add_room('STD', 'Standard')
+        current.add_room('DLX', 'Deluxe')
+        for rate_range in reversed(make_hotel().ranges):
+            current.add_range(rate_range)
+        assert ratediff.diff(snapshot(make_hotel()), snapshot(current))['hotels'] == {}
+
+    def test_reports(self):
+        report = ratediff.diff(snapshot(make_hotel()), snapshot(make_hotel(price=110.0)))
+        assert json.loads(json.dumps(report)) == report
+        html = u''.join(ratediff.render_html(
+            report, htmlgenerator.HotelHTMLGenerator.template_environment(), 'old.xml', 'new.xml'))
+        assert 'AAAAAA' in html and '100.00' in html and '110.00' in html
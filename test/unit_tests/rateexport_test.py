@@ -0,0 +1,103 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Tests for the flat export of the rates.
+"""
+
+import csv
+import gzip
+import io
+import json
+import os
+import sys
+
+# Fix for problems with PATH variable
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+import rateexport
+from rateindex import RateIndex, to_ordinal
+
+SAMPLE_HOTEL = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            '..', '..', 'misc', 'hotel_xml_files', 'AAAAAA.xml')
+
+RATES_XML = b"""<?xml version="1.0" encoding="UTF-8"?>
+<hotels>
+<hotel code="AAAAAA" currency="usd"><room name="STD"><description>Standard</description>
+ <rate code="BAR"><date start="2018-08-01" end="2018-08-03"><room_price>100.00</room_price></date></rate>
+</room></hotel>
+<hotel code="BBBBBB" currency="eur"><room name="ORD, twin"><description>Ordinary</description>
+ <rate code="BAR"><date start="2018-12-31" end="2019-01-01"><room_price>72.50</room_price></date></rate>
+</room></hotel>
+<hotel code="AAAAAA" currency="usd"/>
+</hotels>
+"""
+
+
+def make_index():
+    rate_index = RateIndex('AAAAAA', 'usd')
+    rate_index.add('STD', 'BAR', '2018-08-01', '2018-08-03', 100.0, adults=2, basis=2)
+    rate_index.add('STD', 'SAVER', '2018-08-10', '2018-08-10', 90.0)
+    return rate_index
+
+
+def export_text(rate_index, per, output_format, **window):
+    """ @returns the export of a RateIndex as text """
+    records = rateexport.Records(rateexport.index_events(rate_index), per, **window)
+    return ''.join(rateexport.encode(records, output_format)), records.count
+
+
+class TestRateExport(object):
+
+    def test_records(self):
+        """ A record per range or per day, clipped to the window. """
+        rows = list(rateexport.Records(rateexport.index_events(make_index()), 'day').rows())
+        assert len(rows) == 4
+        assert rows[0][:6] == ('AAAAAA', 'usd', 'STD', 'BAR', '2018-08-01', 100.0)
+        ranges = list(rateexport.Records(rateexport.index_events(make_index()), 'range',
+                                         end=to_ordinal('2018-08-02')).rows())
+        assert [row[4:6] for row in ranges] == [('2018-08-01', '2018-08-02')]
+
+    def test_formats_match_rows(self):
+        """ CSV and JSON lines hold the same records as rows(), in the same order. """
+        for per in ('range', 'day'):
+            fields = rateexport.FIELDS[per]
+            expected = list(rateexport.Records(rateexport.index_events(make_index()), per).rows())
+
+            text, count = export_text(make_index(), per, 'jsonl')
+            records = [json.loads(line) for line in text.splitlines()]
+            assert count == len(records) == len(expected)
+            assert [tuple(record[field] for field in fields) for record in records] == expected
+            assert list(records[0]) == list(fields)
+
+            text, _ = export_text(make_index(), per, 'csv')
+            rows = list(csv.reader(io.StringIO(text)))
+            assert rows[0] == list(fields)
+            assert rows[1:] == [["" if value is None else str(value) for value in row] for row in expected]
+
+    def test_gzip_is_deterministic(self, tmpdir):
+        paths = [str(tmpdir.join('{0}.csv.gz'.format(number))) for number in (1, 2)]
+        for path in paths:
+            assert rateexport.main([SAMPLE_HOTEL, '--per', 'day', '--output', path]) == 0
+        with open(paths[0], 'rb') as first, open(paths[1], 'rb') as second:
+            assert first.read() == second.read()
+        with gzip.open(paths[0], 'rt') as exported:
+            rows = list(csv.DictReader(exported))
+        assert rows[0]['hotel'] == 'AAAAAA' and rows[0]['date'] == '2018-08-22'
+
+    def test_shards(self, tmpdir):
+        """ Every hotel gets its own file, split out of one feed by byte ranges. """
+        source = tmpdir.join('rates.xml')
+        source.write_binary(RATES_XML)
+        tasks = rateexport.plan_shards([str(source)], jobs=2)
+        assert [name for _, hotels in tasks for _, name in hotels] == ['AAAAAA', 'BBBBBB', 'AAAAAA_2']
+
+        for jobs in ('1', '2'):
+            shards = tmpdir.join('shards' + jobs)
+            assert rateexport.main([str(source), '--shard', str(shards), '--jobs', jobs, '--per', 'day',
+                                    '--format', 'csv', '--to', '2018-12-31']) == 0
+            assert sorted(os.listdir(str(shards))) == ['AAAAAA.csv', 'AAAAAA_2.csv', 'BBBBBB.csv']
+            assert shards.join('BBBBBB.csv').read().splitlines()[1:] == \
+                ['BBBBBB,eur,"ORD, twin",BAR,2018-12-31,72.5,,,,,,,']
+            assert len(shards.join('AAAAAA.csv').read().splitlines()) == 4
+            assert len(shards.join('AAAAAA_2.csv').read().splitlines()) == 1
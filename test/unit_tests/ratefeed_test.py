@@ -0,0 +1,95 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Tests for the streaming rate XML reader.
+"""
+
+import datetime
+import io
+import os
+import sys
+
+# Fix for problems with PATH variable
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+import ratefeed
+
+RATES_XML = b"""<?xml version="1.0"?>
+<rates>
+<!-- begin hotel 0 -->
+<hotel code="AAAAAA" currency="usd">
+  <room name="DELUXE">
+    <description>
+      Deluxe room
+    </description>
+    <rate code="DELUXE">
+    <descr>Deluxe room</descr>
+    <date availability="DELUXE" end="2018-08-24" start="2018-08-22" status="valid">
+      <minimum_nite_stay status="y" value="2"/>
+      <occupancy adults="4" kids="3" total="6"/>
+      <room_price basis="2"> 146.00 </room_price>
+      <extra_adult maximum="2"> 80.00 </extra_adult>
+      <child_price status="y"> 54.00 </child_price>
+      <accommodation_plans>
+        <plan code="fahy"><description>Honeymooners</description></plan>
+      </accommodation_plans>
+    </date>
+    <date end="2018-12-31" start="2018-12-27" status="blackout">
+    </date>
+    </rate>
+  </room>
+</hotel>
+<!-- end hotel 0 -->
+<hotel code="HNLADR" currency="usd">
+  <room name="1VILISLGV">
+    <description>1Bdrm Villa-Island Garden Vw</description>
+    <rate code="1VILISLGV">
+    <date availability="1VILISLGV" end="2019-01-02" start="2018-12-30" status="valid">
+      <minimum_nite_stay status="n" value="na"/>
+      <room_price basis="2">1033.00</room_price>
+    </date>
+    </rate>
+  </room>
+</hotel>
+</rates>
+"""
+
+
+class TestRateFeed(object):
+
+    def test_iter_hotels(self):
+        """ Each <hotel> becomes its own RateIndex, blackout ranges are skipped. """
+        hotels = list(ratefeed.iter_hotels(io.BytesIO(RATES_XML)))
+        assert [hotel.hotel_code for hotel in hotels] == ['AAAAAA', 'HNLADR']
+        assert hotels[0].currency == 'usd'
+        assert list(hotels[0].rooms.items()) == [('DELUXE', 'Deluxe room')]
+        assert len(hotels[0]) == 1
+        assert hotels[1].rates_for_room('1VILISLGV', datetime.date(2019, 1, 1)) == [1033.0]
+
+    def test_record_fields(self):
+        """ Every detail of a priced <date> makes it into the record. """
+        records = list(ratefeed.iter_records(io.BytesIO(RATES_XML)))
+        hotel, rate_range = records[0]
+        assert hotel == 'AAAAAA'
+        assert rate_range.room == 'DELUXE' and rate_range.rate == 'DELUXE'
+        assert rate_range.start == datetime.date(2018, 8, 22).toordinal()
+        assert rate_range.end == datetime.date(2018, 8, 24).toordinal()
+        assert (rate_range.room_price, rate_range.extra_adult, rate_range.child_price) == (146.0, 80.0, 54.0)
+        assert rate_range.minimum_nite_stay == 2
+        assert (rate_range.adults, rate_range.kids, rate_range.occupancy) == (4, 3, 6)
+        assert rate_range.basis == 2
+
+    def test_missing_details(self):
+        """ Optional details the feed leaves out come back as None. """
+        _, rate_range = list(ratefeed.iter_records(io.BytesIO(RATES_XML)))[1]
+        assert rate_range.minimum_nite_stay is None
+        assert rate_range.extra_adult is None and rate_range.occupancy is None
+
+    def test_sample_hotel(self):
+        """ The bundled sample hotel files parse. """
+        path = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            '..', '..', 'misc', 'hotel_xml_files', 'AAAAAA.xml')
+        hotel, = ratefeed.iter_hotels(path)
+        assert hotel.hotel_code == 'AAAAAA'
+        assert list(hotel.rooms) == ['DELUXE', 'DLXSAVER', 'ORD', 'STD']
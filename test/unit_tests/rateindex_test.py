@@ -0,0 +1,113 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Tests for the interval based rate index.
+"""
+
+import datetime
+import os
+import sys
+
+# Fix for problems with PATH variable
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+from rateindex import Interner, RateIndex, Window, ScheduleCache, schedule_key, to_ordinal
+
+
+def make_index():
+    """ A small hotel with two overlapping rates on one room. """
+    index = RateIndex('AAAAAA', 'usd')
+    index.add_room('DELUXE', 'Deluxe room')
+    index.add('DELUXE', 'DELUXE', '2018-08-22', '2018-08-24', 146.0)
+    index.add('DELUXE', 'DLXSAVER', '2018-08-24', '2018-08-31', 120.0)
+    index.add('STANDARD', 'STANDARD', '2018-08-01', '2018-08-22', 72.0)
+    return index
+
+
+class TestRateIndex(object):
+
+    def test_to_ordinal(self):
+        """ Strings, dates and ordinals all convert to the same ordinal. """
+        day = datetime.date(2018, 8, 22)
+        assert to_ordinal('2018-08-22') == to_ordinal(day) == to_ordinal(day.toordinal())
+
+    def test_rates_for_day(self):
+        """ Every range covering a day contributes its price in document order. """
+        index = make_index()
+        assert index.rates_for_day('2018-08-22') == [146.0, 72.0]
+        assert index.rates_for_day('2018-08-24') == [146.0, 120.0]
+        assert index.rates_for_day('2018-09-01') == []
+
+    def test_rates_for_room(self):
+        """ Point lookups only consider the requested room. """
+        index = make_index()
+        assert index.rates_for_room('DELUXE', '2018-08-24') == [146.0, 120.0]
+        assert index.rates_for_room('DELUXE', '2018-08-21') == []
+        assert index.rates_for_room('MISSING', '2018-08-24') == []
+
+    def test_rates_for_range(self):
+        """ The sweep yields one entry per day and clips ranges to the window. """
+        index = make_index()
+        days = index.rates_for_range('2018-08-21', '2018-08-25', room='DELUXE')
+        assert [day for day, _ in days] == [datetime.date(2018, 8, d) for d in range(21, 26)]
+        assert [rates for _, rates in days] == [[], [146.0], [146.0], [146.0, 120.0], [120.0]]
+
+    def test_sweep_matches_point_lookups(self):
+        """ The sweep line and the point lookups agree on every day. """
+        index = make_index()
+        for day, rates in index.sweep('2018-07-30', '2018-09-02'):
+            expected = []
+            for room in index.rooms:
+                expected.extend(index.ranges_for_room(room, day))
+            expected.sort(key=index.ranges.index)
+            assert rates == [rate_range.room_price for rate_range in expected]
+
+    def test_span(self):
+        """ The first and last days covered by the feed are reported. """
+        index = make_index()
+        assert index.first_day == datetime.date(2018, 8, 1)
+        assert index.last_day == datetime.date(2018, 8, 31)
+        assert RateIndex().first_day is None
+
+    def test_coverage(self):
+        """ Days with rates and (day, range) pairs are counted from the ranges. """
+        index = make_index()
+        assert index.coverage('2018-08-20', '2018-08-25') == (6, 3 + 2 + 3)
+        assert index.coverage('2018-09-01', '2018-12-31') == (0, 0)
+
+    def test_window(self):
+        """ Windows may run across years, and open ends close at the hotel's rates. """
+        assert Window.of(2020).days == 366
+        assert str(Window.of(2018)) == '2018'
+        window = Window.of(('2018-11-15', '2019-02-01'))
+        assert window.months() == [(2018, 11), (2018, 12), (2019, 1), (2019, 2)]
+        assert str(window) == '2018-11-15 to 2019-02-01'
+
+        index = make_index()
+        assert Window.of(('2018-08-10', None)).resolve(index) == (datetime.date(2018, 8, 10), index.last_day)
+        assert Window.of((None, '2018-08-10')).resolve(index).start == index.first_day
+        assert Window.of(('2018-08-10', None)).resolve(RateIndex()).days == 1
+
+    def test_values_are_interned(self):
+        """ Equal values of different ranges and hotels are one object. """
+        first, second = make_index(), RateIndex('BBBBBB', 'usd')
+        second.add('DELUXE', 'DELUXE', '2018-08-22', '2018-08-24', float('146.0'))
+        assert second.ranges[0].room_price is first.ranges[0].room_price
+        assert second.ranges[0].start is first.ranges[0].start
+
+        interner = Interner(limit=2)
+        assert interner.intern(1) == 1 and isinstance(interner.intern(1.0), float)
+        interner.intern('x')
+        assert len(interner) == 1
+
+    def test_schedule_cache(self):
+        """ Rooms with the same schedule share a result, whatever their name. """
+        index = make_index()
+        index.add('SUITE', 'SUITE', '2018-08-01', '2018-08-22', 72.0)
+        cache = ScheduleCache()
+        results = [cache.get(schedule_key([rate_range]), lambda: [rate_range.room]) for rate_range in index.ranges]
+        assert results == [['DELUXE'], ['DELUXE'], ['STANDARD'], ['STANDARD']]
+        assert results[2] is results[3]
+        assert (cache.hits, cache.misses, len(cache)) == (1, 3, 3)
+        assert schedule_key(index.ranges[:1], prices_only=True) == ((to_ordinal('2018-08-22'), to_ordinal('2018-08-24'), 146.0),)
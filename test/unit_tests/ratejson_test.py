@@ -0,0 +1,78 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Tests for the compact per-month rate shards of the calendar.
+"""
+
+import datetime
+import json
+import os
+import sys
+
+# Fix for problems with PATH variable
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+import ratefeed
+import ratejson
+from rateindex import RateIndex
+
+SAMPLE_HOTEL = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            '..', '..', 'misc', 'hotel_xml_files', 'AAAAAA.xml')
+
+
+def expand(rooms, shard):
+    """ Decode a shard the way the calendar page does: day -> room -> prices. """
+    days = dict()
+    for run in shard['runs']:
+        for day in range(run[1], run[2] + 1):
+            days.setdefault(day, dict()).setdefault(rooms[run[0]], []).extend(
+                price / 100.0 for price in run[3:])
+    return days
+
+
+class TestRateJson(object):
+
+    def test_runs(self):
+        """ Days with the same prices collapse into one run per room. """
+        rate_index = RateIndex('AAAAAA', 'usd')
+        rate_index.add_room('STD')
+        rate_index.add_room('ORD')
+        rate_index.add('STD', 'BAR', '2018-01-30', '2018-02-03', 126.0)
+        rate_index.add('ORD', 'BAR', '2018-01-30', '2018-01-31', 72.0)
+        rate_index.add('ORD', 'AAA', '2018-01-31', '2018-01-31', 74.5)
+        shards = ratejson.month_shards(rate_index, datetime.date(2018, 1, 1), datetime.date(2018, 12, 31))
+        assert list(shards) == ['2018-01', '2018-02']
+        assert shards['2018-01']['runs'] == [[0, 30, 31, 12600], [1, 30, 30, 7200], [1, 31, 31, 7200, 7450]]
+        assert shards['2018-02']['runs'] == [[0, 1, 3, 12600]]
+        assert ratejson.encode(shards['2018-02']) == '{"month":"2018-02","runs":[[0,1,3,12600]]}'
+
+    def test_matches_sweep(self):
+        """ Decoding every shard gives back each day's rates in document order. """
+        rate_index, = ratefeed.iter_hotels(SAMPLE_HOTEL)
+        start, end = datetime.date(2018, 1, 1), datetime.date(2018, 12, 31)
+        shards = ratejson.month_shards(rate_index, start, end)
+        rooms = list(rate_index.rooms)
+        decoded = dict((month, expand(rooms, json.loads(ratejson.encode(shard))))
+                       for month, shard in shards.items())
+
+        for day, rate_ranges in rate_index.sweep_ranges(start, end):
+            expected = dict()
+            for rate_range in rate_ranges:
+                expected.setdefault(rate_range.room, []).append(rate_range.room_price)
+            assert decoded.get(day.isoformat()[:7], dict()).get(day.day, dict()) == expected
+        assert decoded['2018-08'][22] == {'DELUXE': [146.0], 'DLXSAVER': [148.0],
+                                          'ORD': [72.0, 74.0], 'STD': [126.0, 128.0]}
+
+    def test_repeated_schedule(self):
+        """ Rooms with the same schedule get the same runs, under their own number. """
+        rate_index = RateIndex('AAAAAA', 'usd')
+        rate_index.add_room('STD')
+        rate_index.add_room('ORD')
+        for room in ('STD', 'ORD'):
+            rate_index.add(room, 'BAR', '2018-01-30', '2018-02-03', 126.0)
+        cache = ratejson.ScheduleCache()
+        shards = ratejson.month_shards(rate_index, datetime.date(2018, 1, 1), datetime.date(2018, 12, 31), cache)
+        assert shards['2018-01']['runs'] == [[0, 30, 31, 12600], [1, 30, 31, 12600]]
+        assert shards['2018-02']['runs'] == [[0, 1, 3, 12600], [1, 1, 3, 12600]]
+        assert (cache.hits, cache.misses) == (1, 1)
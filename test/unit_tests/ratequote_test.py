@@ -0,0 +1,139 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Tests for stay quotes.
+"""
+
+import datetime
+import io
+import os
+import sys
+
+import pytest
+
+# Fix for problems with PATH variable
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+import ratefeed
+import ratequote
+from rateindex import RateIndex
+
+SAMPLE_HOTEL = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            '..', '..', 'misc', 'hotel_xml_files', 'AAAAAA.xml')
+
+
+def make_engine():
+    rate_index = RateIndex('AAAAAA', 'usd')
+    rate_index.add('STD', 'BAR', '2018-08-01', '2018-08-10', 100.0, extra_adult=20.0, child_price=10.0,
+                   adults=3, kids=2, occupancy=4, basis=2)
+    rate_index.add('STD', 'BAR', '2018-08-11', '2018-08-20', 150.0, extra_adult=25.0,
+                   adults=3, kids=2, occupancy=4, basis=2)
+    rate_index.add('STD', 'SAVER', '2018-08-01', '2018-08-20', 90.0, minimum_nite_stay=4)
+    # Overrides the BAR rate on the 5th, and leaves the 22nd without rates
+    rate_index.add('STD', 'BAR', '2018-08-05', '2018-08-05', 300.0, basis=2)
+    rate_index.add('STD', 'BAR', '2018-08-21', '2018-08-21', 100.0)
+    rate_index.add('STD', 'BAR', '2018-08-23', '2018-08-25', 100.0)
+    return ratequote.QuoteEngine(rate_index)
+
+
+class TestQuoteEngine(object):
+
+    def test_totals(self):
+        engine = make_engine()
+        quote = engine.quote('STD', '2018-08-01', 3, rate='BAR')
+        assert quote.total == 300.0 and quote.check_in == datetime.date(2018, 8, 1)
+        # Across ranges, with the later range winning on the 5th
+        assert engine.quote('STD', '2018-08-04', 2, rate='BAR').total == 400.0
+        assert engine.quote('STD', '2018-08-10', 2, rate='BAR').total == 250.0
+        # A third adult and a kid pay extra
+        assert engine.quote('STD', '2018-08-01', 2, adults=3, kids=1, rate='BAR').total == 260.0
+
+    def test_cheapest_rate_and_minimum_stay(self):
+        engine = make_engine()
+        assert engine.rates('STD') == ['BAR', 'SAVER']
+        # SAVER is cheaper but needs 4 nights
+        assert engine.quote('STD', '2018-08-01', 3).rate == 'BAR'
+        quote = engine.quote('STD', '2018-08-01', 4)
+        assert (quote.rate, quote.total) == ('SAVER', 360.0)
+
+    def test_unbookable(self):
+        engine = make_engine()
+        # Too many guests, a price missing for the party, a night without rates
+        assert engine.quote('STD', '2018-08-01', 2, adults=4, rate='BAR') is None
+        assert engine.quote('STD', '2018-08-11', 2, kids=1, rate='BAR') is None
+        assert engine.quote('STD', '2018-08-21', 3, rate='BAR') is None
+        # Outside the rates, unknown rooms and rates, no nights
+        assert engine.quote('STD', '2018-07-31', 2) is None
+        assert engine.quote('STD', '2018-08-25', 2) is None
+        assert engine.quote('DLX', '2018-08-01', 2) is None
+        assert engine.quote('STD', '2018-08-01', 2, rate='NONE') is None
+        assert engine.quote('STD', '2018-08-01', 0) is None
+
+    def test_batch(self):
+        engine = make_engine()
+        queries = [('STD', datetime.date(2018, 8, 1) + datetime.timedelta(days), nights)
+                   for days in range(-2, 26) for nights in range(1, 8)]
+        quotes = engine.quote_many(queries)
+        assert len(quotes) == len(queries)
+        assert quotes == [engine.quote(*query) for query in queries]
+
+    def test_matches_nightly_sum(self):
+        """ Quotes of the sample hotel equal the nightly prices added up one by one. """
+        rate_index, = ratefeed.iter_hotels(SAMPLE_HOTEL)
+        engine = ratequote.QuoteEngine(rate_index)
+        quote = engine.quote('DELUXE', '2018-08-22', 7, adults=3, kids=1, rate='DELUXE')
+        expected = 0.0
+        for day in range(7):
+            rate_range, = [rate_range for rate_range in rate_index.ranges_for_room(
+                'DELUXE', datetime.date(2018, 8, 22) + datetime.timedelta(day))
+                if rate_range.rate == 'DELUXE']
+            expected += rate_range.room_price + rate_range.extra_adult + rate_range.child_price
+        assert abs(quote.total - expected) < 0.005
+
+    def test_repeated_schedule(self):
+        """ Rates with the same terms share their plan, across rooms and hotels. """
+        first, second = RateIndex('AAAAAA', 'usd'), RateIndex('BBBBBB', 'usd')
+        first.add('STD', 'BAR', '2018-08-01', '2018-08-10', 100.0, basis=2)
+        second.add('KING', 'FLEX', '2018-08-01', '2018-08-10', 100.0, basis=2)
+        second.add('QUEEN', 'FLEX', '2018-08-01', '2018-08-10', 100.0, basis=1)
+        plans = ratequote.ScheduleCache()
+        first_engine = ratequote.QuoteEngine(first, plans)
+        second_engine = ratequote.QuoteEngine(second, plans)
+        assert first_engine._plans['STD']['BAR'] is second_engine._plans['KING']['FLEX']
+        assert len(plans) == 2
+        assert second_engine.quote('KING', '2018-08-01', 2).rate == 'FLEX'
+        assert second_engine.quote('QUEEN', '2018-08-01', 2, adults=2) is None
+
+    def test_bad_batch_rows(self):
+        """ A missing column or a bad value names the line of the batch file it is on. """
+        def read(text):
+            return list(ratequote.read_queries(io.StringIO(text), 'AAAAAA'))
+
+        assert read(u'room,check_in,nights,kids\nSTD,2018-08-01,2,1\n') == \
+            [('AAAAAA', ('STD', '2018-08-01', 2, 2, 1, None))]
+        for text, message in ((u'room,nights\nSTD,2\n', 'Line 1 of the batch file: no check_in column.'),
+                              (u'room,check_in,nights\nSTD,2018-08-01,2\nSTD,2018-08-01\n', 'Line 3'),
+                              (u'room,check_in,nights\nSTD,2018-08-01,two\n', "Line 2 of the batch file: nights 'two'"),
+                              (u'room,check_in,nights\nSTD,2018-02-30,2\n', "check_in '2018-02-30'"),
+                              (u'room,check_in,nights,adults\nSTD,2018-08-01,2,-1\n', "adults '-1'")):
+            with pytest.raises(SystemExit) as error:
+                read(text)
+            assert message in str(error.value)
+
+    def test_bad_single_quote(self, tmpdir, capsys):
+        """ Guests are checked on the command line as in batch rows, and --hotel is
+        asked for when the input holds several hotels. """
+        for arguments in (['--adults', '-1'], ['--kids', '-2'], ['--kids', 'two']):
+            with pytest.raises(SystemExit) as error:
+                ratequote.main([SAMPLE_HOTEL, 'STD', '2018-08-22', '2'] + arguments)
+            assert error.value.code == 2
+            assert 'is not a whole number of at least 0' in capsys.readouterr().err
+
+        feed = tmpdir.join('rates.xml')
+        with open(SAMPLE_HOTEL) as sample:
+            hotel = sample.read()
+        feed.write('<hotels>' + hotel + hotel.replace('AAAAAA', 'BBBBBB') + '</hotels>')
+        with pytest.raises(SystemExit):
+            ratequote.main([str(feed), 'STD', '2018-08-22', '2'])
+        assert '--hotel is needed: INPUT holds several hotels' in capsys.readouterr().err
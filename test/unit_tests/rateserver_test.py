@@ -0,0 +1,138 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Tests for the on-demand page server.
+"""
+
+import gzip
+import json
+import os
+import sys
+import threading
+
+from urllib.request import Request, urlopen
+from urllib.error import HTTPError
+
+import pytest
+
+# Fix for problems with PATH variable
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+import htmlgenerator
+import ratefeed
+import rateserver
+
+SAMPLE_HOTEL = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            '..', '..', 'misc', 'hotel_xml_files', 'AAAAAA.xml')
+
+
+@pytest.fixture
+def server():
+    """ A RateServer on a free port serving the sample hotel. """
+    rate_index, = ratefeed.iter_hotels(SAMPLE_HOTEL)
+    renders = []
+
+    def render(rate_index, year, output_file):
+        renders.append((year, output_file))
+        environment = htmlgenerator.HotelHTMLGenerator.template_environment()
+        return dict(htmlgenerator.HotelHTMLGenerator.render_hotel(rate_index, year, environment))[output_file]
+
+    server = rateserver.RateServer(
+        ('127.0.0.1', 0), lambda hotel_code: (rate_index, 'v1') if hotel_code == 'AAAAAA' else None,
+        render, htmlgenerator.HotelHTMLGenerator.OUTPUT_FILES, 2018)
+    server.renders = renders
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def get(server, path, **headers):
+    url = 'http://127.0.0.1:{0}{1}'.format(server.server_address[1], path)
+    try:
+        return urlopen(Request(url, headers=headers))
+    except HTTPError as error:
+        return error
+
+
+class TestPageCache(object):
+
+    def test_least_recently_used_is_evicted(self):
+        """ The cache stays within its size, dropping the oldest unused page. """
+        cache = rateserver.PageCache(max_bytes=24)
+        page = rateserver.Page(b'x' * 5, b'y' * 3, '"a"')
+        for key in 'abc':
+            cache.put(key, page)
+        assert cache.get('a') is page
+        cache.put('d', page)
+        assert cache.get('b') is None
+        assert len(cache) == 3 and cache.size == 24
+
+
+class TestRateServer(object):
+
+    def test_page_renders_once(self, server):
+        """ Repeated views come from the cache, and revalidate with the ETag. """
+        first = get(server, '/AAAAAA/rate_calendar.html')
+        assert first.status == 200
+        body = first.read()
+        assert b'rate-calendar' in body
+
+        assert get(server, '/AAAAAA/rate_calendar.html').read() == body
+        not_modified = get(server, '/AAAAAA/rate_calendar.html', **{'If-None-Match': first.headers['ETag']})
+        assert not_modified.code == 304
+        assert server.renders == [(2018, 'rate_calendar.html')]
+
+    def test_year_and_gzip(self, server):
+        """ Other years are rendered on demand, gzip'ed when the client accepts it. """
+        response = get(server, '/AAAAAA/2019/rates_yearly_summary.html', **{'Accept-Encoding': 'gzip'})
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert b'2019' in gzip.decompress(response.read())
+        assert server.renders == [(2019, 'rates_yearly_summary.html')]
+
+    def test_rate_shard(self, server):
+        """ The monthly rate shards the calendar loads are served as JSON. """
+        response = get(server, '/AAAAAA/rates/2018-08.json')
+        assert response.headers['Content-Type'] == 'application/json'
+        assert json.loads(response.read().decode('utf-8'))['month'] == '2018-08'
+        assert get(server, '/AAAAAA/rates/2030-01.json').code == 404
+
+    def test_unknown_pages(self, server):
+        assert get(server, '/BBBBBB/rate_calendar.html').code == 404
+        assert get(server, '/AAAAAA/index.html').code == 404
+
+    def test_quiet_access_log(self, server, capsys):
+        """ Requests are logged to stderr, except with -q/--quiet. """
+        get(server, '/AAAAAA/rate_calendar.html').read()
+        assert '"GET /AAAAAA/rate_calendar.html HTTP/1.1" 200' in capsys.readouterr().err
+
+        server.quiet = True
+        get(server, '/AAAAAA/rate_calendar.html').read()
+        assert get(server, '/BBBBBB/rate_calendar.html').code == 404
+        assert capsys.readouterr().err == ''
+
+    def test_generator_lookup(self, tmpdir):
+        """ The generator's server sees a reloaded hotel and its new version at once. """
+        source = tmpdir.join('AAAAAA', 'rates.input.xml')
+        with open(SAMPLE_HOTEL) as sample:
+            source.write(sample.read(), ensure=True)
+        options = htmlgenerator.build_parser().parse_args(['--port', '0', '-q', '--no-cache'])
+        generator = htmlgenerator.HotelHTMLGenerator(str(tmpdir), str(tmpdir.join('output')), options=options)
+        generator.scan().load_manifest().reload(generator.paths)
+        server = generator.make_server()
+        try:
+            lookup = server.lookup
+            rate_index, version = lookup('AAAAAA')
+            assert rate_index is generator.rate_indexes['AAAAAA'] and lookup('BBBBBB') is None
+
+            before = generator.versioned_hotels
+            source.write(source.read().replace('146.00', '147.00'))
+            generator.reload([str(source)])
+            assert generator.versioned_hotels is not before and before['AAAAAA'][1] == version
+            assert lookup('AAAAAA') == (generator.rate_indexes['AAAAAA'], generator.versioned_hotels['AAAAAA'][1])
+            assert lookup('AAAAAA')[1] != version
+        finally:
+            server.server_close()
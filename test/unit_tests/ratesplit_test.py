@@ -0,0 +1,70 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Tests for splitting the unsplit rates.xml into one file per hotel.
+"""
+
+import os
+import sys
+
+# Fix for problems with PATH variable
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+import ratefeed
+import ratesplit
+
+SAMPLE_HOTEL = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            '..', '..', 'misc', 'hotel_xml_files', 'AAAAAA.xml')
+
+RATES_XML = b"""<?xml version="1.0" encoding="UTF-8"?>
+<hotels>
+<!-- begin hotel 1 -->
+<hotel code="AAAAAA" currency="usd"><room name="STD"><description>Standard</description></room></hotel>
+<hotel code='BBBBBB'>
+ <room name="ORD"><description>Ordinary</description></room>
+</hotel>
+<hotel code="AAAAAA"/>
+<hotel><room name="X"/></hotel>
+</hotels>
+"""
+
+
+class TestRateSplit(object):
+
+    def test_offsets_and_names(self):
+        """ Every <hotel> start tag is found, duplicate codes get their own directory. """
+        offsets = list(ratesplit.hotel_offsets(RATES_XML))
+        assert [code for _, code in offsets] == ['AAAAAA', 'BBBBBB', 'AAAAAA', None]
+        names = [name for _, name in ratesplit.directory_names(offsets)]
+        assert names == ['AAAAAA', 'BBBBBB', 'AAAAAA_2', 'hotel_at_{0}'.format(offsets[3][0])]
+        assert RATES_XML[offsets[2][0]:ratesplit.hotel_end(RATES_XML, offsets[2][0])] == b'<hotel code="AAAAAA"/>'
+
+    def test_byte_ranges(self):
+        """ Groups are contiguous, cover every hotel and hold about the same bytes. """
+        hotels = [(start, str(start)) for start in range(0, 1000, 100)]
+        groups = ratesplit.byte_ranges(hotels, 1000, 3)
+        assert [hotel for group in groups for hotel in group] == hotels
+        assert [len(group) for group in groups] == [3, 4, 3]
+        assert ratesplit.byte_ranges(hotels, 1000, 50) == [[hotel] for hotel in hotels]
+
+    def test_split(self, tmpdir):
+        """ Each hotel is copied byte for byte, in parallel or not. """
+        source = tmpdir.join('rates.xml')
+        source.write_binary(RATES_XML)
+        for jobs in (1, 2):
+            output = tmpdir.join('split{0}'.format(jobs))
+            split = ratesplit.split(str(source), str(output), jobs)
+            assert [name for name, _ in split][:3] == ['AAAAAA', 'BBBBBB', 'AAAAAA_2']
+            written = output.join('BBBBBB', 'rates.input.xml').read_binary()
+            assert written.startswith(b'<?xml version="1.0" encoding="UTF-8"?>\n<hotel code=\'BBBBBB\'>\n')
+            hotel, = ratefeed.iter_hotels(split[1][1])
+            assert hotel.hotel_code == 'BBBBBB' and list(hotel.rooms) == ['ORD']
+
+    def test_split_sample(self, tmpdir):
+        """ A split hotel parses exactly as the original. """
+        (name, path), = ratesplit.split(SAMPLE_HOTEL, str(tmpdir))
+        original, = ratefeed.iter_hotels(SAMPLE_HOTEL)
+        copy, = ratefeed.iter_hotels(path)
+        assert name == 'AAAAAA'
+        assert copy.ranges == original.ranges and copy.rooms == original.rooms
@@ -0,0 +1,83 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Tests for the SQLite rate store.
+"""
+
+import os
+import sys
+
+import pytest
+
+# Fix for problems with PATH variable
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+import ratefeed
+import ratestore
+from rateindex import RateIndex
+
+SAMPLE_HOTEL = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            '..', '..', 'misc', 'hotel_xml_files', 'AAAAAA.xml')
+
+
+class TestRateStore(object):
+
+    def test_round_trip(self, tmpdir):
+        """ A stored hotel loads back exactly as it was parsed. """
+        database = str(tmpdir.join('rates.db'))
+        with ratestore.RateStore(database) as store:
+            assert store.ingest_files([SAMPLE_HOTEL]) == ['AAAAAA']
+            loaded = store.load('AAAAAA')
+            assert store.load('BBBBBB') is None
+        original, = ratefeed.iter_hotels(SAMPLE_HOTEL)
+        assert loaded.currency == original.currency
+        assert loaded.rooms == original.rooms
+        assert loaded.ranges == original.ranges
+        assert ratestore.is_database(database) and not ratestore.is_database(SAMPLE_HOTEL)
+
+    def test_changed(self, tmpdir):
+        """ Only hotels whose rates differ from the stored ones count as changed. """
+        with ratestore.RateStore(str(tmpdir.join('rates.db'))) as store:
+            store.ingest_files([SAMPLE_HOTEL])
+            assert store.ingest_files([SAMPLE_HOTEL]) == []
+
+            hotel, = ratefeed.iter_hotels(SAMPLE_HOTEL)
+            hotel.add('STD', 'STANDARD', '2019-01-01', '2019-01-31', 99.0)
+            assert store.ingest([(SAMPLE_HOTEL, hotel)]) == ['AAAAAA']
+            assert [row['code'] for row in store.changed_since('')] == ['AAAAAA']
+            assert len(store.load('AAAAAA')) == len(hotel)
+
+    def test_split_hotel_is_merged(self, tmpdir):
+        """ A hotel found in several inputs is stored as one. """
+        first, second = RateIndex('AAAAAA', 'usd'), RateIndex('AAAAAA', 'usd')
+        first.add_room('STD', 'Standard')
+        first.add('STD', 'BAR', '2018-08-01', '2018-08-31', 126.0)
+        second.add_room('ORD', 'Ordinary')
+        second.add('ORD', 'BAR', '2018-08-01', '2018-08-31', 72.0)
+        with ratestore.RateStore(str(tmpdir.join('rates.db'))) as store:
+            store.ingest([('a.xml', first), ('b.xml', second)])
+            merged = store.load('AAAAAA')
+        assert list(merged.rooms) == ['STD', 'ORD']
+        assert [rate_range.room_price for rate_range in merged.ranges] == [126.0, 72.0]
+
+    def test_queries(self, tmpdir):
+        database = str(tmpdir.join('rates.db'))
+        with ratestore.RateStore(database) as store:
+            store.ingest_files([SAMPLE_HOTEL])
+        with ratestore.RateStore(database, read_only=True) as store:
+            cheapest, = store.lowest('ORD', '2018-08-22', '2018-08-22')
+            assert (cheapest['rate'], cheapest['room_price']) == ('SINGLE', 72.0)
+            day = store.rates_for_day('2018-08-22', room='STD')
+            assert [row['room_price'] for row in day] == [126.0, 128.0]
+            assert [row['code'] for row in store.hotels()] == ['AAAAAA']
+
+    def test_not_a_rate_store(self, tmpdir):
+        """ Any other file is left alone, with a message rather than a traceback. """
+        other = tmpdir.join('rates.xml')
+        other.write('<hotels/>')
+        for argv in (['hotels', str(other)], ['ingest', str(other), SAMPLE_HOTEL]):
+            with pytest.raises(SystemExit) as error:
+                ratestore.main(argv)
+            assert str(error.value) == "{0} is not a rate store.".format(other)
+        assert other.read() == '<hotels/>'
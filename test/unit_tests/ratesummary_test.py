@@ -0,0 +1,70 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Tests for the monthly rate summary.
+"""
+
+import datetime
+import os
+import sys
+
+# Fix for problems with PATH variable
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+import ratefeed
+import ratesummary
+from rateindex import RateIndex
+
+SAMPLE_HOTEL = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            '..', '..', 'misc', 'hotel_xml_files', 'HNLADR.xml')
+
+
+class TestRateSummary(object):
+
+    def test_month_split(self):
+        """ A range spanning two months counts in both, weighted by nights. """
+        index = RateIndex('AAAAAA', 'usd')
+        index.add('DELUXE', 'DELUXE', '2018-08-30', '2018-09-02', 100.0)
+        index.add('DELUXE', 'DELUXE', '2018-09-01', '2018-09-01', 200.0)
+        summary = ratesummary.summarize(index, '2018-01-01', '2018-12-31', percentiles=[50, 100])
+
+        august, september = summary['DELUXE']
+        assert august.month == datetime.date(2018, 8, 1)
+        assert (august.low, august.high, august.mean, august.nights) == (100.0, 100.0, 100.0, 2)
+        assert (september.low, september.high, september.nights) == (100.0, 200.0, 3)
+        assert abs(september.mean - 400.0 / 3) < 1e-9
+        assert september.percentiles == {50: 100.0, 100: 200.0}
+
+    def test_window(self):
+        """ Ranges are clipped to the summarized window. """
+        index = RateIndex('AAAAAA', 'usd')
+        index.add('DELUXE', 'DELUXE', '2018-12-30', '2019-01-05', 100.0)
+        index.add_room('EMPTY', 'No rates')
+        summary = ratesummary.summarize(index, '2018-01-01', '2018-12-31')
+        assert [month.nights for month in summary['DELUXE']] == [2]
+        assert summary['EMPTY'] == []
+
+    def test_matches_day_matrix(self):
+        """ The grouped reduction equals reducing every day's rates of a real hotel. """
+        rate_index, = ratefeed.iter_hotels(SAMPLE_HOTEL)
+        summary = ratesummary.summarize(rate_index, '2018-01-01', '2018-12-31')
+        for room, months in summary.items():
+            by_month = dict()
+            for day, rates in rate_index.sweep('2018-01-01', '2018-12-31', room):
+                by_month.setdefault(day.month, []).extend(rates)
+            expected = [(m, min(r), max(r), len(r)) for m, r in sorted(by_month.items()) if r]
+            assert [(s.month.month, s.low, s.high, s.nights) for s in months] == expected
+            for month in months:
+                rates = by_month[month.month.month]
+                assert abs(month.mean - sum(rates) / len(rates)) < 1e-6
+
+    def test_repeated_schedule(self):
+        """ Rooms of any hotel with the same schedule share one summary. """
+        first, second = RateIndex('AAAAAA', 'usd'), RateIndex('BBBBBB', 'usd')
+        first.add('DELUXE', 'DELUXE', '2018-08-30', '2018-09-02', 100.0)
+        second.add('KING', 'BAR', '2018-08-30', '2018-09-02', 100.0, minimum_nite_stay=2)
+        cache = ratesummary.ScheduleCache()
+        deluxe = ratesummary.summarize(first, '2018-01-01', '2018-12-31', cache=cache)['DELUXE']
+        assert ratesummary.summarize(second, '2018-01-01', '2018-12-31', cache=cache)['KING'] is deluxe
+        assert ratesummary.summarize(second, '2018-01-01', '2018-08-31', cache=cache)['KING'] != deluxe
@@ -0,0 +1,79 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Tests for the read-ahead of input files.
+"""
+
+import mmap
+import os
+import sys
+
+import pytest
+
+# Fix for problems with PATH variable
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+import ratefeed
+import readahead
+
+SAMPLE_HOTEL = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            '..', '..', 'misc', 'hotel_xml_files', 'AAAAAA.xml')
+
+
+class TestReadAhead(object):
+
+    def make_files(self, tmpdir, count):
+        paths = []
+        for number in range(count):
+            path = tmpdir.join('{0}.txt'.format(number))
+            path.write_binary('file {0}'.format(number).encode('ascii') * 1000)
+            paths.append(str(path))
+        return paths
+
+    def test_order_and_content(self, tmpdir):
+        """ Files come in the order given, mapped, and are closed once passed. """
+        paths = self.make_files(tmpdir, 10)
+        seen = []
+        with readahead.ReadAhead(paths, depth=2) as files:
+            for path, buffer in files:
+                assert isinstance(buffer, mmap.mmap)
+                assert buffer[:] == open(path, 'rb').read()
+                seen.append((path, buffer))
+        assert [path for path, _ in seen] == paths
+        assert all(buffer.closed for _, buffer in seen)
+
+    def test_unwanted_and_empty(self, tmpdir):
+        paths = self.make_files(tmpdir, 3)
+        empty = tmpdir.join('empty.txt')
+        empty.write_binary(b'')
+        paths.append(str(empty))
+        with readahead.ReadAhead(paths, wanted=lambda path: not path.endswith('1.txt')) as files:
+            buffers = [buffer for _, buffer in files]
+        assert [buffer is None for buffer in buffers] == [False, True, False, True]
+
+    def test_error_and_early_exit(self, tmpdir):
+        """ A missing file raises when it is reached, and leaving the loop stops the thread. """
+        paths = self.make_files(tmpdir, 2) + [str(tmpdir.join('missing.txt'))]
+        with readahead.ReadAhead(paths, depth=1) as files:
+            iterator = iter(files)
+            next(iterator)
+            next(iterator)
+            with pytest.raises(EnvironmentError):
+                next(iterator)
+
+        files = readahead.ReadAhead(self.make_files(tmpdir, 20), depth=1)
+        next(iter(files))
+        files.close()
+        assert not files._thread.is_alive()
+
+    def test_parse_from_mapping(self):
+        """ The parser reads a mapped file just as the file itself. """
+        buffer = readahead.map_file(SAMPLE_HOTEL, bytearray(4096))
+        try:
+            from_buffer, = ratefeed.iter_hotels(buffer)
+        finally:
+            buffer.close()
+        from_path, = ratefeed.iter_hotels(SAMPLE_HOTEL)
+        assert from_buffer.ranges == from_path.ranges
+        assert from_buffer.rooms == from_path.rooms
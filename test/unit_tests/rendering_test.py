@@ -0,0 +1,96 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Tests for rendering hotels, serially and in worker processes.
+"""
+
+import io
+import json
+import os
+import re
+import sys
+
+# Fix for problems with PATH variable
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+import htmlgenerator
+import ratefeed
+
+SAMPLE_HOTEL = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            '..', '..', 'misc', 'hotel_xml_files', 'AAAAAA.xml')
+
+
+class TestRendering(object):
+
+    def test_rate_calendar(self):
+        """ The calendar holds every month and lists the months with rate shards. """
+        generator = htmlgenerator.HotelHTMLGenerator
+        rate_index, = ratefeed.iter_hotels(SAMPLE_HOTEL)
+        pages = generator.render_hotel(rate_index, 2018, generator.template_environment())
+        html = ''.join(pages[0][1])
+        assert html.count('class="month"') >= 12
+        months = json.loads(re.search(r'data-months="(.*?)"', html).group(1).replace('&#34;', '"'))
+        shards = [output_file for output_file, _ in pages[2:]]
+        assert shards == ['rates/{0}.json'.format(month) for month in months]
+        assert 'rates/2018-08.json' in shards
+        assert 'id="rate-shards"' not in html
+
+    def test_self_contained_calendar(self):
+        """ A self-contained calendar carries its shards in the page instead of fetching them. """
+        generator = htmlgenerator.HotelHTMLGenerator
+        rate_index, = ratefeed.iter_hotels(SAMPLE_HOTEL)
+        pages = generator.render_hotel(rate_index, 2018, generator.template_environment(), self_contained=True)
+        html = ''.join(pages[0][1])
+        embedded = json.loads(re.search(
+            r'<script type="application/json" id="rate-shards">(.*?)</script>', html).group(1))
+        assert ['rates/{0}.json'.format(month) for month in embedded] == [name for name, _ in pages[2:]]
+        assert [embedded[month] for month in embedded] == [json.loads(''.join(chunks)) for _, chunks in pages[2:]]
+
+    def test_worker(self, tmpdir):
+        """ A worker writes the same page the serial path renders. """
+        generator = htmlgenerator.HotelHTMLGenerator
+        path_hotels, results, records = htmlgenerator._render_hotel_files(
+            [SAMPLE_HOTEL], 2018, str(tmpdir), use_cache=False)
+        rate_index, = ratefeed.iter_hotels(SAMPLE_HOTEL)
+        rendered = generator.render_hotel(rate_index, 2018, generator.template_environment())
+        expected_paths = [generator.output_path(str(tmpdir), 'AAAAAA', output_file)
+                          for output_file, _ in rendered]
+        assert path_hotels == [(SAMPLE_HOTEL, ['AAAAAA'])]
+        assert results == [('AAAAAA', expected_paths)]
+        for expected_path, (_, chunks) in zip(expected_paths, rendered):
+            with io.open(expected_path, encoding='utf-8') as written:
+                assert written.read() == ''.join(chunks)
+
+    def test_environment_is_shared(self):
+        """ The template environment is only built once per process. """
+        generator = htmlgenerator.HotelHTMLGenerator
+        environment = generator.template_environment()
+        assert generator.template_environment() is environment
+        assert environment.bytecode_cache is not None
+
+    def test_month_grids_are_shared(self):
+        """ The month grids of a year are built once, and match the calendar module's. """
+        import calendar
+        generator = htmlgenerator.HotelHTMLGenerator
+        grids = generator.month_grids(2020)
+        assert generator.month_grids(2020) is grids
+        assert len(grids) == 12
+        assert grids[1] == calendar.HTMLCalendar(calendar.SUNDAY).formatmonth(2020, 2)
+        assert '>29<' in grids[1]
+
+    def test_window_across_years(self):
+        """ A window across the new year gets one table and shard per month it touches. """
+        generator = htmlgenerator.HotelHTMLGenerator
+        rate_index, = ratefeed.iter_hotels(SAMPLE_HOTEL)
+        window = htmlgenerator.Window.of(('2018-11-15', '2019-01-31'))
+        pages = generator.render_hotel(rate_index, window, generator.template_environment())
+        html = ''.join(pages[0][1])
+        tables = json.loads(re.search(r'data-tables="(.*?)"', html).group(1).replace('&#34;', '"'))
+        assert tables == ['2018-11', '2018-12', '2019-01']
+        assert 'November 2018' in html and 'January 2019' in html and 'October 2018' not in html
+        assert [output_file for output_file, _ in pages[2:]] == \
+            ['rates/2018-11.json', 'rates/2018-12.json', 'rates/2019-01.json']
+        shard = json.loads(pages[2][1][0])
+        assert min(run[1] for run in shard['runs']) == 15
+        assert '2018-11-15 to 2019-01-31' in ''.join(pages[1][1])
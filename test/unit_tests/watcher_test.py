@@ -0,0 +1,51 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Tests for the polling watcher behind --watch.
+"""
+
+import os
+import sys
+
+# Fix for problems with PATH variable
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+import watcher
+
+
+class TestPoller(object):
+
+    def test_poll(self, tmpdir):
+        """ Modified, new and removed files are reported once each. """
+        first, second = tmpdir.join('a.xml'), tmpdir.join('b.xml')
+        first.write('<hotel/>')
+        second.write('<hotel/>')
+        poller = watcher.Poller(lambda: [str(path) for path in tmpdir.listdir()])
+        assert poller.poll() == (set(), set())
+
+        first.write('<hotel code="AAAAAA"/>')
+        second.remove()
+        tmpdir.join('c.xml').write('<hotel/>')
+        assert poller.poll() == ({str(first), str(tmpdir.join('c.xml'))}, {str(second)})
+        assert poller.poll() == (set(), set())
+
+    def test_changes_are_debounced(self, tmpdir):
+        """ Writes made within the debounce window come out as one batch. """
+        feed = tmpdir.join('rates.input.xml')
+        feed.write('<hotel>')
+        writes = ['<hotel><room/>', '<hotel><room/></hotel>']
+        sleeps = []
+
+        def sleep(seconds):
+            # Stands in for the feed being copied in over a few polls
+            sleeps.append(seconds)
+            if len(sleeps) == 1:
+                feed.write(writes.pop(0))
+            elif writes:
+                feed.write(writes.pop(0) + ' ' * len(sleeps))
+
+        poller = watcher.Poller(lambda: [str(feed)], interval=1.0, debounce=0.1, sleep=sleep)
+        batch = next(poller.changes())
+        assert batch == ([str(feed)], [])
+        assert sleeps == [1.0, 0.1, 0.1]